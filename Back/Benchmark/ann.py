@@ -0,0 +1,79 @@
+"""Recall and latency of the IVF index against exact item-factor similarities.
+
+    python -m Back.Benchmark.ann --version v20250101_120000 --nprobe 1 2 4 8 16 32 --k 20
+
+Recall@k is the share of the exact k most similar anime (cosine of the "svd"
+version's item factors) that the index also returns, averaged over sampled
+queries. Latency is per `rows()` call, the work one similar-anime query does.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from Back.Benchmark.run import percentiles
+from Back.Data import model_store
+from Back.Recommendator.scoring import top_indices
+from Back.Recommendator.similarity import FactorSimilarity, IVFSimilarity
+
+
+def _top_ids(ids, sims, k):
+    idx = top_indices(np.where(np.isnan(sims), -np.inf, sims), k)[0]
+    return np.broadcast_to(ids, sims.shape)[0, idx[idx >= 0]]
+
+
+def recall_curve(anime_ids, item_factors, ivf, nprobes=(1, 2, 4, 8, 16, 32), k: int = 20, queries: int = 200,
+                 candidates: int = 200, seed: int = 0):
+    """[{nprobe, recall, lists, latency_ms}, ...], starting with the exact scan."""
+    exact = FactorSimilarity(anime_ids, item_factors)
+    index = IVFSimilarity(anime_ids, item_factors, *ivf, candidates=candidates)
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(exact.anime_ids, min(queries, len(exact.anime_ids)), replace=False)
+
+    expected, samples = {}, []
+    for anime_id in query_ids:
+        start = time.perf_counter()
+        ids, sims = exact.rows([anime_id])
+        samples.append((time.perf_counter() - start) * 1000)
+        expected[anime_id] = _top_ids(ids, sims, k)
+    results = [{"nprobe": "exact", "recall": 1.0, "lists": len(index.centroids), "latency_ms": percentiles(samples)}]
+
+    for nprobe in nprobes:
+        samples, recalls = [], []
+        for anime_id in query_ids:
+            start = time.perf_counter()
+            ids, sims = index.rows([anime_id], nprobe)
+            samples.append((time.perf_counter() - start) * 1000)
+            found = _top_ids(ids, sims, k)
+            recalls.append(len(np.intersect1d(found, expected[anime_id])) / max(len(expected[anime_id]), 1))
+        results.append({"nprobe": nprobe, "recall": round(float(np.mean(recalls)), 4), "lists": len(index.centroids),
+                        "latency_ms": percentiles(samples)})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall/latency curve of a version's IVF index.")
+    parser.add_argument("--version", required=True, help="an svd engine version with an IVF index")
+    parser.add_argument("--model-dir", type=Path, default=model_store.MODEL_DIR)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--k", type=int, default=20, help="recall@k")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--candidates", type=int, default=200, help="items kept per query (ANN_CANDIDATES)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    artifact = model_store.open_model(args.version, args.model_dir)
+    if artifact is None or artifact.ivf is None:
+        parser.error(f"version {args.version} has no IVF index (train it with MODEL_ENGINE=svd)")
+    results = recall_curve(artifact.anime_ids, artifact.item_factors, artifact.ivf, args.nprobe, args.k,
+                           args.queries, args.candidates, args.seed)
+    print(json.dumps({"version": args.version, "num_anime": len(artifact.anime_ids), "k": args.k,
+                      "results": results}, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
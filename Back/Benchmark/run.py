@@ -0,0 +1,155 @@
+"""Training and serving benchmark on synthetic data.
+
+    python -m Back.Benchmark.run --ratings 1000000 --requests 500 --output bench.json
+
+Generates a Kaggle-shaped dataset, loads it into SQLite, points the DAOs at it via
+DATABASE_URL and a temporary MODEL_DIR, then times training, model load and request
+latency (p50/p95/p99). Results are printed, or written to --output, as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if len(samples) == 0:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"n": len(samples), "mean": round(float(samples.mean()), 3), "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3), "p99": round(float(p99), 3), "max": round(float(samples.max()), 3)}
+
+
+def timed(func, args_list):
+    """Latency in milliseconds of `func(*args)` for each entry of `args_list`."""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(n_ratings: int, n_requests: int, workers: int, seed: int, workdir: Path, engine: str = "correlation"):
+    from Back.Benchmark.synthetic import generate, load_sqlite
+
+    result = {"config": {"ratings": n_ratings, "requests": n_requests, "workers": workers, "seed": seed,
+                         "engine": engine}}
+
+    start = time.perf_counter()
+    anime, ratings = generate(n_ratings, seed)
+    generate_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    url = load_sqlite(workdir / "bench.db", anime, ratings)
+    result["dataset"] = {
+        "anime": len(anime), "users": int(ratings["user_id"].nunique()), "ratings": len(ratings),
+        "generate_seconds": round(generate_seconds, 3), "load_seconds": round(time.perf_counter() - start, 3),
+    }
+
+    # Modules build their DAOs and read MODEL_DIR at import, so configure before importing.
+    os.environ["DATABASE_URL"] = url
+    os.environ["MODEL_DIR"] = str(workdir / "models")
+    os.environ["MODEL_POINTER_PATH"] = str(workdir / "current_model.json")
+    os.environ.setdefault("MODEL_POLL_SECONDS", "3600")
+    from Back.Data import model_store
+    from Back.Recommendator import recommender
+    from Back.Recommendator.registry import ModelRegistry
+    from Back.Trainer.trainer import train_model
+
+    start = time.perf_counter()
+    meta = train_model(n_jobs=workers, engine=engine)
+    result["training"] = {"seconds": round(time.perf_counter() - start, 3), **meta}
+
+    registry = ModelRegistry(recommender.dao)
+    model = registry.refresh()
+    if meta["num_anime"] == 0:
+        result["model_load"] = {"skipped": "empty model, dataset too small for the training filters"}
+        return result
+    start = time.perf_counter()
+    snapshot = recommender.catalog.get()
+    search = snapshot.warm_search()
+    result["model_load"] = {
+        "seconds": round(model.load_seconds, 4),
+        "catalog_seconds": round(time.perf_counter() - start, 4),
+        **{k: v for k, v in registry.status().items()
+           if k in ("format", "engine", "index", "resident_bytes", "mapped_bytes")},
+    }
+    recommender.registry = registry
+
+    rng = np.random.default_rng(seed + 1)
+    anime_ids = rng.choice(np.asarray(model.similarity.anime_ids), n_requests)
+    user_ids = rng.choice(ratings["user_id"].unique(), n_requests)
+    names = rng.choice(anime["name"].to_numpy(), n_requests)
+    prefixes = [name[:max(3, len(name) // 2)] for name in names]
+    typos = [name[:2] + name[3:] if len(name) > 4 else name for name in names]
+
+    # First calls pay one-off costs (lazy index, page faults); keep them out of the percentiles.
+    recommender.get_similar_anime(int(anime_ids[0]))
+    recommender.get_user_recommendations(int(user_ids[0]))
+    result["latency_ms"] = {
+        "similar_anime": percentiles(timed(recommender.get_similar_anime, [(int(a),) for a in anime_ids])),
+        "user_recommendations": percentiles(timed(recommender.get_user_recommendations, [(int(u),) for u in user_ids])),
+        "user_watched": percentiles(timed(recommender.get_user_watched, [(int(u),) for u in user_ids])),
+        "search_prefix": percentiles(timed(search.search, [(q,) for q in prefixes])),
+        "search_fuzzy": percentiles(timed(search.search, [(q,) for q in typos])),
+    }
+    artifact = model_store.open_model(model.version)
+    if artifact.ivf is not None:
+        from Back.Benchmark.ann import recall_curve
+        result["ann_recall"] = recall_curve(artifact.anime_ids, artifact.item_factors, artifact.ivf,
+                                            queries=min(n_requests, len(artifact.anime_ids)), seed=seed)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark training and serving on synthetic data.")
+    parser.add_argument("--ratings", type=int, default=100_000, help="dataset size (10k to 10M)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per latency benchmark")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="training processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", default="correlation", choices=["correlation", "svd"])
+    parser.add_argument("--workdir", type=Path, help="keep the database and models here instead of a temp dir")
+    parser.add_argument("--output", type=Path, help="write the JSON result here instead of stdout")
+    args = parser.parse_args(argv)
+
+    header = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+    }
+    if args.workdir is not None:
+        args.workdir.mkdir(parents=True, exist_ok=True)
+        result = run(args.ratings, args.requests, args.workers, args.seed, args.workdir, args.engine)
+    else:
+        with tempfile.TemporaryDirectory(prefix="anime-bench-") as workdir:
+            result = run(args.ratings, args.requests, args.workers, args.seed, Path(workdir), args.engine)
+
+    report = json.dumps({**header, **result}, indent=2, default=str)
+    if args.output is not None:
+        args.output.write_text(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Synthetic data shaped like the Kaggle anime recommendations dataset.
+
+The Kaggle set has ~12.3k anime, ~73.5k users and ~7.8M ratings: user activity is
+heavy-tailed, anime popularity roughly Zipf-distributed, ~19% of rows are -1
+(watched, not rated) and explicit ratings cluster around 7-8.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from Back.Data import schema
+
+KAGGLE_ANIME = 12294
+RATINGS_PER_USER = 106
+RATINGS_PER_ANIME = 635
+UNRATED_SHARE = 0.19
+
+GENRES = [
+    "Action", "Adventure", "Cars", "Comedy", "Dementia", "Demons", "Drama", "Ecchi", "Fantasy", "Game",
+    "Harem", "Hentai", "Historical", "Horror", "Josei", "Kids", "Magic", "Martial Arts", "Mecha", "Military",
+    "Music", "Mystery", "Parody", "Police", "Psychological", "Romance", "Samurai", "School", "Sci-Fi", "Seinen",
+    "Shoujo", "Shoujo Ai", "Shounen", "Shounen Ai", "Slice of Life", "Space", "Sports", "Super Power",
+    "Supernatural", "Thriller", "Vampire", "Yaoi", "Yuri",
+]
+TYPES = ["TV", "OVA", "Movie", "Special", "ONA", "Music"]
+TYPE_SHARE = [0.31, 0.27, 0.19, 0.14, 0.05, 0.04]
+SYLLABLES = ["ka", "mi", "no", "ra", "shi", "to", "yu", "ki", "ha", "na", "ri", "ko", "sa", "me", "ta", "ro"]
+WORDS = ["Shippuuden", "Gintama", "Kimi", "Sekai", "Monogatari", "Academia", "Online", "Alchemist", "Hunter",
+         "Zero", "Season", "Movie", "Special", "Tales", "Dragon", "Sword", "Girls", "no", "wa", "to"]
+RATING_VALUES = np.arange(1, 11)
+RATING_SHARE = np.array([0.006, 0.006, 0.011, 0.027, 0.061, 0.124, 0.233, 0.257, 0.167, 0.108])
+
+
+def scale(n_ratings: int):
+    """(n_users, n_anime) for `n_ratings`, keeping the Kaggle ratios.
+
+    The catalog never drops below 500 titles so heavy users can pass the training
+    filter (200 ratings); below ~50k ratings no anime reaches 50 active raters and
+    training produces an empty model.
+    """
+    n_users = max(20, n_ratings // RATINGS_PER_USER)
+    n_anime = int(min(KAGGLE_ANIME, max(500, n_ratings // RATINGS_PER_ANIME)))
+    return n_users, n_anime
+
+
+def _title(rng):
+    base = "".join(rng.choice(SYLLABLES, rng.integers(2, 5))).capitalize()
+    extra = rng.choice(WORDS, rng.integers(0, 3))
+    return " ".join([base, *extra])
+
+
+def generate_anime(n_anime: int, rng) -> pd.DataFrame:
+    """Catalog rows; ~2% have no rating and ~0.5% no genre, like the source file."""
+    names = [_title(rng) for _ in range(n_anime)]
+    genres = [", ".join(sorted(rng.choice(GENRES, rng.integers(1, 7), replace=False))) for _ in range(n_anime)]
+    anime = pd.DataFrame({
+        "anime_id": rng.permutation(np.arange(1, 3 * n_anime + 1))[:n_anime],
+        "name": names,
+        "genre": genres,
+        "type": rng.choice(TYPES, n_anime, p=TYPE_SHARE),
+        "episodes": rng.integers(1, 60, n_anime).astype(str),
+        "rating": np.round(np.clip(rng.normal(6.5, 1.0, n_anime), 1.7, 10), 2),
+        "members": np.maximum(5, rng.lognormal(7.5, 2.0, n_anime)).astype(np.int64),
+    })
+    anime.loc[rng.random(n_anime) < 0.02, "rating"] = np.nan
+    anime.loc[rng.random(n_anime) < 0.005, "genre"] = None
+    return anime.sort_values("members", ascending=False, ignore_index=True)
+
+
+def generate_ratings(n_ratings: int, anime_ids, n_users: int, rng, rounds: int = 8) -> pd.DataFrame:
+    """About `n_ratings` unique (user, anime) rows.
+
+    Per-user counts are log-normal (capped at half the catalog) and each user's anime
+    are drawn Zipf-weighted over `anime_ids` in popularity order; duplicate draws are
+    dropped and the shortfall redrawn for a few rounds.
+    """
+    anime_ids = np.asarray(anime_ids)
+    counts = rng.lognormal(0, 1.0, n_users)
+    counts = np.clip(np.round(counts * n_ratings / counts.sum()), 1, max(1, len(anime_ids) // 2)).astype(np.int64)
+    popularity = 1.0 / np.arange(1, len(anime_ids) + 1) ** 0.8
+    popularity /= popularity.sum()
+
+    pairs = pd.DataFrame({"user_id": np.empty(0, np.int32), "anime_id": np.empty(0, np.int32)})
+    missing = counts
+    for _ in range(rounds):
+        users = np.repeat(np.arange(1, n_users + 1, dtype=np.int32), missing)
+        if len(users) == 0:
+            break
+        drawn = anime_ids[rng.choice(len(anime_ids), len(users), p=popularity)].astype(np.int32)
+        pairs = pd.concat([pairs, pd.DataFrame({"user_id": users, "anime_id": drawn})], ignore_index=True)
+        pairs = pairs.drop_duplicates(ignore_index=True)
+        have = np.bincount(pairs["user_id"].to_numpy(), minlength=n_users + 1)[1:]
+        missing = np.maximum(counts - have, 0)
+
+    pairs = pairs.sample(frac=1, random_state=int(rng.integers(2**31)), ignore_index=True)
+    rating = rng.choice(RATING_VALUES, len(pairs), p=RATING_SHARE / RATING_SHARE.sum()).astype(np.int8)
+    rating[rng.random(len(pairs)) < UNRATED_SHARE] = -1
+    pairs["rating"] = rating
+    return pairs
+
+
+def generate(n_ratings: int, seed: int = 0):
+    """(anime, ratings) DataFrames for a dataset of about `n_ratings` ratings."""
+    rng = np.random.default_rng(seed)
+    n_users, n_anime = scale(n_ratings)
+    anime = generate_anime(n_anime, rng)
+    ratings = generate_ratings(n_ratings, anime["anime_id"].to_numpy(), n_users, rng)
+    return anime, ratings
+
+
+def load_sqlite(path, anime: pd.DataFrame, ratings: pd.DataFrame, chunksize: int = 200_000):
+    """Writes the dataset into a fresh SQLite file with the application schema."""
+    engine = create_engine(f"sqlite:///{path}")
+    schema.metadata.drop_all(engine)
+    schema.ensure_schema(engine)
+    anime.to_sql("animes", engine, if_exists="append", index=False)
+    for start in range(0, len(ratings), chunksize):
+        ratings.iloc[start:start + chunksize].to_sql("ratings", engine, if_exists="append", index=False)
+    engine.dispose()
+    return f"sqlite:///{path}"
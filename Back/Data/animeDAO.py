@@ -1,27 +1,37 @@
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, text
 from datetime import datetime
 from dotenv import load_dotenv
 import os
 
+from Back.Data import schema
+from Back.Data.database import get_engine
+from Back.telemetry import span
+
 load_dotenv()
 
+RATINGS_CHUNK_SIZE = int(os.getenv("RATINGS_CHUNK_SIZE", "500000"))
+RATINGS_INSERT_BATCH_SIZE = int(os.getenv("RATINGS_INSERT_BATCH_SIZE", "5000"))
+# Kaggle ids fit in int32 and ratings are -1..10.
+RATING_DTYPES = {"id": np.int64, "user_id": np.int32, "anime_id": np.int32, "rating": np.int8}
+
 
 class AnimeDAO:
     """Data Access Object for the anime recommendation system (MySQL + SQLAlchemy)."""
 
-    def __init__(self):
-        host = os.getenv("DB_HOST", "localhost")
-        user = os.getenv("DB_USER", "root")
-        password = os.getenv("DB_PASSWORD", "")
-        database = os.getenv("DB_NAME", "anime_recommender")
-        port = os.getenv("DB_PORT", "3306")
+    def __init__(self, engine=None):
+        self.engine = engine if engine is not None else get_engine()
+        self._ratings_id = None
+        self._ids_monotonic = None
 
-        db_url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}?charset=utf8mb4"
-        self.engine = create_engine(db_url, echo=False, pool_pre_ping=True)
+    def ensure_schema(self):
+        """Creates missing tables/columns (ratings id, model_versions watermark and lifecycle columns)."""
+        schema.ensure_schema(self.engine)
 
     # ---------- Data Loading ----------
 
+    @span("dao.load_anime")
     def load_anime(self):
         query = text("SELECT * FROM animes;")
         anime = pd.read_sql(query, self.engine)
@@ -30,25 +40,268 @@ class AnimeDAO:
             anime.rename(columns={"id": "anime_id"}, inplace=True)
         return anime
 
-    def load_ratings(self):
-        query = text("SELECT * FROM ratings;")
-        ratings = pd.read_sql(query, self.engine)
+    @span("dao.load_ratings")
+    def load_ratings(self, max_id: int = None, user_id: int = None, rated_only: bool = False,
+                     user_ids=None, chunksize: int = RATINGS_CHUNK_SIZE):
+        """Ratings as one downcast DataFrame, built from streamed chunks.
+
+        Filters are pushed into SQL: `max_id` watermark, a single `user_id`,
+        a set of `user_ids`, and `rated_only` (drops rating = -1).
+        """
+        chunks = list(self.iter_ratings(max_id=max_id, user_id=user_id, rated_only=rated_only,
+                                        user_ids=user_ids, chunksize=chunksize))
+        if not chunks:
+            return self._normalize_ratings(pd.DataFrame(columns=["user_id", "anime_id", "rating"]))
+        return pd.concat(chunks, ignore_index=True)
+
+    def iter_ratings(self, max_id: int = None, user_id: int = None, rated_only: bool = False,
+                     user_ids=None, chunksize: int = RATINGS_CHUNK_SIZE):
+        """Streams ratings in downcast chunks through a server-side cursor.
+
+        With `max_id` the ratings are those of the table as of that watermark.
+        """
+        conditions, params = [], {}
+        if user_id is not None:
+            conditions.append("user_id = :u")
+            params["u"] = int(user_id)
+        if rated_only:
+            conditions.append("rating <> -1")
+        if user_ids is not None:
+            conditions.append("user_id IN :users")
+            params["users"] = [int(u) for u in user_ids]
+        if max_id is not None:
+            params["w"] = max_id
+            query = self._ratings_as_of(conditions)
+        else:
+            query = "SELECT * FROM ratings"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+        query = text(query + ";")
+        if user_ids is not None:
+            query = query.bindparams(bindparam("users", expanding=True))
+
+        with self.engine.connect().execution_options(stream_results=True) as conn:
+            for chunk in pd.read_sql(query, conn, params=params, chunksize=chunksize):
+                yield self._normalize_ratings(chunk)
+
+    @span("dao.load_user_watched")
+    def load_user_watched(self, user_id: int):
+        """A user's ratings joined with anime details, via the user_id index.
+
+        Columns match the old pandas merge: rating_x is the user's rating, rating_y the anime's.
+        """
+        query = text(
+            "SELECT r.user_id, r.anime_id, r.rating AS rating_x, a.name, a.genre, a.type, a.episodes, "
+            "a.rating AS rating_y, a.members "
+            "FROM ratings r LEFT JOIN animes a ON a.anime_id = r.anime_id "
+            "WHERE r.user_id = :u;"
+        )
+        watched = pd.read_sql(query, self.engine, params={"u": int(user_id)})
+        watched.columns = watched.columns.str.strip().str.lower()
+        return watched.astype({"user_id": np.int32, "anime_id": np.int32, "rating_x": np.int8}, copy=False)
+
+    @span("dao.load_active_users")
+    def load_active_users(self, min_ratings: int, max_id: int = None):
+        """Ids of users with at least `min_ratings` rows (rated or not), counted in SQL."""
+        source = f"({self._ratings_as_of()}) AS r" if max_id is not None else "ratings"
+        query = text(f"SELECT user_id FROM {source} GROUP BY user_id HAVING COUNT(*) >= :n;")
+        users = pd.read_sql(query, self.engine, params={"w": max_id, "n": min_ratings})
+        return users["user_id"].to_numpy(dtype=np.int32)
+
+    @span("dao.load_ratings_since")
+    def load_ratings_since(self, watermark: int, max_id: int):
+        """Ratings added after `watermark`, up to and including `max_id`."""
+        query = text(
+            f"SELECT {self._id_column()} AS id, user_id, anime_id, rating FROM ratings "
+            f"WHERE {self._id_column()} > :lo AND {self._id_column()} <= :hi;"
+        )
+        ratings = pd.read_sql(query, self.engine, params={"lo": watermark or 0, "hi": max_id})
+        return self._normalize_ratings(ratings)
+
+    @span("dao.load_ratings_for_users")
+    def load_ratings_for_users(self, user_ids, max_id: int, batch_size: int = 1000):
+        """Ratings of the given users as of the `max_id` watermark, with the id column."""
+        user_ids = [int(u) for u in user_ids]
+        frames = []
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            query = text(self._ratings_as_of(["user_id IN :users"]) + ";").bindparams(
+                bindparam("users", expanding=True))
+            frames.append(self._normalize_ratings(pd.read_sql(query, self.engine, params={"w": max_id, "users": batch})))
+        if not frames:
+            return self._normalize_ratings(pd.DataFrame(columns=["id", "user_id", "anime_id", "rating"]))
+        return pd.concat(frames, ignore_index=True)
+
+    # ---------- Rating Writes ----------
+
+    @span("dao.upsert_ratings")
+    def upsert_ratings(self, rows, batch_size: int = RATINGS_INSERT_BATCH_SIZE):
+        """Writes (user_id, anime_id, rating) rows in one transaction, one row per user and title.
+
+        A rating of a title the user already rated replaces the old row: it is deleted,
+        archived in replaced_ratings and the new one inserted with a fresh id, so the
+        change is past every earlier watermark. New rows go in with one executemany per
+        batch, which the MySQL driver sends as multi-row INSERTs. For repeated pairs in
+        `rows` the last one wins. Returns the written and the replaced rows as DataFrames.
+
+        Raises RuntimeError if the table's ids can be reused (see `schema.ratings_ids_monotonic`).
+        """
+        if self._ids_monotonic is None:
+            self._ids_monotonic = schema.ratings_ids_monotonic(self.engine)
+        if not self._ids_monotonic:
+            raise RuntimeError("ratings has no never-reused id column, run `python -m Back.Data.migrate ratings-id`")
+        latest = {(int(u), int(a)): int(r) for u, a, r in rows}
+        pairs = list(latest)
+        id_column = self._id_column()
+        insert = text("INSERT INTO ratings (user_id, anime_id, rating) VALUES (:u, :a, :r)")
+        replaced = []
+        with self.engine.begin() as conn:
+            for start in range(0, len(pairs), batch_size):
+                batch = pairs[start:start + batch_size]
+                in_pairs, params = self._pairs_clause(batch)
+                existing = conn.execute(text(
+                    f"SELECT {id_column}, user_id, anime_id, rating FROM ratings WHERE {in_pairs}"
+                ), params).fetchall()
+                if existing:
+                    conn.execute(text(f"DELETE FROM ratings WHERE {id_column} IN :ids").bindparams(
+                        bindparam("ids", expanding=True)), {"ids": [row[0] for row in existing]})
+                conn.execute(insert, [{"u": u, "a": a, "r": latest[u, a]} for u, a in batch])
+                if not existing:
+                    continue
+                in_pairs, params = self._pairs_clause([(row[1], row[2]) for row in existing])
+                new_ids = dict(((u, a), i) for i, u, a in conn.execute(text(
+                    f"SELECT {id_column}, user_id, anime_id FROM ratings WHERE {in_pairs}"
+                ), params))
+                archived = [{"i": i, "u": u, "a": a, "r": r, "b": new_ids[u, a]} for i, u, a, r in existing]
+                conn.execute(text("INSERT INTO replaced_ratings (id, user_id, anime_id, rating, replaced_by) "
+                                  "VALUES (:i, :u, :a, :r, :b)"), archived)
+                replaced += [(u, a, r) for _, u, a, r in existing]
+
+        written = pd.DataFrame([(u, a, latest[u, a]) for u, a in pairs], columns=["user_id", "anime_id", "rating"])
+        replaced = pd.DataFrame(replaced, columns=["user_id", "anime_id", "rating"])
+        return self._normalize_ratings(written), self._normalize_ratings(replaced)
+
+    def prune_replaced_ratings(self, watermark: int):
+        """Drops archived ratings replaced at or before `watermark`, which no version needs any more."""
+        with self.engine.begin() as conn:
+            result = conn.execute(text("DELETE FROM replaced_ratings WHERE replaced_by <= :w"), {"w": watermark})
+        return result.rowcount
+
+    @staticmethod
+    def _pairs_clause(pairs):
+        """`(user_id, anime_id) IN (...)` for a list of pairs, with its parameters."""
+        placeholders = ", ".join(f"(:u{i}, :a{i})" for i in range(len(pairs)))
+        params = {}
+        for i, (user_id, anime_id) in enumerate(pairs):
+            params[f"u{i}"], params[f"a{i}"] = int(user_id), int(anime_id)
+        return f"(user_id, anime_id) IN ({placeholders})", params
+
+    @span("dao.get_ratings_watermark")
+    def get_ratings_watermark(self):
+        """Highest ratings id currently stored (0 for an empty table)."""
+        with self.engine.connect() as conn:
+            value = conn.execute(text(f"SELECT MAX({self._id_column()}) FROM ratings")).scalar()
+        return int(value or 0)
+
+    @staticmethod
+    def _normalize_ratings(ratings):
         ratings.columns = ratings.columns.str.strip().str.lower()
         if "user_id" not in ratings.columns and "user" in ratings.columns:
             ratings.rename(columns={"user": "user_id"}, inplace=True)
-        return ratings
+        return ratings.astype({c: t for c, t in RATING_DTYPES.items() if c in ratings.columns}, copy=False)
+
+    def _ratings_as_of(self, conditions=()):
+        """SELECT of the ratings table as it was at watermark `:w`.
+
+        Rows with an id up to the watermark, plus archived rows that were still
+        current then (replaced by a later id). `conditions` apply to both parts.
+        """
+        where = "".join(f" AND {c}" for c in conditions)
+        id_column = self._id_column()
+        return (
+            f"SELECT {id_column} AS id, user_id, anime_id, rating FROM ratings WHERE {id_column} <= :w{where} "
+            f"UNION ALL SELECT id, user_id, anime_id, rating FROM replaced_ratings "
+            f"WHERE id <= :w AND replaced_by > :w{where}"
+        )
+
+    def _id_column(self):
+        if self._ratings_id is None:
+            self._ratings_id = schema.ratings_id_column(self.engine)
+        return self._ratings_id
+
+    @span("dao.load_rating_stats")
+    def load_rating_stats(self):
+        """Per-anime rating count and mean, aggregated in SQL instead of pandas."""
+        query = text(
+            "SELECT anime_id, COUNT(*) AS num_ratings, AVG(rating) AS avg_rating "
+            "FROM ratings GROUP BY anime_id;"
+        )
+        stats = pd.read_sql(query, self.engine)
+        stats.columns = stats.columns.str.strip().str.lower()
+        stats["avg_rating"] = stats["avg_rating"].astype(float)
+        return stats
 
     # ---------- Model Version Tracking ----------
 
-    def save_model_version(self, version: str):
+    @span("dao.save_model_version")
+    def save_model_version(self, version: str, ratings_watermark: int = None, size_bytes: int = None,
+                           checksum: str = None):
         with self.engine.begin() as conn:
             conn.execute(
-                text("INSERT INTO model_versions (version, created_at) VALUES (:v, :t)"),
-                {"v": version, "t": datetime.now()},
+                text("INSERT INTO model_versions (version, created_at, ratings_watermark, size_bytes, checksum) "
+                     "VALUES (:v, :t, :w, :s, :c)"),
+                {"v": version, "t": datetime.now(), "w": ratings_watermark, "s": size_bytes, "c": checksum},
             )
 
+    @span("dao.load_model_versions")
+    def load_model_versions(self):
+        """All version rows, most recently activated (promoted or created) first."""
+        query = text(
+            "SELECT version, created_at, promoted_at, ratings_watermark, size_bytes, checksum, pinned "
+            "FROM model_versions ORDER BY COALESCE(promoted_at, created_at) DESC, created_at DESC;"
+        )
+        versions = pd.read_sql(query, self.engine, parse_dates=["created_at", "promoted_at"])
+        versions["pinned"] = versions["pinned"].fillna(False).astype(bool)
+        return versions
+
+    def promote_model_version(self, version: str):
+        """Makes `version` the active one; returns False if there is no such row."""
+        with self.engine.begin() as conn:
+            result = conn.execute(text("UPDATE model_versions SET promoted_at = :t WHERE version = :v"),
+                                  {"v": version, "t": datetime.now()})
+        return result.rowcount > 0
+
+    def set_model_version_pinned(self, version: str, pinned: bool):
+        with self.engine.begin() as conn:
+            result = conn.execute(text("UPDATE model_versions SET pinned = :p WHERE version = :v"),
+                                  {"v": version, "p": bool(pinned)})
+        return result.rowcount > 0
+
+    def update_model_version_artifact(self, version: str, size_bytes: int, checksum: str):
+        with self.engine.begin() as conn:
+            conn.execute(text("UPDATE model_versions SET size_bytes = :s, checksum = :c WHERE version = :v"),
+                         {"v": version, "s": size_bytes, "c": checksum})
+
+    def delete_model_version(self, version: str):
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM model_versions WHERE version = :v"), {"v": version})
+
+    @span("dao.get_model_watermark")
+    def get_model_watermark(self, version: str):
+        """Ratings id watermark a version was trained up to, or None if unknown."""
+        with self.engine.connect() as conn:
+            value = conn.execute(
+                text("SELECT ratings_watermark FROM model_versions WHERE version = :v"), {"v": version}
+            ).scalar()
+        return None if value is None else int(value)
+
+    @span("dao.get_current_model_version")
     def get_current_model_version(self):
-        query = text("SELECT version FROM model_versions ORDER BY created_at DESC LIMIT 1;")
+        """The active version: the latest promoted or, failing that, created; "none" if there is none."""
+        query = text(
+            "SELECT version FROM model_versions "
+            "ORDER BY COALESCE(promoted_at, created_at) DESC, created_at DESC LIMIT 1;"
+        )
         result = pd.read_sql(query, self.engine)
         if result.empty:
             return "none"
@@ -65,4 +318,5 @@ class AnimeDAO:
     # ---------- Connection Management ----------
 
     def close(self):
+        """Closes the pooled connections; the engine is shared, so other DAOs reconnect on demand."""
         self.engine.dispose()
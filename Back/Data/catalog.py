@@ -0,0 +1,139 @@
+import copy
+import os
+import threading
+import time
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from Back.Data.genres import GenreFeatures
+from Back.Data.search import SearchIndex
+
+
+class CatalogSnapshot:
+    """Immutable anime catalog with per-anime lookups stored as arrays sorted by anime_id."""
+
+    def __init__(self, anime: pd.DataFrame, stats: pd.DataFrame):
+        self.anime = anime
+        self.stats = stats
+        self.built_at = time.time()
+
+        ids = np.union1d(anime["anime_id"].to_numpy(dtype=np.int64), stats["anime_id"].to_numpy(dtype=np.int64))
+        self.anime_ids = ids
+
+        self.num_ratings = np.full(len(ids), np.nan)
+        self.avg_rating = np.full(len(ids), np.nan)
+        pos = np.searchsorted(ids, stats["anime_id"].to_numpy(dtype=np.int64))
+        self.num_ratings[pos] = stats["num_ratings"].to_numpy(dtype=float)
+        self.avg_rating[pos] = stats["avg_rating"].to_numpy(dtype=float)
+
+        self.base_rating = np.full(len(ids), np.nan)
+        self.name = np.full(len(ids), None, dtype=object)
+        self.genre = np.full(len(ids), None, dtype=object)
+        pos = np.searchsorted(ids, anime["anime_id"].to_numpy(dtype=np.int64))
+        self.base_rating[pos] = pd.to_numeric(anime["rating"], errors="coerce").to_numpy(dtype=float)
+        self.name[pos] = anime["name"].to_numpy(dtype=object)
+        self.genre[pos] = anime["genre"].to_numpy(dtype=object)
+
+    def with_ratings(self, ratings: pd.DataFrame, replaced: pd.DataFrame = None) -> "CatalogSnapshot":
+        """Copy with new (anime_id, rating) rows folded into the per-anime count and mean.
+
+        `replaced` rows are the old ratings the new ones overwrote and are taken out
+        again. Lookups built so far (genres, search) are shared with the copy.
+        """
+        counts, sums = self._rating_totals(ratings)
+        if replaced is not None and len(replaced):
+            old_counts, old_sums = self._rating_totals(replaced)
+            counts, sums = counts - old_counts, sums - old_sums
+        changed = (counts != 0) | (sums != 0)
+
+        previous = np.nan_to_num(self.num_ratings)
+        total = previous + counts
+        snapshot = copy.copy(self)
+        snapshot.num_ratings = np.where(changed, np.where(total > 0, total, np.nan), self.num_ratings)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (np.nan_to_num(self.avg_rating) * previous + sums) / np.where(total > 0, total, np.nan)
+        snapshot.avg_rating = np.where(changed, mean, self.avg_rating)
+        return snapshot
+
+    def _rating_totals(self, ratings: pd.DataFrame):
+        """Per-position count and sum of (anime_id, rating) rows, ignoring unknown titles."""
+        anime_ids = ratings["anime_id"].to_numpy(dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.anime_ids, anime_ids), len(self.anime_ids) - 1)
+        known = self.anime_ids[pos] == anime_ids
+        counts = np.bincount(pos[known], minlength=len(self.anime_ids))
+        sums = np.bincount(pos[known], weights=ratings["rating"].to_numpy(dtype=float)[known],
+                           minlength=len(self.anime_ids))
+        return counts, sums
+
+    @cached_property
+    def genres(self) -> GenreFeatures:
+        """Genre features parsed from the catalog, for versions trained without them."""
+        return GenreFeatures.from_anime(self.anime)
+
+    @cached_property
+    def search(self) -> SearchIndex:
+        """Name search index, built on first use and kept for the snapshot's lifetime."""
+        return SearchIndex(self.anime)
+
+    def warm_search(self) -> SearchIndex:
+        """Builds the search index now instead of on the first search."""
+        return self.search
+
+    def positions(self, anime_ids):
+        """Array positions for `anime_ids`, -1 where the id is not in the catalog."""
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        pos = np.searchsorted(self.anime_ids, anime_ids)
+        pos[pos >= len(self.anime_ids)] = 0
+        found = self.anime_ids[pos] == anime_ids if len(self.anime_ids) else np.zeros(len(anime_ids), bool)
+        return np.where(found, pos, -1)
+
+    def position(self, anime_id):
+        return int(self.positions([anime_id])[0])
+
+    def take(self, values, pos, fill=np.nan):
+        """Gathers `values` at `pos`, using `fill` for missing (-1) positions."""
+        out = values[np.maximum(pos, 0)]
+        if out.dtype == object:
+            out = out.copy()
+            out[pos < 0] = fill
+            return out
+        return np.where(pos >= 0, out, fill)
+
+
+class CatalogCache:
+    """Builds the catalog snapshot once and serves it until invalidated or expired."""
+
+    def __init__(self, dao, ttl_seconds: float = None):
+        self._dao = dao
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("CATALOG_TTL_SECONDS", "3600"))
+        self._ttl_seconds = ttl_seconds
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - snapshot.built_at < self._ttl_seconds:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or time.time() - snapshot.built_at >= self._ttl_seconds:
+                snapshot = CatalogSnapshot(self._dao.load_anime(), self._dao.load_rating_stats())
+                self._snapshot = snapshot
+        return snapshot
+
+    def apply_ratings(self, ratings: pd.DataFrame, replaced: pd.DataFrame, written_at: float):
+        """Folds ratings written at `written_at`, and the ones they replaced, into the current snapshot's stats.
+
+        Snapshots built after that may already count them and are left as they are.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and len(snapshot.anime_ids) and snapshot.built_at < written_at:
+                self._snapshot = snapshot.with_ratings(ratings, replaced)
+
+    def invalidate(self):
+        """Drops the snapshot; the next `get` rebuilds it (new ratings, retraining)."""
+        self._snapshot = None
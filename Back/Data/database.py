@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, StaticPool
+
+load_dotenv()
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def database_url() -> str:
+    """DATABASE_URL if set (e.g. sqlite:///bench.db), otherwise MySQL from the DB_* settings."""
+    url = os.getenv("DATABASE_URL")
+    if url:
+        return url
+    host = os.getenv("DB_HOST", "localhost")
+    user = os.getenv("DB_USER", "root")
+    password = os.getenv("DB_PASSWORD", "")
+    database = os.getenv("DB_NAME", "anime_recommender")
+    port = os.getenv("DB_PORT", "3306")
+    return f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}?charset=utf8mb4"
+
+
+class PoolMetrics:
+    """Checkout counts and time spent waiting for a pooled connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def to_dict(self):
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+
+
+metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (including connects)."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        metrics.record(time.perf_counter() - start)
+        return connection
+
+
+_engine = None
+_lock = threading.Lock()
+
+
+def _create_engine(url: str):
+    if url.startswith("sqlite"):
+        # One connection shared across threads for in-memory databases, a small pool for files.
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            return create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        return create_engine(url, connect_args={"check_same_thread": False}, poolclass=InstrumentedQueuePool,
+                             pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+    return create_engine(
+        url,
+        echo=False,
+        poolclass=InstrumentedQueuePool,
+        pool_pre_ping=True,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_recycle=POOL_RECYCLE,
+        pool_timeout=POOL_TIMEOUT,
+    )
+
+
+def get_engine():
+    """The process-wide engine; every DAO shares its connection pool."""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = _create_engine(database_url())
+    return _engine
+
+
+def dispose_engine():
+    """Closes pooled connections (shutdown, after fork).
+
+    The engine itself is kept: DAOs hold a reference to it, and a disposed engine
+    starts a new pool and reconnects on its next use.
+    """
+    with _lock:
+        if _engine is not None:
+            _engine.dispose()
+
+
+def pool_status():
+    engine = get_engine()
+    pool = engine.pool
+    status = {"backend": engine.dialect.name, "pool": type(pool).__name__, **metrics.to_dict()}
+    if isinstance(pool, QueuePool):
+        status.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow(),
+                      max_overflow=MAX_OVERFLOW, timeout_seconds=POOL_TIMEOUT)
+    return status
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+
+def split_genres(genre):
+    if pd.isna(genre):
+        return None
+    return frozenset(genre.split(", "))
+
+
+class GenreFeatures:
+    """Bit-packed multi-hot genre rows, one per anime, sorted by anime_id.
+
+    Row i has bit j set when `anime_ids[i]` has genre `vocab[j]`; an anime without
+    genres has an all-zero row. Jaccard is popcount(a & b) / popcount(a | b).
+    """
+
+    def __init__(self, anime_ids, vocab, bits):
+        self.anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        self.vocab = list(vocab)
+        self.bits = np.asarray(bits, dtype=np.uint8)
+        self.counts = np.bitwise_count(self.bits).sum(axis=1, dtype=np.int32)
+
+    @classmethod
+    def from_anime(cls, anime: pd.DataFrame):
+        """Builds the features from the `anime_id`/`genre` columns of the catalog."""
+        anime = anime.drop_duplicates("anime_id").sort_values("anime_id")
+        genre_sets = [split_genres(g) for g in anime["genre"]]
+        vocab = sorted({g for genres in genre_sets if genres for g in genres})
+        column = {g: i for i, g in enumerate(vocab)}
+        multi_hot = np.zeros((len(genre_sets), len(vocab)), dtype=bool)
+        for i, genres in enumerate(genre_sets):
+            if genres:
+                multi_hot[i, [column[g] for g in genres]] = True
+        return cls(anime["anime_id"].to_numpy(), vocab, np.packbits(multi_hot, axis=1))
+
+    def __len__(self):
+        return len(self.anime_ids)
+
+    @property
+    def nbytes(self):
+        return int(self.anime_ids.nbytes + self.bits.nbytes)
+
+    def positions(self, anime_ids):
+        """Row positions for `anime_ids`, -1 where the id has no row."""
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        if len(self.anime_ids) == 0:
+            return np.full(anime_ids.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(self.anime_ids, anime_ids)
+        pos[pos >= len(self.anime_ids)] = 0
+        return np.where(self.anime_ids[pos] == anime_ids, pos, -1)
+
+    def jaccard(self, base_pos, cand_pos):
+        """Genre Jaccard of each base row against its candidates.
+
+        `base_pos` has shape (R,), `cand_pos` (R, C) or (1, C) shared by all rows;
+        missing (-1) or genre-less anime score 0.
+        """
+        base_pos = np.asarray(base_pos)
+        cand_pos = np.asarray(cand_pos)
+        base_bits = self.bits[np.maximum(base_pos, 0)]
+        cand_bits = self.bits[np.maximum(cand_pos, 0)]
+        inter = np.bitwise_count(base_bits[:, None, :] & cand_bits).sum(axis=2, dtype=np.int32)
+        base_count = np.where(base_pos >= 0, self.counts[np.maximum(base_pos, 0)], 0)
+        cand_count = np.where(cand_pos >= 0, self.counts[np.maximum(cand_pos, 0)], 0)
+        union = base_count[:, None] + cand_count - inter
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where((base_count[:, None] > 0) & (cand_count > 0) & (union > 0), inter / union, 0.0)
@@ -0,0 +1,99 @@
+"""Schema migrations that rewrite the ratings table, run by hand instead of at API startup.
+
+    python -m Back.Data.migrate ratings-id
+    python -m Back.Data.migrate dedupe-ratings
+
+Run ``ratings-id`` first: deduplication keeps the rating with the highest id.
+"""
+import argparse
+import json
+
+from sqlalchemy import inspect, text
+
+from Back.Data import schema
+
+
+def add_ratings_id(engine):
+    """Gives ratings a monotonic id column that never reuses the id of a deleted row.
+
+    MySQL adds the AUTO_INCREMENT column in place. SQLite cannot alter a primary key,
+    so the table is copied into a new AUTOINCREMENT one, keeping the old rowids as ids
+    so recorded watermarks stay valid. Both rebuild the table; run it in a maintenance window.
+    """
+    if schema.ratings_ids_monotonic(engine):
+        return {"ratings_id": "present"}
+    if engine.dialect.name == "mysql":
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE ratings ADD COLUMN id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY FIRST"))
+        return {"ratings_id": "added"}
+
+    id_column = schema.ratings_id_column(engine)
+    indexes = [i["name"] for i in inspect(engine).get_indexes("ratings")]
+    with engine.begin() as conn:
+        for name in indexes:
+            conn.execute(text(f"DROP INDEX {name}"))
+        conn.execute(text("ALTER TABLE ratings RENAME TO ratings_legacy"))
+        conn.execute(text("CREATE TABLE ratings (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+                          "anime_id INTEGER NOT NULL, rating INTEGER NOT NULL)"))
+        copied = conn.execute(text(f"INSERT INTO ratings (id, user_id, anime_id, rating) "
+                                   f"SELECT {id_column}, user_id, anime_id, rating FROM ratings_legacy "
+                                   f"ORDER BY {id_column}")).rowcount
+        conn.execute(text("DROP TABLE ratings_legacy"))
+        # The unique index may not hold yet; dedupe_ratings creates it.
+        for index in schema.ratings.indexes:
+            if index.name != schema.UNIQUE_RATINGS_INDEX:
+                index.create(conn)
+    return {"ratings_id": "rebuilt", "rows": copied}
+
+
+def dedupe_ratings(engine):
+    """Keeps the newest rating of each (user_id, anime_id) and adds the unique index.
+
+    The older rows are archived in replaced_ratings, replaced by the kept one, rather
+    than deleted outright. Versions trained before counted every row; retrain them.
+    """
+    if not schema.ratings_ids_monotonic(engine):
+        raise ValueError("ratings has no id column yet, run `ratings-id` first")
+    schema.replaced_ratings.create(engine, checkfirst=True)
+    duplicates = (
+        "SELECT r.id, r.user_id, r.anime_id, r.rating, k.keep FROM ratings r JOIN "
+        "(SELECT user_id, anime_id, MAX(id) AS keep FROM ratings GROUP BY user_id, anime_id HAVING COUNT(*) > 1) k "
+        "ON r.user_id = k.user_id AND r.anime_id = k.anime_id WHERE r.id < k.keep"
+    )
+    with engine.begin() as conn:
+        archived = conn.execute(text(
+            f"INSERT INTO replaced_ratings (id, user_id, anime_id, rating, replaced_by) {duplicates}"
+        )).rowcount
+        if archived:
+            conn.execute(text("DELETE FROM ratings WHERE id IN (SELECT id FROM replaced_ratings)"))
+
+    indexes = {i["name"] for i in inspect(engine).get_indexes("ratings")}
+    if schema.UNIQUE_RATINGS_INDEX not in indexes:
+        next(i for i in schema.ratings.indexes if i.name == schema.UNIQUE_RATINGS_INDEX).create(engine)
+    # Superseded by the unique index, which serves the same (user_id, anime_id) lookups.
+    if "idx_ratings_user" in indexes:
+        on_table = " ON ratings" if engine.dialect.name == "mysql" else ""
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP INDEX idx_ratings_user{on_table}"))
+    return {"archived_duplicates": archived, "unique_index": True}
+
+
+def main(argv=None):
+    from Back.Data.database import get_engine
+
+    parser = argparse.ArgumentParser(description="Migrations that rewrite the ratings table")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("ratings-id", help="Add the ratings id column (watermark for incremental training)")
+    sub.add_parser("dedupe-ratings", help="Archive all but the newest rating per user and title, add the unique index")
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+    if args.command == "ratings-id":
+        result = add_ratings_id(engine)
+    else:
+        result = dedupe_ratings(engine)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""On-disk model artifacts.
+
+Format 1 stores each version in its own directory under ``MODEL_DIR``:
+
+    {version}/manifest.json      format, engine, dtype, shape and training meta
+    {version}/anime_ids.npy      int32, sorted, row/column order of the matrix
+    {version}/similarity.npy     float32 (or float16) anime x anime correlations
+    {version}/neighbor_ids.npy   int32 top-K neighbor ids per anime (optional)
+    {version}/neighbor_sims.npy  float32 top-K similarities (optional)
+    {version}/genre_anime_ids.npy  int32 anime with genre rows, sorted (optional)
+    {version}/genre_bits.npy     uint8 bit-packed multi-hot genres, vocabulary in the manifest (optional)
+    {version}/statistics/        per-pair count/sum/sumsq/cross for incremental updates (optional;
+                                 incremental versions hard-link the base arrays and add sparse delta_*.npz)
+    {version}/recommendations/   precomputed per-user top-N, CSR by user (optional, written after publish)
+
+The manifest's ``engine`` says which arrays a version has. "correlation" (the
+default, and all versions written before the field existed) is the layout
+above; "svd" replaces similarity.npy and the neighbor index with low-rank factors:
+
+    {version}/item_factors.npy   float32 anime x k, rows in anime_ids order
+    {version}/user_ids.npy       int32, sorted, row order of user_factors
+    {version}/user_factors.npy   float32 users x k
+    {version}/ivf_centroids.npy  float32 lists x k, IVF index over the item factors (optional)
+    {version}/ivf_offsets.npy    int64 CSR offsets of each list into ivf_items (optional)
+    {version}/ivf_items.npy      int32 item positions grouped by list (optional)
+
+Arrays are opened with ``mmap_mode="r"`` so every worker process shares the
+same pages through the OS cache. Versions trained before this format
+(``anime_corr_matrix_{version}.pkl`` + meta pickle) are still readable and can
+be converted with ``python -m Back.Data.model_store convert <version>``.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from Back.Data.genres import GenreFeatures
+
+MODEL_DIR = Path(os.getenv("MODEL_DIR", "Back/Model"))
+FORMAT_VERSION = 1
+DTYPE = os.getenv("MODEL_DTYPE", "float32")
+ENGINES = ("correlation", "svd")
+
+
+class ModelArtifact:
+    """Arrays of one model version; `similarity`, `neighbor_*` and the factors may be memory-mapped."""
+
+    def __init__(self, version, anime_ids, similarity=None, neighbor_ids=None, neighbor_sims=None,
+                 meta=None, format_version=FORMAT_VERSION, genres=None, engine="correlation",
+                 item_factors=None, user_ids=None, user_factors=None, ivf=None):
+        self.version = version
+        self.anime_ids = anime_ids
+        self.similarity = similarity
+        self.neighbor_ids = neighbor_ids
+        self.neighbor_sims = neighbor_sims
+        self.meta = meta or {}
+        self.format_version = format_version
+        self.genres = genres
+        self.engine = engine
+        self.item_factors = item_factors
+        self.user_ids = user_ids
+        self.user_factors = user_factors
+        # (centroids, offsets, items) of the item-factor IVF index, if built.
+        self.ivf = ivf
+
+
+def version_dir(version: str, model_dir: Path = MODEL_DIR) -> Path:
+    return Path(model_dir) / version
+
+
+def _legacy_paths(version, model_dir):
+    model_dir = Path(model_dir)
+    return (
+        model_dir / f"anime_corr_matrix_{version}.pkl",
+        model_dir / f"anime_corr_meta_{version}.pkl",
+        model_dir / f"anime_topk_{version}.npz",
+    )
+
+
+def exists(version: str, model_dir: Path = MODEL_DIR) -> bool:
+    return (version_dir(version, model_dir) / "manifest.json").exists() or _legacy_paths(version, model_dir)[0].exists()
+
+
+def artifact_files(version: str, model_dir: Path = MODEL_DIR):
+    """Files that make up a version, sorted: its directory (without the rebuildable
+    `recommendations/`) or, for pickled versions, the pickles."""
+    directory = version_dir(version, model_dir)
+    if directory.is_dir():
+        return sorted(p for p in directory.rglob("*")
+                      if p.is_file() and "recommendations" not in p.relative_to(directory).parts)
+    return [p for p in _legacy_paths(version, model_dir) if p.exists()]
+
+
+def artifact_info(version: str, model_dir: Path = MODEL_DIR, block_size: int = 1 << 20):
+    """(size in bytes, SHA-256 hex digest) of a version's artifact files, paths included."""
+    digest = hashlib.sha256()
+    size = 0
+    root = Path(model_dir)
+    for path in artifact_files(version, model_dir):
+        digest.update(path.relative_to(root).as_posix().encode() + b"\0")
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+                size += len(block)
+    return size, digest.hexdigest()
+
+
+def disk_bytes(version: str, model_dir: Path = MODEL_DIR) -> int:
+    """Bytes a version occupies on disk, precomputed recommendations included."""
+    directory = version_dir(version, model_dir)
+    files = directory.rglob("*") if directory.is_dir() else _legacy_paths(version, model_dir)
+    return sum(p.stat().st_size for p in files if p.is_file())
+
+
+def delete_version(version: str, model_dir: Path = MODEL_DIR):
+    """Removes every file of a version, in either format; returns the bytes freed."""
+    freed = disk_bytes(version, model_dir)
+    directory = version_dir(version, model_dir)
+    if directory.is_dir():
+        shutil.rmtree(directory)
+    for path in _legacy_paths(version, model_dir):
+        path.unlink(missing_ok=True)
+    return freed
+
+
+def _staging(version: str, model_dir: Path) -> Path:
+    tmp = version_dir(version, model_dir).with_name(version + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    return tmp
+
+
+def _publish(tmp: Path, version: str, manifest: dict, genres: GenreFeatures, model_dir: Path) -> Path:
+    """Adds the genre rows and manifest to a staged version and renames it into place."""
+    if genres is not None:
+        np.save(tmp / "genre_anime_ids.npy", np.asarray(genres.anime_ids, dtype=np.int32))
+        np.save(tmp / "genre_bits.npy", genres.bits)
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now().isoformat(),
+        **manifest,
+        "genre_vocab": genres.vocab if genres is not None else None,
+    }
+    with open(tmp / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    target = version_dir(version, model_dir)
+    shutil.rmtree(target, ignore_errors=True)
+    tmp.rename(target)
+    return target
+
+
+def write_model(version: str, anime_ids, similarity, neighbor_ids=None, neighbor_sims=None, meta=None,
+                dtype: str = DTYPE, model_dir: Path = MODEL_DIR, statistics_dir: Path = None,
+                genres: GenreFeatures = None) -> Path:
+    """Writes a format-1 version directory; readers never see a half-written version.
+
+    `statistics_dir`, if given, is moved into the version as `statistics/`.
+    """
+    tmp = _staging(version, model_dir)
+    np.save(tmp / "anime_ids.npy", np.asarray(anime_ids, dtype=np.int32))
+    np.save(tmp / "similarity.npy", np.asarray(similarity, dtype=dtype))
+    if neighbor_ids is not None:
+        np.save(tmp / "neighbor_ids.npy", np.asarray(neighbor_ids, dtype=np.int32))
+        np.save(tmp / "neighbor_sims.npy", np.asarray(neighbor_sims, dtype=np.float32))
+    if statistics_dir is not None:
+        shutil.move(str(statistics_dir), str(tmp / "statistics"))
+    return _publish(tmp, version, {
+        "engine": "correlation",
+        "dtype": dtype,
+        "num_anime": int(len(anime_ids)),
+        "top_k": int(neighbor_ids.shape[1]) if neighbor_ids is not None else None,
+        "meta": meta or {},
+    }, genres, model_dir)
+
+
+def write_factors(version: str, anime_ids, item_factors, user_ids, user_factors, meta=None,
+                  model_dir: Path = MODEL_DIR, genres: GenreFeatures = None, ivf=None) -> Path:
+    """Writes an "svd" engine version: item and user factors instead of an anime x anime matrix.
+
+    `ivf`, if given, is the (centroids, offsets, items) index from `Back.Trainer.ivf.build_ivf`.
+    """
+    tmp = _staging(version, model_dir)
+    np.save(tmp / "anime_ids.npy", np.asarray(anime_ids, dtype=np.int32))
+    np.save(tmp / "item_factors.npy", np.asarray(item_factors, dtype=np.float32))
+    np.save(tmp / "user_ids.npy", np.asarray(user_ids, dtype=np.int32))
+    np.save(tmp / "user_factors.npy", np.asarray(user_factors, dtype=np.float32))
+    if ivf is not None:
+        centroids, offsets, items = ivf
+        np.save(tmp / "ivf_centroids.npy", np.asarray(centroids, dtype=np.float32))
+        np.save(tmp / "ivf_offsets.npy", np.asarray(offsets, dtype=np.int64))
+        np.save(tmp / "ivf_items.npy", np.asarray(items, dtype=np.int32))
+    return _publish(tmp, version, {
+        "engine": "svd",
+        "dtype": "float32",
+        "num_anime": int(len(anime_ids)),
+        "num_users": int(len(user_ids)),
+        "factors": int(np.shape(item_factors)[1]),
+        "ivf_lists": int(len(ivf[0])) if ivf is not None else None,
+        "meta": meta or {},
+    }, genres, model_dir)
+
+
+RECOMMENDATION_ARRAYS = {"user_ids": np.int32, "offsets": np.int64, "anime_ids": np.int32, "scores": np.float32}
+
+
+def write_recommendations(version: str, arrays: dict, meta: dict, model_dir: Path = MODEL_DIR) -> Path:
+    """Stores a version's precomputed user recommendations; replaces any previous set atomically."""
+    target = version_dir(version, model_dir) / "recommendations"
+    tmp = target.with_name("recommendations.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, dtype in RECOMMENDATION_ARRAYS.items():
+        np.save(tmp / f"{name}.npy", np.asarray(arrays[name], dtype=dtype))
+    with open(tmp / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({"version": version, "created_at": datetime.now().isoformat(), **meta}, f, indent=2)
+    shutil.rmtree(target, ignore_errors=True)
+    tmp.rename(target)
+    return target
+
+
+def open_recommendations(version: str, model_dir: Path = MODEL_DIR):
+    """(arrays, manifest) of a version's precomputed recommendations, or None if there are none."""
+    directory = version_dir(version, model_dir) / "recommendations"
+    if not (directory / "manifest.json").exists():
+        return None
+    with open(directory / "manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in RECOMMENDATION_ARRAYS}, manifest
+
+
+def statistics_dir(version: str, model_dir: Path = MODEL_DIR):
+    """Directory of a version's pair statistics, or None if it was trained without them."""
+    directory = version_dir(version, model_dir) / "statistics"
+    return directory if directory.exists() else None
+
+
+def open_model(version: str, model_dir: Path = MODEL_DIR, load_similarity: bool = True):
+    """Opens a version in either format, or returns None when it has no artifacts."""
+    directory = version_dir(version, model_dir)
+    manifest_path = directory / "manifest.json"
+    if manifest_path.exists():
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        engine = manifest.get("engine", "correlation")
+        neighbor_ids = neighbor_sims = None
+        if (directory / "neighbor_ids.npy").exists():
+            neighbor_ids = np.load(directory / "neighbor_ids.npy", mmap_mode="r")
+            neighbor_sims = np.load(directory / "neighbor_sims.npy", mmap_mode="r")
+        similarity = item_factors = user_ids = user_factors = ivf = None
+        if engine == "svd":
+            item_factors = np.load(directory / "item_factors.npy", mmap_mode="r")
+            user_ids = np.load(directory / "user_ids.npy")
+            user_factors = np.load(directory / "user_factors.npy", mmap_mode="r")
+            if (directory / "ivf_centroids.npy").exists():
+                ivf = tuple(np.load(directory / f"ivf_{name}.npy") for name in ("centroids", "offsets", "items"))
+        elif load_similarity:
+            similarity = np.load(directory / "similarity.npy", mmap_mode="r")
+        genres = None
+        if (directory / "genre_bits.npy").exists():
+            genres = GenreFeatures(np.load(directory / "genre_anime_ids.npy"), manifest["genre_vocab"],
+                                   np.load(directory / "genre_bits.npy"))
+        return ModelArtifact(
+            version,
+            np.load(directory / "anime_ids.npy"),
+            similarity,
+            neighbor_ids,
+            neighbor_sims,
+            manifest.get("meta"),
+            manifest["format"],
+            genres,
+            engine,
+            item_factors,
+            user_ids,
+            user_factors,
+            ivf,
+        )
+    return _open_legacy(version, model_dir)
+
+
+def _open_legacy(version, model_dir):
+    corr_path, meta_path, topk_path = _legacy_paths(version, model_dir)
+    if not corr_path.exists():
+        return None
+    with open(corr_path, "rb") as f:
+        corr = pickle.load(f)
+    meta = {}
+    if meta_path.exists():
+        with open(meta_path, "rb") as f:
+            meta = pickle.load(f)
+    neighbor_ids = neighbor_sims = None
+    if topk_path.exists():
+        with np.load(topk_path) as data:
+            neighbor_ids, neighbor_sims = data["neighbor_ids"], data["similarities"]
+    return ModelArtifact(
+        version,
+        corr.columns.to_numpy(),
+        corr.to_numpy(),
+        neighbor_ids,
+        neighbor_sims,
+        meta,
+        format_version=0,
+    )
+
+
+def convert_legacy(version: str, dtype: str = DTYPE, model_dir: Path = MODEL_DIR) -> Path:
+    """Rewrites a pickled version in format 1; the pickles are left in place."""
+    artifact = _open_legacy(version, model_dir)
+    if artifact is None:
+        raise FileNotFoundError(f"No pickled model found for version {version}")
+    order = np.argsort(artifact.anime_ids)
+    similarity = artifact.similarity[np.ix_(order, order)]
+    neighbor_ids, neighbor_sims = artifact.neighbor_ids, artifact.neighbor_sims
+    if neighbor_ids is None:
+        import pandas as pd
+        from Back.Trainer.neighbors import build_neighbor_index
+        index = pd.Index(artifact.anime_ids[order], name="anime_id")
+        top_k = int(os.getenv("MODEL_TOPK", "200"))
+        _, neighbor_ids, neighbor_sims = build_neighbor_index(pd.DataFrame(similarity, index=index, columns=index), top_k)
+    else:
+        neighbor_ids, neighbor_sims = neighbor_ids[order], neighbor_sims[order]
+    return write_model(version, artifact.anime_ids[order], similarity, neighbor_ids, neighbor_sims,
+                       artifact.meta, dtype, model_dir)
+
+
+def legacy_versions(model_dir: Path = MODEL_DIR):
+    prefix = "anime_corr_matrix_"
+    return sorted(p.stem[len(prefix):] for p in Path(model_dir).glob(f"{prefix}*.pkl"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Model artifact utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="Convert pickled versions to the memory-mapped format")
+    convert.add_argument("versions", nargs="*", help="Versions to convert (default: all pickled versions)")
+    convert.add_argument("--dtype", default=DTYPE, choices=["float32", "float16"])
+    convert.add_argument("--model-dir", default=str(MODEL_DIR))
+    args = parser.parse_args(argv)
+
+    model_dir = Path(args.model_dir)
+    for version in args.versions or legacy_versions(model_dir):
+        path = convert_legacy(version, args.dtype, model_dir)
+        print(f"Converted {version} → {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from Back.telemetry import span
+
+RATINGS_FLUSH_SECONDS = float(os.getenv("RATINGS_FLUSH_SECONDS", "1"))
+RATINGS_FLUSH_ROWS = int(os.getenv("RATINGS_FLUSH_ROWS", "5000"))
+RATINGS_MAX_PENDING = int(os.getenv("RATINGS_MAX_PENDING", "200000"))
+# Kaggle convention: -1 is "watched, not rated", otherwise a score from 1 to 10.
+RATING_VALUES = (-1,) + tuple(range(1, 11))
+
+
+def invalid_ratings(user_ids, anime_ids, ratings, known_anime_ids):
+    """Positions of rows with a non-positive user id, an unknown anime or an out-of-range rating.
+
+    `known_anime_ids` must be sorted (the catalog's `anime_ids`).
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    anime_ids = np.asarray(anime_ids, dtype=np.int64)
+    ratings = np.asarray(ratings, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(known_anime_ids, anime_ids), max(len(known_anime_ids) - 1, 0))
+    known = known_anime_ids[pos] == anime_ids if len(known_anime_ids) else np.zeros(len(anime_ids), bool)
+    valid = (user_ids > 0) & known & np.isin(ratings, RATING_VALUES)
+    return np.flatnonzero(~valid)
+
+
+class RatingWriter:
+    """Buffers rating writes and inserts them in batches from a background thread.
+
+    Rows are flushed every `flush_seconds`, or as soon as `flush_rows` are pending;
+    with `flush_seconds` <= 0 every `submit` writes through. Rows are upserted, so a
+    user re-rating a title replaces the old rating. After each successful write
+    `on_flush(ratings, replaced, started_at)` receives the written and the replaced
+    rows as DataFrames (user_id, anime_id, rating) and the time the write began. A
+    failed write keeps its rows at the front of the buffer and is retried on the next flush.
+    """
+
+    def __init__(self, dao, on_flush=None, flush_seconds: float = RATINGS_FLUSH_SECONDS,
+                 flush_rows: int = RATINGS_FLUSH_ROWS, max_pending: int = RATINGS_MAX_PENDING):
+        self._dao = dao
+        self._on_flush = on_flush
+        self.flush_seconds = flush_seconds
+        self.flush_rows = flush_rows
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.accepted = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_flush_at = None
+
+    def start(self):
+        if self.flush_seconds > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="rating-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the flush thread and writes whatever is still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def submit(self, rows):
+        """Queues (user_id, anime_id, rating) rows; returns the number pending.
+
+        Raises BufferError when the buffer is full (the database is down or slower
+        than the ingest rate), so callers can push back instead of queueing without bound.
+        """
+        rows = list(rows)
+        with self._lock:
+            if len(self._pending) + len(rows) > self.max_pending:
+                raise BufferError(f"{len(self._pending)} ratings already waiting to be written")
+            self._pending.extend(rows)
+            self.accepted += len(rows)
+            pending = len(self._pending)
+        if self.flush_seconds <= 0:
+            self.flush()
+        elif pending >= self.flush_rows:
+            self._wake.set()
+        return pending
+
+    def flush(self):
+        """Writes the pending rows now; returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            started_at = time.time()
+            try:
+                with span("ratings.flush"):
+                    written, replaced = self._dao.upsert_ratings(rows)
+            except Exception as e:
+                traceback.print_exc()
+                with self._lock:
+                    self._pending[:0] = rows
+                self.failures += 1
+                self.last_error = str(e)
+                return 0
+            self.written += len(written)
+            self.flushes += 1
+            self.last_error = None
+            self.last_flush_at = time.time()
+
+        if self._on_flush is not None:
+            try:
+                self._on_flush(written, replaced, started_at)
+            except Exception:
+                traceback.print_exc()
+        return len(written)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def status(self):
+        return {
+            "pending": len(self._pending),
+            "accepted": self.accepted,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_flush_at": self.last_flush_at,
+            "flush_seconds": self.flush_seconds,
+            "flush_rows": self.flush_rows,
+            "max_pending": self.max_pending,
+        }
@@ -0,0 +1,128 @@
+import warnings
+
+from sqlalchemy import (
+    BigInteger, Boolean, Column, DateTime, Float, Index, Integer, MetaData, String, Table, Text, inspect, text,
+)
+
+metadata = MetaData()
+# Created by `python -m Back.Data.migrate dedupe-ratings` on tables that predate it.
+UNIQUE_RATINGS_INDEX = "uq_ratings_user_anime"
+
+animes = Table(
+    "animes", metadata,
+    Column("anime_id", Integer, primary_key=True, autoincrement=False),
+    Column("name", Text),
+    Column("genre", Text),
+    Column("type", String(32)),
+    Column("episodes", String(16)),
+    Column("rating", Float),
+    Column("members", Integer),
+)
+
+ratings = Table(
+    "ratings", metadata,
+    # Monotonic id, used as the watermark for incremental training.
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("user_id", Integer, nullable=False),
+    Column("anime_id", Integer, nullable=False),
+    Column("rating", Integer, nullable=False),
+    # One rating per user and title; re-rating replaces the row (see replaced_ratings).
+    Index(UNIQUE_RATINGS_INDEX, "user_id", "anime_id", unique=True),
+    Index("idx_ratings_anime", "anime_id"),
+    # Never reuse the id of a deleted row, or a replaced rating could fall behind the watermark.
+    sqlite_autoincrement=True,
+)
+
+replaced_ratings = Table(
+    "replaced_ratings", metadata,
+    # Rows overwritten by a newer rating of the same title, kept with their original id
+    # and the id of the row that replaced them, so reads as of an older watermark still
+    # see them (incremental training needs a user's ratings at the base version).
+    Column("id", BigInteger, primary_key=True, autoincrement=False),
+    Column("user_id", Integer, nullable=False),
+    Column("anime_id", Integer, nullable=False),
+    Column("rating", Integer, nullable=False),
+    Column("replaced_by", BigInteger, nullable=False),
+    Index("idx_replaced_ratings_user", "user_id"),
+    Index("idx_replaced_ratings_replaced_by", "replaced_by"),
+)
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("username", String(255), nullable=False, unique=True),
+    Column("password", String(255), nullable=False),
+)
+
+model_versions = Table(
+    "model_versions", metadata,
+    Column("version", String(64), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("ratings_watermark", BigInteger),
+    # Artifact size and SHA-256 recorded at registration; see Back.Data.versions.
+    Column("size_bytes", BigInteger),
+    Column("checksum", String(64)),
+    Column("pinned", Boolean, nullable=False, server_default=text("0")),
+    # Set by promote/rollback; the active version has the latest of promoted_at and created_at.
+    Column("promoted_at", DateTime),
+)
+
+# Columns added to model_versions after the original schema, with their DDL.
+MODEL_VERSION_COLUMNS = {
+    "ratings_watermark": "BIGINT NULL",
+    "size_bytes": "BIGINT NULL",
+    "checksum": "VARCHAR(64) NULL",
+    "pinned": "BOOLEAN NOT NULL DEFAULT 0",
+    "promoted_at": "DATETIME NULL",
+}
+
+
+def ensure_schema(engine):
+    """Creates missing tables and adds columns introduced after the original schema."""
+    metadata.create_all(engine)
+    inspector = inspect(engine)
+
+    version_columns = {c["name"] for c in inspector.get_columns("model_versions")}
+    with engine.begin() as conn:
+        for name, ddl in MODEL_VERSION_COLUMNS.items():
+            if name not in version_columns:
+                conn.execute(text(f"ALTER TABLE model_versions ADD COLUMN {name} {ddl}"))
+
+    # Tables imported from the Kaggle CSV have no id (SQLite falls back to its implicit rowid),
+    # and may hold several ratings of the same title. Fixing either rewrites the whole table,
+    # so that is left to `python -m Back.Data.migrate` instead of happening at startup.
+    if not ratings_ids_monotonic(engine):
+        warnings.warn("ratings has no never-reused id column, which rating writes and incremental training need; "
+                      "run `python -m Back.Data.migrate ratings-id`", RuntimeWarning)
+    rating_indexes = {i["name"] for i in inspector.get_indexes("ratings")}
+    if UNIQUE_RATINGS_INDEX not in rating_indexes:
+        warnings.warn("ratings allows several ratings per user and title; "
+                      "run `python -m Back.Data.migrate dedupe-ratings`", RuntimeWarning)
+
+    # create_all only indexes tables it creates; add missing indexes to pre-existing ones.
+    for table in metadata.sorted_tables:
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing and index.name != UNIQUE_RATINGS_INDEX:
+                index.create(engine)
+
+
+def ratings_id_column(engine) -> str:
+    """Name of the monotonic ratings id column."""
+    columns = {c["name"] for c in inspect(engine).get_columns("ratings")}
+    return "id" if "id" in columns else "rowid"
+
+
+def ratings_ids_monotonic(engine) -> bool:
+    """Whether ratings has an id column that never hands out the id of a deleted row.
+
+    SQLite only guarantees that for AUTOINCREMENT keys; a plain INTEGER PRIMARY KEY
+    (or the implicit rowid) reuses the highest id once that row is deleted.
+    """
+    if ratings_id_column(engine) != "id":
+        return False
+    if engine.dialect.name != "sqlite":
+        return True
+    with engine.connect() as conn:
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'ratings'")).scalar()
+    return "AUTOINCREMENT" in (ddl or "").upper()
@@ -0,0 +1,128 @@
+import bisect
+import html
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+FUZZY_THRESHOLD = 0.3
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text) -> str:
+    """Lowercase ASCII words: HTML entities decoded, accents and punctuation dropped."""
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize("NFKD", html.unescape(text)).encode("ascii", "ignore").decode()
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def word_trigrams(text: str):
+    """Trigrams of each word padded like pg_trgm ("  w" ... "w "), for fuzzy similarity."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def inner_trigrams(text: str):
+    """Unpadded trigrams inside each word; a name containing `text` has all of them."""
+    return {word[i:i + 3] for word in text.split() for i in range(len(word) - 2)}
+
+
+class SearchIndex:
+    """Name index over the catalog: exact, prefix, substring and typo-tolerant matches.
+
+    Tokens are kept sorted for prefix ranges and word trigrams map to posting arrays,
+    so a lookup touches only the candidates sharing a token or trigram with the query.
+    """
+
+    def __init__(self, anime: pd.DataFrame):
+        anime = anime.reset_index(drop=True)
+        self.anime_ids = anime["anime_id"].to_numpy(dtype=np.int64)
+        self.names = [normalize(name) for name in anime["name"]]
+        self.members = pd.to_numeric(anime["members"], errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+        # JSON-ready rows: NaN becomes None.
+        self.records = anime.astype(object).where(anime.notna(), None).to_dict(orient="records")
+        self._by_id = {int(anime_id): i for i, anime_id in enumerate(self.anime_ids)}
+
+        token_docs, gram_docs = {}, {}
+        gram_counts = np.zeros(len(self.names), dtype=np.int32)
+        for doc, name in enumerate(self.names):
+            for token in set(name.split()):
+                token_docs.setdefault(token, []).append(doc)
+            grams = word_trigrams(name)
+            gram_counts[doc] = len(grams)
+            for gram in grams:
+                gram_docs.setdefault(gram, []).append(doc)
+        self._tokens = sorted(token_docs)
+        self._token_postings = [np.array(token_docs[t], dtype=np.int32) for t in self._tokens]
+        self._gram_postings = {g: np.array(docs, dtype=np.int32) for g, docs in gram_docs.items()}
+        self._gram_counts = gram_counts
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix_docs(self, prefix: str):
+        lo = bisect.bisect_left(self._tokens, prefix)
+        hi = bisect.bisect_left(self._tokens, prefix + "\uffff")
+        if lo == hi:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(self._token_postings[lo:hi]))
+
+    def _gram_hits(self, grams):
+        postings = [self._gram_postings[g] for g in grams if g in self._gram_postings]
+        if not postings:
+            return np.zeros(len(self.names), dtype=np.int32)
+        return np.bincount(np.concatenate(postings), minlength=len(self.names)).astype(np.int32)
+
+    def search(self, query: str, limit: int = 20, offset: int = 0, fuzzy_threshold: float = FUZZY_THRESHOLD):
+        """Returns (total, records) for one page of ranked matches.
+
+        An all-digit query that is a known anime_id returns just that anime.
+        Ranking tiers: exact name, name prefix, every word a word prefix,
+        substring, then fuzzy trigram similarity; ties go to the more popular title.
+        """
+        query = query.strip()
+        if query.isdigit() and int(query) in self._by_id:
+            return 1, [self.records[self._by_id[int(query)]]][offset:offset + limit]
+        q = normalize(query)
+        if not q or not len(self.names):
+            return 0, []
+
+        n = len(self.names)
+        levels = np.full(n, -1, dtype=np.int8)
+
+        # Fuzzy: trigram Jaccard between the query and each name.
+        grams = word_trigrams(q)
+        common = self._gram_hits(grams)
+        similarity = common / np.maximum(len(grams) + self._gram_counts - common, 1)
+        levels[similarity >= fuzzy_threshold] = 0
+
+        # Substring: candidates hold every inner trigram, then the name is checked.
+        # Queries of one- and two-letter words have none and rely on the word-prefix tier.
+        inner = inner_trigrams(q)
+        if inner:
+            candidates = np.flatnonzero(self._gram_hits(inner) >= len(inner))
+            levels[[d for d in candidates.tolist() if q in self.names[d]]] = 1
+
+        matches = None
+        for token in q.split():
+            docs = self._prefix_docs(token)
+            matches = docs if matches is None else np.intersect1d(matches, docs, assume_unique=True)
+        levels[matches] = 2
+
+        # Whole-name prefixes are a subset of the word-prefix matches.
+        for doc in matches.tolist():
+            name = self.names[doc]
+            if name.startswith(q):
+                levels[doc] = 4 if name == q else 3
+
+        docs = np.flatnonzero(levels >= 0)
+        if len(docs) == 0:
+            return 0, []
+        order = np.lexsort((-self.members[docs], -similarity[docs], -levels[docs]))
+        page = docs[order][offset:offset + limit]
+        return len(docs), [self.records[d] for d in page.tolist()]
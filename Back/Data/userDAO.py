@@ -1,13 +1,16 @@
 # Back/Data/user_dao.py
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from passlib.hash import bcrypt
 
+from Back.Data.database import get_engine
+from Back.telemetry import span
+
 
 class UserDAO:
-    def __init__(self, host="localhost", user="root", password="", database="anime_recommender"):
-        db_url = f"mysql+pymysql://{user}:{password}@{host}/{database}?charset=utf8mb4"
-        self.engine = create_engine(db_url, echo=False, pool_pre_ping=True)
+    def __init__(self, engine=None):
+        self.engine = engine if engine is not None else get_engine()
 
+    @span("dao.create_user")
     def create_user(self, username: str, password: str):
         """Registers a new user if the username doesn't exist."""
         hashed_pw = bcrypt.hash(password)
@@ -24,6 +27,7 @@ class UserDAO:
             )
         return {"status": "success", "message": "User registered successfully"}
 
+    @span("dao.authenticate_user")
     def authenticate_user(self, username: str, password: str):
         """Validates login credentials."""
         with self.engine.begin() as conn:
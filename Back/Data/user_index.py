@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class UserRatingIndex:
+    """All ratings sorted by user, with CSR-style offsets per user.
+
+    Ratings of `user_ids[i]` are `anime_ids[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self, user_ids, offsets, anime_ids, ratings):
+        self.user_ids = user_ids
+        self.offsets = offsets
+        self.anime_ids = anime_ids
+        self.ratings = ratings
+        self.built_at = time.time()
+        self.nbytes = int(user_ids.nbytes + offsets.nbytes + anime_ids.nbytes + ratings.nbytes)
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        users, anime, ratings = [], [], []
+        for chunk in chunks:
+            users.append(chunk["user_id"].to_numpy(dtype=np.int32))
+            anime.append(chunk["anime_id"].to_numpy(dtype=np.int32))
+            ratings.append(chunk["rating"].to_numpy(dtype=np.int8))
+        users = np.concatenate(users) if users else np.empty(0, np.int32)
+        anime = np.concatenate(anime) if anime else np.empty(0, np.int32)
+        ratings = np.concatenate(ratings) if ratings else np.empty(0, np.int8)
+
+        order = np.argsort(users, kind="stable")
+        users, anime, ratings = users[order], anime[order], ratings[order]
+        user_ids, starts = np.unique(users, return_index=True)
+        offsets = np.append(starts, len(users)).astype(np.int64)
+        return cls(user_ids, offsets, anime, ratings)
+
+    def get(self, user_id: int):
+        """(anime_ids, ratings) of a user; empty arrays if unknown."""
+        pos = np.searchsorted(self.user_ids, user_id)
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return self.anime_ids[:0], self.ratings[:0]
+        start, stop = self.offsets[pos], self.offsets[pos + 1]
+        return self.anime_ids[start:stop], self.ratings[start:stop]
+
+
+class UserRatingCache:
+    """Optional in-memory `UserRatingIndex` (USER_INDEX_ENABLED=1) in front of the per-user query.
+
+    Users with ratings written after the build are marked stale and read from the
+    database until the next rebuild.
+    """
+
+    def __init__(self, dao, enabled: bool = None, ttl_seconds: float = None):
+        self._dao = dao
+        if enabled is None:
+            enabled = os.getenv("USER_INDEX_ENABLED", "0") == "1"
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("USER_INDEX_TTL_SECONDS", "3600"))
+        self.enabled = enabled
+        self._ttl_seconds = ttl_seconds
+        self._index = None
+        self._stale = set()
+        self._lock = threading.Lock()
+
+    def _get_index(self):
+        index = self._index
+        if index is not None and time.time() - index.built_at < self._ttl_seconds:
+            return index
+        with self._lock:
+            index = self._index
+            if index is None or time.time() - index.built_at >= self._ttl_seconds:
+                index = UserRatingIndex.from_chunks(self._dao.iter_ratings())
+                self._index = index
+                self._stale = set()
+        return index
+
+    def watched_ids(self, user_id: int):
+        """Anime ids the user has rated (including -1 entries), in storage order."""
+        if not self.enabled or user_id in self._stale:
+            return self._dao.load_ratings(user_id=user_id)["anime_id"].to_numpy()
+        return self._get_index().get(user_id)[0]
+
+    def watched_ids_many(self, user_ids):
+        """{user_id: watched anime ids} for a batch, with one query for the users not served by the index."""
+        user_ids = [int(u) for u in user_ids]
+        watched, missing = {}, user_ids
+        if self.enabled:
+            index = self._get_index()
+            missing = [u for u in user_ids if u in self._stale]
+            watched = {u: index.get(u)[0] for u in user_ids if u not in self._stale}
+        if missing:
+            ratings = self._dao.load_ratings(user_ids=missing)
+            for user_id, group in ratings.groupby("user_id", sort=False):
+                watched[int(user_id)] = group["anime_id"].to_numpy()
+        empty = np.empty(0, dtype=np.int64)
+        return {u: watched.get(u, empty) for u in user_ids}
+
+    def invalidate_users(self, user_ids):
+        self._stale.update(int(u) for u in user_ids)
+
+    def invalidate(self):
+        self._index = None
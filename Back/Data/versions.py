@@ -0,0 +1,221 @@
+"""Model version lifecycle: registration, promotion, rollback, pinning and garbage collection.
+
+The ``model_versions`` table is the source of truth. Every trained version gets a
+row with the size and SHA-256 of its artifacts; the active version is the one
+promoted or created last, so promoting an older version (or rolling back to the
+previous one) needs no retraining. ``current_model.json`` in ``MODEL_DIR`` (or
+``MODEL_POINTER_PATH``) mirrors the active version and is rewritten whenever it changes.
+
+Garbage collection keeps the newest ``MODEL_KEEP_VERSIONS`` versions, pinned
+versions and the active one, and deletes the artifacts and rows of the rest:
+
+    python -m Back.Data.versions list
+    python -m Back.Data.versions promote v20250101_120000
+    python -m Back.Data.versions rollback
+    python -m Back.Data.versions pin v20250101_120000
+    python -m Back.Data.versions gc --keep 3 --dry-run
+"""
+import argparse
+import json
+import os
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from Back.Data import model_store
+from Back.Data.model_store import MODEL_DIR
+
+# Versions kept by garbage collection after each training run (0 keeps everything).
+KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "5"))
+POINTER_PATH = Path(os.getenv("MODEL_POINTER_PATH", str(MODEL_DIR / "current_model.json")))
+
+
+def _timestamp(value):
+    return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+
+
+class ModelVersions:
+    """Lifecycle operations over the model_versions rows and their artifacts.
+
+    Unknown versions raise KeyError; operations the current state does not allow
+    (missing or corrupted artifacts, nothing to roll back to) raise ValueError.
+    """
+
+    def __init__(self, dao, model_dir: Path = MODEL_DIR, pointer_path: Path = POINTER_PATH,
+                 keep: int = KEEP_VERSIONS):
+        self._dao = dao
+        self._model_dir = Path(model_dir)
+        self._pointer_path = Path(pointer_path)
+        self.keep = keep
+
+    def register(self, version: str, ratings_watermark: int = None):
+        """Records a freshly written version, which becomes the active one, and collects old ones."""
+        size, checksum = model_store.artifact_info(version, self._model_dir)
+        self._dao.save_model_version(version, ratings_watermark, size, checksum)
+        self.sync_pointer()
+        if self.keep > 0:
+            self.collect(self.keep)
+        return {"version": version, "size_bytes": size, "checksum": checksum}
+
+    def list(self):
+        """Every version, active first, with its recorded and current on-disk size."""
+        rows = self._dao.load_model_versions()
+        versions = []
+        for i, row in enumerate(rows.itertuples(index=False)):
+            on_disk = model_store.exists(row.version, self._model_dir)
+            versions.append({
+                "version": row.version,
+                "active": i == 0,
+                "pinned": bool(row.pinned),
+                "created_at": _timestamp(row.created_at),
+                "promoted_at": _timestamp(row.promoted_at),
+                "ratings_watermark": None if pd.isna(row.ratings_watermark) else int(row.ratings_watermark),
+                "size_bytes": None if pd.isna(row.size_bytes) else int(row.size_bytes),
+                "disk_bytes": model_store.disk_bytes(row.version, self._model_dir) if on_disk else 0,
+                "checksum": row.checksum,
+                "exists": on_disk,
+            })
+        return versions
+
+    def verify(self, version: str):
+        """Recomputes a version's checksum; rows registered without one get it recorded."""
+        row = self._row(version)
+        if not model_store.exists(version, self._model_dir):
+            return {"version": version, "ok": False, "error": "artifacts missing"}
+        size, checksum = model_store.artifact_info(version, self._model_dir)
+        expected = row["checksum"]
+        if expected is None or pd.isna(expected):
+            self._dao.update_model_version_artifact(version, size, checksum)
+            expected = checksum
+        return {"version": version, "ok": checksum == expected, "size_bytes": size, "checksum": checksum,
+                "expected": expected}
+
+    def promote(self, version: str, verify: bool = True):
+        """Makes an existing version the active one without retraining."""
+        self._row(version)
+        if not model_store.exists(version, self._model_dir):
+            raise ValueError(f"Version {version} has no artifacts in {self._model_dir}")
+        if verify:
+            result = self.verify(version)
+            if not result["ok"]:
+                raise ValueError(f"Version {version} failed verification: checksum {result['checksum']} "
+                                 f"does not match the recorded {result['expected']}")
+        self._dao.promote_model_version(version)
+        self.sync_pointer()
+        return version
+
+    def rollback(self, verify: bool = True):
+        """Promotes the version that was active before the current one."""
+        rows = self._dao.load_model_versions()
+        for version in rows["version"].iloc[1:]:
+            if model_store.exists(version, self._model_dir):
+                return self.promote(version, verify)
+        raise ValueError("No earlier version with artifacts to roll back to")
+
+    def pin(self, version: str, pinned: bool = True):
+        """Pinned versions are never garbage-collected."""
+        if not self._dao.set_model_version_pinned(version, pinned):
+            raise KeyError(version)
+        return version
+
+    def collect(self, keep: int = None, dry_run: bool = False):
+        """Deletes every version but the newest `keep`, the pinned ones and the active one.
+
+        A version whose files cannot be removed (e.g. still mapped on Windows) keeps
+        its row and is retried by the next collection. Replaced ratings older than
+        every remaining version's watermark are pruned too: only incremental updates
+        of a remaining version read them.
+        """
+        keep = self.keep if keep is None else keep
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        rows = self._dao.load_model_versions()
+        if rows.empty:
+            return {"deleted": [], "kept": [], "freed_bytes": 0, "pruned_ratings": 0, "dry_run": dry_run}
+        newest = rows.sort_values("created_at", ascending=False)["version"].head(keep)
+        kept = set(newest) | set(rows.loc[rows["pinned"], "version"]) | {rows["version"].iloc[0]}
+
+        deleted, freed = [], 0
+        for version in rows["version"]:
+            if version in kept or version in deleted:
+                continue
+            if dry_run:
+                freed += model_store.disk_bytes(version, self._model_dir)
+                deleted.append(version)
+                continue
+            try:
+                freed += model_store.delete_version(version, self._model_dir)
+            except OSError:
+                traceback.print_exc()
+                continue
+            self._dao.delete_model_version(version)
+            deleted.append(version)
+
+        pruned = 0
+        watermarks = rows.loc[~rows["version"].isin(deleted), "ratings_watermark"].dropna()
+        if not dry_run and not watermarks.empty:
+            pruned = self._dao.prune_replaced_ratings(int(watermarks.min()))
+        return {"deleted": deleted, "kept": sorted(kept), "freed_bytes": freed, "pruned_ratings": pruned,
+                "dry_run": dry_run}
+
+    def sync_pointer(self):
+        """Rewrites current_model.json from the database's active version."""
+        version = self._dao.get_current_model_version()
+        tmp = self._pointer_path.with_name(self._pointer_path.name + ".tmp")
+        self._pointer_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"current_model_version": version, "updated_at": datetime.now().isoformat()}, f, indent=2)
+        os.replace(tmp, self._pointer_path)
+        return version
+
+    def _row(self, version: str):
+        rows = self._dao.load_model_versions()
+        match = rows[rows["version"] == version]
+        if match.empty:
+            raise KeyError(version)
+        return match.iloc[0]
+
+
+def main(argv=None):
+    from Back.Data.animeDAO import AnimeDAO
+
+    parser = argparse.ArgumentParser(description="Model version lifecycle")
+    parser.add_argument("--model-dir", default=str(MODEL_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List versions, active first")
+    for name, text in (("promote", "Make a version the active one"), ("verify", "Recompute a version's checksum"),
+                       ("pin", "Protect a version from garbage collection"), ("unpin", "Undo pin")):
+        sub.add_parser(name, help=text).add_argument("version")
+    sub.add_parser("rollback", help="Promote the previously active version")
+    gc = sub.add_parser("gc", help="Delete old unpinned versions")
+    gc.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="default: MODEL_KEEP_VERSIONS")
+    gc.add_argument("--dry-run", action="store_true")
+    sub.add_parser("sync", help="Rewrite current_model.json from the database")
+    args = parser.parse_args(argv)
+
+    model_dir = Path(args.model_dir)
+    pointer_path = Path(os.getenv("MODEL_POINTER_PATH", model_dir / "current_model.json"))
+    versions = ModelVersions(AnimeDAO(), model_dir, pointer_path)
+    if args.command == "gc" and args.keep < 1:
+        parser.error("--keep must be at least 1")
+    if args.command == "list":
+        result = versions.list()
+    elif args.command == "promote":
+        result = {"active": versions.promote(args.version)}
+    elif args.command == "rollback":
+        result = {"active": versions.rollback()}
+    elif args.command == "verify":
+        result = versions.verify(args.version)
+    elif args.command in ("pin", "unpin"):
+        result = {"version": versions.pin(args.version, args.command == "pin"), "pinned": args.command == "pin"}
+    elif args.command == "gc":
+        result = versions.collect(args.keep, args.dry_run)
+    else:
+        result = {"active": versions.sync_pointer()}
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
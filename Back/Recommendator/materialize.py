@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Back.telemetry import span
+
+
+class MaterializedRecommendations:
+    """Precomputed top-N recommendations of one model version, CSR by user.
+
+    Recommendations of `user_ids[i]` are `anime_ids[offsets[i]:offsets[i + 1]]`
+    with `scores` alongside, best first. `params` are the scoring parameters they
+    were computed with; users whose ratings changed since are marked stale.
+    `checked_watermark` is the ratings id up to which those marks are complete.
+    """
+
+    def __init__(self, version, user_ids, offsets, anime_ids, scores, params, meta=None):
+        self.version = version
+        self.user_ids = user_ids
+        self.offsets = offsets
+        self.anime_ids = anime_ids
+        self.scores = scores
+        self.params = params
+        self.meta = meta or {}
+        self.nbytes = int(user_ids.nbytes + offsets.nbytes + anime_ids.nbytes + scores.nbytes)
+        self._stale = set()
+        self.checked_watermark = self.meta.get("ratings_watermark")
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def matches(self, **params):
+        return all(self.params.get(name) == value for name, value in params.items())
+
+    def get(self, user_id: int):
+        """(anime_ids, scores) of a user, or None if the user was not materialized or is stale."""
+        if user_id in self._stale:
+            return None
+        pos = np.searchsorted(self.user_ids, user_id)
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return None
+        start, stop = self.offsets[pos], self.offsets[pos + 1]
+        return self.anime_ids[start:stop], self.scores[start:stop]
+
+    def invalidate_users(self, user_ids):
+        self._stale.update(int(u) for u in user_ids)
+
+    def status(self):
+        return {"version": self.version, "users": len(self), "stale_users": len(self._stale), "bytes": self.nbytes,
+                "params": self.params, **self.meta}
+
+
+def materialize(batch, user_ids, chunk_size: int, workers: int, progress=None, stop=None):
+    """Runs `batch.user_recommendations` over `user_ids` in parallel chunks.
+
+    Returns sorted user ids and the CSR (offsets, anime_ids, scores) of every user
+    that got recommendations; `progress(done, total)` is called per chunk. Once
+    `stop` (a threading.Event) is set the remaining chunks are skipped and None is returned.
+    """
+    user_ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+    chunks = [user_ids[start:start + chunk_size].tolist() for start in range(0, len(user_ids), chunk_size)]
+    results = [None] * len(chunks)
+    done = [0]
+    lock = threading.Lock()
+
+    def run(i):
+        if stop is not None and stop.is_set():
+            return
+        with span("materialize.chunk"):
+            results[i] = batch.user_recommendations(chunks[i])
+        with lock:
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], len(chunks))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="materialize") as pool:
+        list(pool.map(run, range(len(chunks))))
+    if stop is not None and stop.is_set():
+        return None
+
+    kept_users, counts, anime_ids, scores = [], [], [], []
+    for chunk in results:
+        for user_id, recs in chunk:
+            if recs is None or recs.empty:
+                continue
+            kept_users.append(user_id)
+            counts.append(len(recs))
+            anime_ids.append(recs["anime_id"].to_numpy(dtype=np.int32))
+            scores.append(recs["final_score"].to_numpy(dtype=np.float32))
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    return (
+        np.asarray(kept_users, dtype=np.int32),
+        offsets,
+        np.concatenate(anime_ids) if anime_ids else np.empty(0, np.int32),
+        np.concatenate(scores) if scores else np.empty(0, np.float32),
+    )
@@ -1,94 +1,242 @@
-import pandas as pd
-import pickle
-from pathlib import Path
+import os
+import threading
+import time
+import traceback
+
+from Back.Data import model_store
 from Back.Data.animeDAO import AnimeDAO
+from Back.Data.catalog import CatalogCache
+from Back.Data.user_index import UserRatingCache
+from Back.Recommendator.materialize import MaterializedRecommendations, materialize
+from Back.Recommendator.registry import ModelRegistry
+from Back.Recommendator.scoring import (
+    rank_by_genre,
+    rank_for_user,
+    rank_for_users,
+    rank_similar,
+    rank_similar_many,
+    rank_users_by_factors,
+    recommendation_table,
+)
+from Back.telemetry import span
 
 dao = AnimeDAO()
-MODEL_DIR = Path("Back/Model")
+registry = ModelRegistry(dao)
+catalog = CatalogCache(dao)
+user_ratings = UserRatingCache(dao)
+# Ids scored per step of a batch request; users' ratings are loaded with one query per step.
+BATCH_CHUNK_SIZE = int(os.getenv("RECOMMEND_BATCH_CHUNK_SIZE", "500"))
+# Precompute /recommend/user results for every user after each publish.
+MATERIALIZE = os.getenv("RECOMMEND_MATERIALIZE", "1") == "1"
+MATERIALIZE_WORKERS = int(os.getenv("RECOMMEND_MATERIALIZE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Background materializations still running, and the event that stops them at shutdown.
+_materializing = []
+_materializing_lock = threading.Lock()
+_stop_materializing = threading.Event()
+
+
+@span("recommend.model")
+def load_active_model():
+    """The active model version (LoadedModel), or None before the first training."""
+    return registry.get()
 
 
 def load_latest_model():
-    version = dao.get_current_model_version()
-    if version == "none":
+    """Similarity source (top-K index, dense matrix or factors) of the active model version."""
+    model = load_active_model()
+    if model is None:
         return None
+    return model.similarity
 
-    corr_path = MODEL_DIR / f"anime_corr_matrix_{version}.pkl"
-    if not corr_path.exists():
-        return None
-    with open(corr_path, "rb") as f:
-        return pickle.load(f)
+
+def _genre_features(model, snapshot):
+    """Genre rows stored with the version; older versions fall back to the catalog's."""
+    if model.genres is not None:
+        return model.genres
+    return snapshot.genres
 
 
 def get_user_watched(user_id: int):
-    ratings = dao.load_ratings()
-    anime = dao.load_anime()
-    user_data = ratings[ratings["user_id"] == user_id]
-    return user_data.merge(anime, on="anime_id", how="left")
+    return dao.load_user_watched(user_id)
 
 
-def get_similar_anime(anime_id, min_ratings=100, top_n=20, genre_weight=0.2, rating_weight=0.1):
-    anime_corr_matrix = load_latest_model()
-    if anime_corr_matrix is None or anime_id not in anime_corr_matrix.columns:
+def get_similar_anime(anime_id, min_ratings=100, top_n=20, genre_weight=0.2, rating_weight=0.1, model=None):
+    """Similar-anime table scored with `model` (the active version by default)."""
+    if model is None:
+        model = load_active_model()
+    if model is None:
         return None
-
-    anime = dao.load_anime()
-    ratings = dao.load_ratings()
-
-    similar = anime_corr_matrix[anime_id].dropna().sort_values(ascending=False)
-    anime_stats = ratings.groupby("anime_id").agg({"rating": ["size", "mean"]})
-    anime_stats.columns = ["num_ratings", "avg_rating"]
-
-    result = pd.DataFrame({"anime_id": similar.index, "similarity": similar.values})
-    result = result.merge(anime_stats, on="anime_id", how="left")
-    filtered = result[result["num_ratings"] >= min_ratings]
-
-    if filtered.empty:
-        filtered = result[result["num_ratings"] >= 10]
-
-    filtered = filtered.merge(anime[["anime_id", "name", "genre", "rating"]], on="anime_id", how="left")
-
-    def genre_similarity(g1, g2):
-        if pd.isna(g1) or pd.isna(g2):
-            return 0
-        s1, s2 = set(g1.split(", ")), set(g2.split(", "))
-        return len(s1 & s2) / len(s1 | s2) if len(s1 | s2) > 0 else 0
-
-    base_genre = anime.loc[anime["anime_id"] == anime_id, "genre"].values[0] if anime_id in anime["anime_id"].values else None
-    filtered["genre_sim"] = filtered["genre"].apply(lambda g: genre_similarity(base_genre, g))
-
-    base_rating = anime.loc[anime["anime_id"] == anime_id, "rating"].values[0] if anime_id in anime["anime_id"].values else None
-    filtered["rating_diff"] = filtered["rating"].apply(
-        lambda r: 1 - abs(r - base_rating) / 10 if pd.notna(r) and pd.notna(base_rating) else 0
-    )
-
-    filtered["final_score"] = (
-        (1 - genre_weight - rating_weight) * filtered["similarity"]
-        + genre_weight * filtered["genre_sim"]
-        + rating_weight * filtered["rating_diff"]
-    )
-
-    return filtered.sort_values("final_score", ascending=False).head(top_n)
-
-
-def get_user_recommendations(user_id: int, top_n: int = 10):
-    user_watched = get_user_watched(user_id)
-    if user_watched.empty:
+    with span("recommend.catalog"):
+        snapshot = catalog.get()
+    genres = _genre_features(model, snapshot)
+    with span("recommend.score"):
+        if anime_id not in model.similarity:
+            # Too few ratings to be in the model: rank by genre overlap instead.
+            return rank_by_genre(snapshot, genres, anime_id, min_ratings, top_n, rating_weight)
+        return rank_similar(snapshot, model.similarity, anime_id, min_ratings, top_n, genre_weight, rating_weight,
+                            genres)
+
+
+def get_user_recommendations(user_id: int, top_n: int = 10, min_ratings=100, genre_weight=0.2, rating_weight=0.1,
+                             model=None):
+    """User recommendation table from `model` (the active version by default)."""
+    if model is None:
+        model = load_active_model()
+    if model is None:
         return None
-
-    anime_ids = user_watched["anime_id"].tolist()
-    all_recs = []
-
-    for aid in anime_ids:
-        recs = get_similar_anime(aid, top_n=top_n)
-        if recs is not None:
-            all_recs.append(recs)
-
-    if not all_recs:
+    stored = model.recommendations
+    if stored is not None and stored.matches(top_n=top_n, min_ratings=min_ratings, genre_weight=genre_weight,
+                                             rating_weight=rating_weight):
+        with span("recommend.materialized"):
+            found = stored.get(user_id)
+            if found is not None:
+                return recommendation_table(catalog.get(), *found)
+
+    # New users, users who rated since the last materialization, and other parameters score online.
+    with span("recommend.user_ratings"):
+        anime_ids = user_ratings.watched_ids(user_id)
+    if len(anime_ids) == 0:
         return None
 
-    combined = pd.concat(all_recs)
-    combined = combined.groupby("anime_id").agg({"final_score": "mean"}).reset_index()
-    combined = combined.merge(dao.load_anime()[["anime_id", "name", "genre", "rating"]], on="anime_id", how="left")
-    combined = combined[~combined["anime_id"].isin(anime_ids)]
+    with span("recommend.catalog"):
+        snapshot = catalog.get()
+    with span("recommend.score"):
+        if model.users is not None:
+            factors, found = model.users.get([user_id])
+            if found[0]:
+                return next(rank_users_by_factors(snapshot, model.similarity, [(user_id, factors[0], anime_ids)],
+                                                  top_n, min_ratings))[1]
+        # Correlation versions, and users who were not in the factor training data.
+        return rank_for_user(snapshot, model.similarity, anime_ids, top_n, min_ratings, genre_weight, rating_weight,
+                             _genre_features(model, snapshot))
+
+
+class RecommendationBatch:
+    """Scores many anime or users against one model version and catalog snapshot.
+
+    `similar_anime` and `user_recommendations` each handle one chunk of ids and
+    return [(id, table or None), ...]; a batch request calls them chunk by chunk, so
+    a model published mid-request does not mix versions in its results.
+    """
+
+    def __init__(self, min_ratings=100, top_n=10, genre_weight=0.2, rating_weight=0.1):
+        self.model = load_active_model()
+        self.snapshot = catalog.get() if self.model is not None else None
+        self.genres = _genre_features(self.model, self.snapshot) if self.model is not None else None
+        self.params = {"min_ratings": min_ratings, "top_n": top_n, "genre_weight": genre_weight,
+                       "rating_weight": rating_weight}
+        self._picks = {}
+
+    @property
+    def version(self):
+        return self.model.version if self.model is not None else None
+
+    def similar_anime(self, anime_ids):
+        if self.model is None:
+            return [(a, None) for a in anime_ids]
+        p = self.params
+        similarity = self.model.similarity
+        known = [a for a in anime_ids if a in similarity]
+        with span("recommend.score"):
+            tables = dict(zip(known, rank_similar_many(self.snapshot, similarity, known, p["min_ratings"],
+                                                       p["top_n"], p["genre_weight"], p["rating_weight"],
+                                                       self.genres)))
+            for anime_id in anime_ids:
+                if anime_id not in tables:
+                    tables[anime_id] = rank_by_genre(self.snapshot, self.genres, anime_id, p["min_ratings"],
+                                                     p["top_n"], p["rating_weight"])
+        return [(a, tables[a]) for a in anime_ids]
+
+    def user_recommendations(self, user_ids):
+        if self.model is None:
+            return [(u, None) for u in user_ids]
+        p = self.params
+        with span("recommend.user_ratings"):
+            watched = user_ratings.watched_ids_many(user_ids)
+        factors = found = None
+        if self.model.users is not None:
+            factors, found = self.model.users.get(user_ids)
+        by_factors = [i for i, u in enumerate(user_ids) if found is not None and found[i] and len(watched[u])]
+        rest = sorted(set(range(len(user_ids))) - set(by_factors))
+        results = [None] * len(user_ids)
+        with span("recommend.score"):
+            ranked = rank_users_by_factors(self.snapshot, self.model.similarity,
+                                           [(user_ids[i], factors[i], watched[user_ids[i]]) for i in by_factors],
+                                           p["top_n"], p["min_ratings"])
+            for i, result in zip(by_factors, ranked):
+                results[i] = result
+            ranked = rank_for_users(self.snapshot, self.model.similarity,
+                                    [(user_ids[i], watched[user_ids[i]]) for i in rest], p["top_n"],
+                                    p["min_ratings"], p["genre_weight"], p["rating_weight"], self.genres, self._picks)
+            for i, result in zip(rest, ranked):
+                results[i] = result
+        return results
+
+
+def invalidate_users(user_ids):
+    """Marks users whose ratings changed, so they are scored online until the next rebuild."""
+    user_ratings.invalidate_users(user_ids)
+    model = registry.get()
+    if model is not None and model.recommendations is not None:
+        model.recommendations.invalidate_users(user_ids)
+
+
+def materialize_recommendations(version: str = None, top_n: int = 10, min_ratings=100, genre_weight=0.2,
+                                rating_weight=0.1, workers: int = MATERIALIZE_WORKERS, stop=None):
+    """Precomputes the recommendations of every user with ratings for the active version.
+
+    The result is stored in the version directory and served by `get_user_recommendations`
+    for the same parameters; users who rate anything afterwards fall back to online scoring.
+    Returns None when `version` is no longer the active one, or when `stop` was set
+    before every chunk finished (nothing is written then).
+    """
+    start = time.perf_counter()
+    batch = RecommendationBatch(min_ratings, top_n, genre_weight, rating_weight)
+    if batch.model is None or (version is not None and batch.version != version):
+        return None
+    watermark = dao.get_ratings_watermark()
+    user_ids = dao.load_active_users(1, watermark)
+    result = materialize(batch, user_ids, BATCH_CHUNK_SIZE, workers, stop=stop)
+    if result is None:
+        return None
+    user_ids, offsets, anime_ids, scores = result
+    params = dict(batch.params)
+    seconds = round(time.perf_counter() - start, 3)
+    arrays = {"user_ids": user_ids, "offsets": offsets, "anime_ids": anime_ids, "scores": scores}
+    with span("materialize.write"):
+        model_store.write_recommendations(batch.version, arrays, {"params": params, "ratings_watermark": watermark,
+                                                                  "seconds": seconds})
+    recommendations = MaterializedRecommendations(batch.version, **arrays, params=params,
+                                                  meta={"ratings_watermark": watermark, "seconds": seconds})
+    # Ratings written while this ran were not seen by it.
+    registry.catch_up(recommendations)
+    registry.attach_recommendations(recommendations)
+    return recommendations
+
+
+def materialize_in_background(version: str):
+    """Starts `materialize_recommendations(version)` in a daemon thread (RECOMMEND_MATERIALIZE=1)."""
+    if not MATERIALIZE or _stop_materializing.is_set():
+        return None
 
-    return combined.sort_values("final_score", ascending=False).head(top_n)
+    def run():
+        try:
+            materialize_recommendations(version, stop=_stop_materializing)
+        except Exception:
+            traceback.print_exc()
+
+    thread = threading.Thread(target=run, name=f"materialize-{version}", daemon=True)
+    with _materializing_lock:
+        _materializing[:] = [t for t in _materializing if t.is_alive()]
+        _materializing.append(thread)
+    thread.start()
+    return thread
+
+
+def stop_materializing():
+    """Stops background materializations after their current chunk and waits for them (API shutdown)."""
+    _stop_materializing.set()
+    with _materializing_lock:
+        threads = list(_materializing)
+    for thread in threads:
+        thread.join()
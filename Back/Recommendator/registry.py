@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+from Back.Data import model_store
+from Back.Data.model_store import MODEL_DIR
+from Back.Recommendator.materialize import MaterializedRecommendations
+from Back.Recommendator.similarity import DenseSimilarity, FactorSimilarity, IVFSimilarity, NeighborIndex, UserFactors
+
+
+class LoadedModel:
+    """A model version held resident in memory.
+
+    `users` holds the user factors of an "svd" engine version, None for correlation versions.
+    `recommendations` are the version's precomputed user recommendations, once materialized.
+    """
+
+    def __init__(self, version: str, similarity, load_seconds: float, meta: dict = None, format_version: int = None,
+                 genres=None, engine: str = "correlation", users=None):
+        self.version = version
+        self.similarity = similarity
+        self.load_seconds = load_seconds
+        self.meta = meta or {}
+        self.format_version = format_version
+        self.genres = genres
+        self.engine = engine
+        self.users = users
+        self.recommendations = None
+        self.loaded_at = datetime.now()
+        self.nbytes = similarity.nbytes + (users.nbytes if users is not None else 0)
+
+
+class ModelRegistry:
+    """Loads the active model version once and hot-swaps it when a new version is published."""
+
+    def __init__(self, dao, model_dir: Path = MODEL_DIR, poll_seconds: float = None):
+        self._dao = dao
+        self._model_dir = Path(model_dir)
+        if poll_seconds is None:
+            poll_seconds = float(os.getenv("MODEL_POLL_SECONDS", "30"))
+        self._poll_seconds = poll_seconds
+        self._serve_dense = os.getenv("MODEL_SERVE_DENSE", "0") == "1"
+        self._serve_exact = os.getenv("MODEL_SERVE_EXACT", "0") == "1"
+        # Recall of the IVF lists depends on how clustered the item factors are: clustered
+        # catalogs reach ~1.0 recall@10 at 8-16 probes, while unstructured factors (20k
+        # items, 141 lists) get 0.57 at 16, 0.74 at 32 and 0.90 at 64, where a query costs
+        # about twice the exact scan. Check a version with `python -m Back.Benchmark.ann`.
+        self._ann_nprobe = int(os.getenv("ANN_NPROBE", "16"))
+        self._ann_candidates = int(os.getenv("ANN_CANDIDATES", "200"))
+        self._ann_min_items = int(os.getenv("ANN_MIN_ITEMS", "5000"))
+        self._active = None
+        self._last_check = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the resident model, re-checking the version row at most every poll interval."""
+        now = time.monotonic()
+        if self._last_check is None or now - self._last_check >= self._poll_seconds:
+            if self._active is None:
+                self.refresh()
+            elif self._lock.acquire(blocking=False):
+                # Requests keep serving the current version while the check and any load run in the background.
+                self._last_check = now
+                threading.Thread(target=self._background_refresh, daemon=True).start()
+        return self._active
+
+    def _background_refresh(self):
+        try:
+            self._refresh_locked(None)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._lock.release()
+
+    def refresh(self, version: str = None):
+        """Loads `version` (or the current version row) and swaps it in if it changed."""
+        with self._lock:
+            return self._refresh_locked(version)
+
+    def _refresh_locked(self, version):
+        self._last_check = time.monotonic()
+        if version is None:
+            version = self._dao.get_current_model_version()
+        if version == "none":
+            return self._active
+        if self._active is not None and self._active.version == version:
+            self._sync_recommendations(self._active)
+            return self._active
+
+        start = time.perf_counter()
+        artifact = model_store.open_model(version, self._model_dir)
+        if artifact is None:
+            return self._active
+        users = None
+        if artifact.engine == "svd":
+            # Small catalogs scan every item faster than they probe lists, and exactly.
+            use_ann = artifact.ivf is not None and len(artifact.anime_ids) >= self._ann_min_items
+            if use_ann and not self._serve_exact:
+                similarity = IVFSimilarity(artifact.anime_ids, artifact.item_factors, *artifact.ivf,
+                                           nprobe=self._ann_nprobe, candidates=self._ann_candidates)
+            else:
+                similarity = FactorSimilarity(artifact.anime_ids, artifact.item_factors)
+            users = UserFactors(artifact.user_ids, artifact.user_factors)
+        # Prefer the compact top-K index; versions without one serve the dense matrix.
+        elif artifact.neighbor_ids is not None and not self._serve_dense:
+            similarity = NeighborIndex(artifact.anime_ids, artifact.neighbor_ids, artifact.neighbor_sims)
+        else:
+            similarity = DenseSimilarity(artifact.anime_ids, artifact.similarity)
+        model = LoadedModel(version, similarity, time.perf_counter() - start,
+                            artifact.meta, artifact.format_version, artifact.genres, artifact.engine, users)
+        self._sync_recommendations(model)
+        # Single reference assignment, readers see either the old or the new model.
+        self._active = model
+        return self._active
+
+    def _sync_recommendations(self, model: LoadedModel):
+        """Attaches stored recommendations (possibly materialized by another worker) and
+        marks the users who rated since; runs on every poll."""
+        if model.recommendations is None:
+            stored = model_store.open_recommendations(model.version, self._model_dir)
+            if stored is None:
+                return
+            arrays, manifest = stored
+            model.recommendations = MaterializedRecommendations(
+                model.version, **arrays, params=manifest["params"],
+                meta={k: manifest.get(k) for k in ("created_at", "ratings_watermark", "seconds")})
+        self.catch_up(model.recommendations)
+
+    def catch_up(self, recommendations: MaterializedRecommendations):
+        """Marks users with ratings after `recommendations.checked_watermark` as stale.
+
+        Reads the shared ratings table, so ratings accepted by other API workers (or
+        written while the API was down) reach this process within one poll interval.
+        """
+        if recommendations.checked_watermark is None:
+            return
+        current = self._dao.get_ratings_watermark()
+        if current > recommendations.checked_watermark:
+            changed = self._dao.load_ratings_since(recommendations.checked_watermark, current)
+            recommendations.invalidate_users(changed["user_id"].unique())
+        recommendations.checked_watermark = current
+
+    def attach_recommendations(self, recommendations: MaterializedRecommendations):
+        """Serves `recommendations` if their version is still the active one."""
+        model = self._active
+        if model is not None and model.version == recommendations.version:
+            model.recommendations = recommendations
+            return True
+        return False
+
+    def status(self):
+        model = self._active
+        if model is None:
+            return {"loaded": False, "version": None}
+        return {
+            "loaded": True,
+            "version": model.version,
+            "loaded_at": model.loaded_at.isoformat(),
+            "load_seconds": round(model.load_seconds, 4),
+            "resident_bytes": 0 if model.similarity.memory_mapped else model.nbytes,
+            "mapped_bytes": model.nbytes if model.similarity.memory_mapped else 0,
+            "format": model.format_version,
+            "engine": model.engine,
+            "num_anime": len(model.similarity.anime_ids),
+            "index": type(model.similarity).__name__,
+            "genre_bytes": model.genres.nbytes if model.genres is not None else 0,
+            "ann_nprobe": getattr(model.similarity, "nprobe", None),
+            "materialized": model.recommendations.status() if model.recommendations is not None else None,
+        }
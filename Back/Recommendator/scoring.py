@@ -0,0 +1,246 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from Back.telemetry import span
+
+BLOCK_ROWS = int(os.getenv("SCORING_BLOCK_ROWS", "256"))
+
+
+class ScoredCandidates:
+    """Scores for a block of base anime (rows) against their candidates (columns)."""
+
+    def __init__(self, cand_ids, cand_pos, similarity, num_ratings, genre_sim, rating_diff, final_score):
+        shape = final_score.shape
+        self.cand_ids = np.broadcast_to(cand_ids, shape)
+        self.cand_pos = np.broadcast_to(cand_pos, shape)
+        self.similarity = similarity
+        self.num_ratings = np.broadcast_to(num_ratings, shape)
+        self.genre_sim = genre_sim
+        self.rating_diff = rating_diff
+        # Candidates filtered out by min_ratings (or without a correlation) score -inf.
+        self.final_score = final_score
+
+
+def score_candidates(snapshot, base_ids, cand_ids, similarity, min_ratings=100, genre_weight=0.2, rating_weight=0.1,
+                     genres=None):
+    """Computes final_score for every (base, candidate) pair in one pass.
+
+    `cand_ids` is either one id vector shared by all rows (dense matrix) or a
+    rows x K array (neighbor index), matching the shape of `similarity`.
+    `genres` are the model version's genre features (the catalog's by default).
+    """
+    base_pos = snapshot.positions(base_ids)
+    cand_ids = np.atleast_2d(cand_ids)
+    cand_pos = snapshot.positions(cand_ids.ravel()).reshape(cand_ids.shape)
+
+    valid = ~np.isnan(similarity)
+    num_ratings = snapshot.take(snapshot.num_ratings, cand_pos)
+    with np.errstate(invalid="ignore"):
+        eligible = valid & (num_ratings >= min_ratings)
+        fallback = ~eligible.any(axis=1)
+        if fallback.any():
+            eligible[fallback] = (valid & (num_ratings >= 10))[fallback]
+
+    with span("score.genre"):
+        genres = genres if genres is not None else snapshot.genres
+        genre_sim = genres.jaccard(genres.positions(base_ids), genres.positions(cand_ids))
+
+    base_rating = snapshot.take(snapshot.base_rating, base_pos)
+    cand_rating = snapshot.take(snapshot.base_rating, cand_pos)
+    rating_diff = np.nan_to_num(1 - np.abs(cand_rating - base_rating[:, None]) / 10, nan=0.0)
+
+    final_score = (
+        (1 - genre_weight - rating_weight) * similarity
+        + genre_weight * genre_sim
+        + rating_weight * rating_diff
+    )
+    final_score = np.where(eligible, final_score, -np.inf)
+    return ScoredCandidates(cand_ids, cand_pos, similarity, num_ratings, genre_sim, rating_diff, final_score)
+
+
+def top_indices(scores, top_n):
+    """Column indices of the `top_n` best finite scores of each row, best first, -1 padded."""
+    n_rows, n_cols = scores.shape
+    k = min(top_n, n_cols)
+    if k == 0:
+        return np.full((n_rows, 0), -1, dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    idx = np.take_along_axis(part, order, axis=1)
+    idx[~np.isfinite(np.take_along_axis(part_scores, order, axis=1))] = -1
+    return idx
+
+
+def rank_similar(snapshot, source, anime_id, min_ratings=100, top_n=20, genre_weight=0.2, rating_weight=0.1,
+                 genres=None):
+    """Similar-anime table for a single title, best final_score first."""
+    return next(rank_similar_many(snapshot, source, [anime_id], min_ratings, top_n, genre_weight, rating_weight,
+                                  genres))
+
+
+def rank_similar_many(snapshot, source, anime_ids, min_ratings=100, top_n=20, genre_weight=0.2, rating_weight=0.1,
+                      genres=None):
+    """Yields the `rank_similar` table of each of `anime_ids` (all in `source`), scored BLOCK_ROWS at a time."""
+    for start in range(0, len(anime_ids), BLOCK_ROWS):
+        block = anime_ids[start:start + BLOCK_ROWS]
+        with span("score.rows"):
+            cand_ids, similarity = source.rows(block)
+        scored = score_candidates(snapshot, block, cand_ids, similarity, min_ratings, genre_weight, rating_weight,
+                                  genres)
+        top = top_indices(scored.final_score, top_n)
+        for row in range(len(block)):
+            idx = top[row][top[row] >= 0]
+            pos = scored.cand_pos[row, idx]
+            yield pd.DataFrame({
+                "anime_id": scored.cand_ids[row, idx],
+                "similarity": similarity[row, idx],
+                "num_ratings": scored.num_ratings[row, idx].astype(np.int64),
+                "avg_rating": snapshot.take(snapshot.avg_rating, pos),
+                "name": snapshot.take(snapshot.name, pos, None),
+                "genre": snapshot.take(snapshot.genre, pos, None),
+                "rating": snapshot.take(snapshot.base_rating, pos),
+                "genre_sim": scored.genre_sim[row, idx],
+                "rating_diff": scored.rating_diff[row, idx],
+                "final_score": scored.final_score[row, idx],
+            })
+
+
+def rank_by_genre(snapshot, genres, anime_id, min_ratings=100, top_n=20, rating_weight=0.1):
+    """Cold-start table for a title without correlations: genre Jaccard against the whole catalog.
+
+    Same columns as `rank_similar`, with `similarity` empty; final_score blends genre
+    and rating closeness, and the title itself is left out.
+    """
+    base_pos = genres.positions([anime_id])
+    if base_pos[0] < 0 or genres.counts[base_pos[0]] == 0:
+        return None
+    cand_ids = genres.anime_ids[genres.anime_ids != anime_id]
+    # No correlation term: a zero similarity with the genre weight taking its share.
+    no_similarity = np.zeros((1, len(cand_ids)))
+    scored = score_candidates(snapshot, [anime_id], cand_ids, no_similarity, min_ratings, 1 - rating_weight,
+                              rating_weight, genres)
+    idx = top_indices(scored.final_score, top_n)[0]
+    idx = idx[idx >= 0]
+    pos = scored.cand_pos[0, idx]
+    return pd.DataFrame({
+        "anime_id": scored.cand_ids[0, idx],
+        "similarity": None,
+        "num_ratings": scored.num_ratings[0, idx].astype(np.int64),
+        "avg_rating": snapshot.take(snapshot.avg_rating, pos),
+        "name": snapshot.take(snapshot.name, pos, None),
+        "genre": snapshot.take(snapshot.genre, pos, None),
+        "rating": snapshot.take(snapshot.base_rating, pos),
+        "genre_sim": scored.genre_sim[0, idx],
+        "rating_diff": scored.rating_diff[0, idx],
+        "final_score": scored.final_score[0, idx],
+    })
+
+
+def _top_picks(snapshot, source, base_ids, top_n, min_ratings, genre_weight, rating_weight, genres):
+    """Best `top_n` (candidate ids, final scores) of each base title, scored BLOCK_ROWS at a time."""
+    picks = []
+    for start in range(0, len(base_ids), BLOCK_ROWS):
+        block = base_ids[start:start + BLOCK_ROWS]
+        with span("score.rows"):
+            cand_ids, similarity = source.rows(block)
+        scored = score_candidates(snapshot, block, cand_ids, similarity, min_ratings, genre_weight, rating_weight,
+                                  genres)
+        top = top_indices(scored.final_score, top_n)
+        for row in range(len(block)):
+            idx = top[row][top[row] >= 0]
+            picks.append((scored.cand_ids[row, idx], scored.final_score[row, idx]))
+    return picks
+
+
+def _user_table(snapshot, picks, watched_ids, top_n):
+    """Averages the picks of a user's watched titles and ranks the unwatched candidates."""
+    with span("score.aggregate"):
+        ids, inverse = np.unique(np.concatenate([p[0] for p in picks]), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([p[1] for p in picks])) / np.bincount(inverse)
+    unwatched = ~np.isin(ids, watched_ids)
+    ids, scores = ids[unwatched], scores[unwatched]
+    if len(ids) == 0:
+        return None
+
+    order = np.argsort(-scores, kind="stable")[:top_n]
+    return recommendation_table(snapshot, ids[order], scores[order])
+
+
+def recommendation_table(snapshot, anime_ids, scores):
+    """User recommendation columns for ranked `anime_ids`, with names and genres from the catalog."""
+    pos = snapshot.positions(anime_ids)
+    return pd.DataFrame({
+        "anime_id": anime_ids,
+        "final_score": scores,
+        "name": snapshot.take(snapshot.name, pos, None),
+        "genre": snapshot.take(snapshot.genre, pos, None),
+        "rating": snapshot.take(snapshot.base_rating, pos),
+    })
+
+
+def _model_titles(source, watched_ids):
+    base_ids = pd.unique(np.asarray(watched_ids, dtype=np.int64))
+    return base_ids[np.isin(base_ids, source.anime_ids)]
+
+
+def rank_for_user(snapshot, source, watched_ids, top_n=10, min_ratings=100, genre_weight=0.2, rating_weight=0.1,
+                  genres=None):
+    """Averages each watched title's top_n similar-anime scores and ranks the unwatched ones."""
+    base_ids = _model_titles(source, watched_ids)
+    if len(base_ids) == 0:
+        return None
+    picks = _top_picks(snapshot, source, base_ids, top_n, min_ratings, genre_weight, rating_weight, genres)
+    return _user_table(snapshot, picks, watched_ids, top_n)
+
+
+def rank_for_users(snapshot, source, watched, top_n=10, min_ratings=100, genre_weight=0.2, rating_weight=0.1,
+                   genres=None, picks=None):
+    """Yields (user_id, `rank_for_user` table or None) for each (user_id, watched_ids) in `watched`.
+
+    A title's picks do not depend on the user, so every title watched by anyone in
+    the batch is scored once; pass the same `picks` dict across batches to reuse them.
+    """
+    watched = [(user_id, watched_ids, _model_titles(source, watched_ids)) for user_id, watched_ids in watched]
+    picks = {} if picks is None else picks
+    new_ids = [a for a in pd.unique(np.concatenate([w[2] for w in watched] or [np.empty(0, np.int64)]))
+               if a not in picks]
+    if new_ids:
+        new_ids = np.asarray(new_ids, dtype=np.int64)
+        picks.update(zip(new_ids.tolist(), _top_picks(snapshot, source, new_ids, top_n, min_ratings, genre_weight,
+                                                      rating_weight, genres)))
+    for user_id, watched_ids, base_ids in watched:
+        if len(base_ids) == 0:
+            yield user_id, None
+            continue
+        yield user_id, _user_table(snapshot, [picks[a] for a in base_ids.tolist()], watched_ids, top_n)
+
+
+def rank_users_by_factors(snapshot, source, users, top_n=10, min_ratings=100):
+    """Yields (user_id, table or None) for each (user_id, factor row, watched_ids) in `users`.
+
+    Each user is one dot product against every anime's factors (`source` is a
+    FactorSimilarity) and a top_n partition; watched titles and those under
+    min_ratings are left out. final_score is the predicted offset from the user's
+    mean rating, with the same columns as `rank_for_user`.
+    """
+    users = list(users)
+    anime_ids = source.anime_ids
+    num_ratings = snapshot.take(snapshot.num_ratings, snapshot.positions(anime_ids))
+    with np.errstate(invalid="ignore"):
+        eligible = num_ratings >= min_ratings
+        if not eligible.any():
+            eligible = num_ratings >= 10
+    for start in range(0, len(users), BLOCK_ROWS):
+        block = users[start:start + BLOCK_ROWS]
+        with span("score.factors"):
+            scores = source.scores(np.stack([factors for _, factors, _ in block]))
+            scores[:, ~eligible] = -np.inf
+            for row, (_, _, watched_ids) in enumerate(block):
+                scores[row, np.isin(anime_ids, watched_ids)] = -np.inf
+            top = top_indices(scores, top_n)
+        for row, (user_id, _, _) in enumerate(block):
+            idx = top[row][top[row] >= 0]
+            yield user_id, recommendation_table(snapshot, anime_ids[idx], scores[row, idx]) if len(idx) else None
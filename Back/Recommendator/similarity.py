@@ -0,0 +1,155 @@
+import numpy as np
+
+
+class AnimeRows:
+    """Sorted anime ids of a similarity source and the id -> row lookup every source shares."""
+
+    def __init__(self, anime_ids):
+        order = np.argsort(anime_ids)
+        self.anime_ids = np.asarray(anime_ids, dtype=np.int64)[order]
+        # Permutation that sorts the source's per-anime arrays; None when they already are.
+        self._order = order if np.any(order != np.arange(len(order))) else None
+
+    def _rows_of(self, base_ids):
+        base_ids = np.asarray(base_ids, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.anime_ids, base_ids), len(self.anime_ids) - 1)
+        return pos, self.anime_ids[pos] == base_ids
+
+    def __contains__(self, anime_id):
+        return len(self.anime_ids) > 0 and bool(self._rows_of([anime_id])[1][0])
+
+
+class DenseSimilarity(AnimeRows):
+    """Serves similarity rows from the full anime x anime correlation matrix (possibly memory-mapped)."""
+
+    def __init__(self, anime_ids, matrix):
+        super().__init__(anime_ids)
+        if self._order is not None:
+            matrix = np.asarray(matrix)[np.ix_(self._order, self._order)]
+        self.matrix = matrix
+        self.memory_mapped = isinstance(matrix, np.memmap)
+        self.nbytes = int(self.anime_ids.nbytes + matrix.nbytes)
+
+    def rows(self, base_ids):
+        """Candidate ids shared by all rows, and a rows x candidates similarity array."""
+        pos, _ = self._rows_of(base_ids)
+        # The matrix is symmetric, so contiguous rows stand in for columns.
+        return self.anime_ids, np.asarray(self.matrix[pos], dtype=np.float64)
+
+
+class NeighborIndex(AnimeRows):
+    """Serves the precomputed top-K neighbors of each anime (int32 ids, float32 similarities)."""
+
+    def __init__(self, anime_ids, neighbor_ids, similarities):
+        super().__init__(anime_ids)
+        if self._order is not None:
+            neighbor_ids, similarities = np.asarray(neighbor_ids)[self._order], np.asarray(similarities)[self._order]
+        self.neighbor_ids = neighbor_ids
+        self.similarities = similarities
+        self.k = self.neighbor_ids.shape[1]
+        self.memory_mapped = isinstance(neighbor_ids, np.memmap)
+        self.nbytes = int(self.anime_ids.nbytes + self.neighbor_ids.nbytes + self.similarities.nbytes)
+
+    def rows(self, base_ids):
+        """Per-row candidate ids and similarities (rows x K), NaN where a row has fewer than K."""
+        pos, _ = self._rows_of(base_ids)
+        return self.neighbor_ids[pos].astype(np.int64), self.similarities[pos].astype(np.float64)
+
+
+class FactorSimilarity(AnimeRows):
+    """Serves cosine similarities between low-rank item factors, computed per request row.
+
+    Rows cost O(anime x k) instead of storing an anime x anime matrix; the diagonal
+    is 1 like the correlation matrix's.
+    """
+
+    def __init__(self, anime_ids, item_factors):
+        super().__init__(anime_ids)
+        if self._order is not None:
+            item_factors = np.asarray(item_factors)[self._order]
+        self.item_factors = item_factors
+        norms = np.linalg.norm(np.asarray(item_factors, dtype=np.float64), axis=1)
+        self._inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        self.memory_mapped = isinstance(item_factors, np.memmap)
+        self.nbytes = int(self.anime_ids.nbytes + item_factors.nbytes + self._inverse_norms.nbytes)
+
+    def rows(self, base_ids):
+        """Candidate ids shared by all rows, and a rows x candidates cosine similarity array."""
+        pos, _ = self._rows_of(base_ids)
+        dots = (np.asarray(self.item_factors[pos]) @ self.item_factors.T).astype(np.float64)
+        return self.anime_ids, dots * self._inverse_norms[pos][:, None] * self._inverse_norms[None, :]
+
+    def scores(self, user_factors):
+        """Predicted rating offsets of every anime (columns) for each user factor row."""
+        return (np.atleast_2d(np.asarray(user_factors, dtype=np.float32)) @ self.item_factors.T).astype(np.float64)
+
+
+class IVFSimilarity(FactorSimilarity):
+    """Approximate `FactorSimilarity` rows from an inverted-file index over the item factors.
+
+    A query scores the `nprobe` lists whose centroids are closest to it and keeps
+    its `candidates` most similar items, returned like NeighborIndex rows (ids -1
+    and NaN where fewer were found). More probes raise recall and cost.
+    """
+
+    def __init__(self, anime_ids, item_factors, centroids, offsets, items, nprobe: int = 8, candidates: int = 200):
+        super().__init__(anime_ids, item_factors)
+        order = self._order if self._order is not None else np.arange(len(self.anime_ids))
+        new_position = np.empty(len(order), dtype=np.int64)
+        new_position[order] = np.arange(len(order))
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.items = new_position[np.asarray(items, dtype=np.int64)]
+        self.nprobe = max(1, min(nprobe, len(self.centroids)))
+        self.candidates = candidates
+        # Unit vectors grouped by list, so scanning a list reads one contiguous block.
+        self._list_vectors = (np.asarray(self.item_factors)[self.items]
+                              * self._inverse_norms[self.items][:, None]).astype(np.float32)
+        self.nbytes += int(self.centroids.nbytes + self.offsets.nbytes + self.items.nbytes
+                           + self._list_vectors.nbytes)
+
+    def probe(self, queries, nprobe: int = None):
+        """List numbers to scan for each unit-normalized query row, best first."""
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        scores = queries @ self.centroids.T
+        part = np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe]
+        return np.take_along_axis(part, np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1), axis=1)
+
+    def rows(self, base_ids, nprobe: int = None):
+        """Per-row candidate ids and approximate cosine similarities (rows x candidates)."""
+        pos, _ = self._rows_of(base_ids)
+        queries = (np.asarray(self.item_factors[pos]) * self._inverse_norms[pos][:, None]).astype(np.float32)
+        probes = self.probe(queries, nprobe)
+        k = min(self.candidates, len(self.anime_ids))
+        ids = np.full((len(pos), k), -1, dtype=np.int64)
+        sims = np.full((len(pos), k), np.nan)
+        for row, lists in enumerate(probes):
+            blocks = [slice(self.offsets[i], self.offsets[i + 1]) for i in lists]
+            cand = np.concatenate([self.items[b] for b in blocks])
+            cos = np.concatenate([self._list_vectors[b] for b in blocks]) @ queries[row]
+            if len(cand) > k:
+                top = np.argpartition(-cos, k - 1)[:k]
+                cand, cos = cand[top], cos[top]
+            ids[row, :len(cand)] = self.anime_ids[cand]
+            sims[row, :len(cand)] = cos
+        return ids, sims
+
+
+class UserFactors:
+    """Low-rank user factors of an "svd" version, looked up by user id."""
+
+    def __init__(self, user_ids, user_factors):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.user_factors = user_factors
+        self.nbytes = int(self.user_ids.nbytes + user_factors.nbytes)
+
+    def get(self, user_ids):
+        """(factor rows, found mask) for `user_ids`; rows of unknown users are zeros."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if len(self.user_ids) == 0:
+            return np.zeros((len(user_ids), self.user_factors.shape[1]), np.float32), np.zeros(len(user_ids), bool)
+        pos = np.minimum(np.searchsorted(self.user_ids, user_ids), len(self.user_ids) - 1)
+        found = self.user_ids[pos] == user_ids
+        rows = np.asarray(self.user_factors[pos], dtype=np.float32)
+        rows[~found] = 0
+        return rows, found
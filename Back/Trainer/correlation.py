@@ -0,0 +1,286 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+from tqdm import tqdm
+
+BLOCK_SIZE = int(os.getenv("TRAIN_BLOCK_SIZE", "512"))
+WORKERS = int(os.getenv("TRAIN_WORKERS", str(os.cpu_count() or 1)))
+
+_PARTS = ("values", "mask", "squares", "values_t", "mask_t", "squares_t")
+
+
+class RatingMatrix:
+    """Sparse users x anime rating matrix plus the transposes the pair statistics need."""
+
+    def __init__(self, user_ids, anime_ids, values: sparse.csr_matrix, parts: dict = None):
+        self.user_ids = user_ids
+        self.anime_ids = anime_ids
+        self.values = values
+        if parts is None:
+            mask = values.copy()
+            mask.data = np.ones_like(mask.data)
+            squares = values.multiply(values).tocsr()
+            parts = {
+                "mask": mask,
+                "squares": squares,
+                "values_t": values.T.tocsr(),
+                "mask_t": mask.T.tocsr(),
+                "squares_t": squares.T.tocsr(),
+            }
+        self.mask = parts["mask"]
+        self.squares = parts["squares"]
+        self.values_t = parts["values_t"]
+        self.mask_t = parts["mask_t"]
+        self.squares_t = parts["squares_t"]
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def save(self, directory: Path):
+        """Writes the CSR arrays as .npy files so worker processes can memory-map them."""
+        np.save(directory / "user_ids.npy", self.user_ids)
+        np.save(directory / "anime_ids.npy", self.anime_ids)
+        for name in _PARTS:
+            part = getattr(self, name)
+            np.save(directory / f"{name}.data.npy", part.data)
+            np.save(directory / f"{name}.indices.npy", part.indices)
+            np.save(directory / f"{name}.indptr.npy", part.indptr)
+            np.save(directory / f"{name}.shape.npy", np.asarray(part.shape))
+
+    @classmethod
+    def open(cls, directory: Path):
+        """Read-only view over a matrix written by `save`, shared through the page cache."""
+        parts = {}
+        for name in _PARTS:
+            arrays = [np.load(directory / f"{name}.{a}.npy", mmap_mode="r") for a in ("data", "indices", "indptr")]
+            shape = tuple(np.load(directory / f"{name}.shape.npy"))
+            parts[name] = sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+        return cls(
+            np.load(directory / "user_ids.npy", mmap_mode="r"),
+            np.load(directory / "anime_ids.npy", mmap_mode="r"),
+            parts.pop("values"),
+            parts,
+        )
+
+
+def build_rating_matrix(ratings: pd.DataFrame, anime_ids=None) -> RatingMatrix:
+    """Sparse equivalent of `ratings.pivot_table(index="user_id", columns="anime_id", values="rating")`.
+
+    With `anime_ids` the columns are fixed to that sorted id list and other anime are dropped.
+    """
+    if anime_ids is not None:
+        ratings = ratings[ratings["anime_id"].isin(anime_ids)]
+    # pivot_table averages duplicate (user, anime) rows, so do the same.
+    ratings = ratings.groupby(["user_id", "anime_id"], sort=False)["rating"].mean().reset_index()
+    users, user_idx = np.unique(ratings["user_id"].to_numpy(), return_inverse=True)
+    if anime_ids is None:
+        anime, anime_idx = np.unique(ratings["anime_id"].to_numpy(), return_inverse=True)
+    else:
+        anime = np.asarray(anime_ids)
+        anime_idx = np.searchsorted(anime, ratings["anime_id"].to_numpy())
+    values = sparse.csr_matrix(
+        (ratings["rating"].to_numpy(dtype=np.float64), (user_idx, anime_idx)),
+        shape=(len(users), len(anime)),
+    )
+    return RatingMatrix(users, anime, values)
+
+
+def pair_statistics(matrix: RatingMatrix, start: int, stop: int):
+    """Co-count and co-rated sums for every anime i against anime j in [start, stop).
+
+    Returns n, sum_x, sum_y, sum_xx, sum_yy, sum_xy as dense anime x block arrays,
+    where x is the rating of i and y the rating of j over users who rated both.
+    """
+    mask = matrix.mask[:, start:stop]
+    values = matrix.values[:, start:stop]
+    squares = matrix.squares[:, start:stop]
+    return (
+        (matrix.mask_t @ mask).toarray(),
+        (matrix.values_t @ mask).toarray(),
+        (matrix.mask_t @ values).toarray(),
+        (matrix.squares_t @ mask).toarray(),
+        (matrix.mask_t @ squares).toarray(),
+        (matrix.values_t @ values).toarray(),
+    )
+
+
+# Statistics kept per anime pair for incremental updates. sum_y, sum_yy are the
+# transposes of sum_x, sum_xx, so only four arrays are stored.
+STATISTICS = ("count", "sum", "sumsq", "cross")
+
+
+def sparse_pair_statistics(matrix: RatingMatrix):
+    """count, sum_x, sum_xx, sum_xy over all anime pairs as sparse anime x anime matrices.
+
+    Used for small user subsets, where only pairs co-rated by those users are non-zero.
+    """
+    return {
+        "count": (matrix.mask_t @ matrix.mask).tocoo(),
+        "sum": (matrix.values_t @ matrix.mask).tocoo(),
+        "sumsq": (matrix.squares_t @ matrix.mask).tocoo(),
+        "cross": (matrix.values_t @ matrix.values).tocoo(),
+    }
+
+
+def pearson_from_statistics(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy, min_periods=10):
+    """Pairwise-complete Pearson correlation, NaN below `min_periods` or for constant ratings."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x * sum_x / n
+        var_y = sum_yy - sum_y * sum_y / n
+        # Guard against cancellation leaving tiny non-zero variances for constant ratings.
+        constant = (var_x <= 1e-10 * sum_xx) | (var_y <= 1e-10 * sum_yy)
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(n < min_periods) | constant] = np.nan
+    return np.clip(corr, -1.0, 1.0, out=corr)
+
+
+def _set_diagonal(corr, start, stop):
+    # Exact 1.0 on the diagonal, as DataFrame.corr reports it.
+    cols = np.arange(start, stop)
+    diag = corr[cols, cols - start]
+    corr[cols, cols - start] = np.where(np.isnan(diag), np.nan, 1.0)
+    return corr
+
+
+def pearson_block(matrix: RatingMatrix, start: int, stop: int, min_periods=10, statistics=None):
+    """Correlation columns [start, stop); also stores the pair statistics into `statistics` if given."""
+    n, sum_x, sum_y, sum_xx, sum_yy, sum_xy = pair_statistics(matrix, start, stop)
+    if statistics is not None:
+        for name, block in zip(STATISTICS, (n, sum_x, sum_xx, sum_xy)):
+            statistics[name][:, start:stop] = block
+    corr = pearson_from_statistics(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy, min_periods=min_periods)
+    return _set_diagonal(corr, start, stop)
+
+
+def pearson_from_statistic_arrays(statistics, start: int, stop: int, min_periods=10, deltas=None):
+    """Correlation columns [start, stop) from stored (possibly memory-mapped) pair statistics.
+
+    `deltas`, if given, are sparse changes added on top of the stored arrays.
+    """
+    def columns(name):
+        block = np.asarray(statistics[name][:, start:stop], dtype=np.float64)
+        return block if deltas is None else block + deltas[name][:, start:stop].toarray()
+
+    def rows(name):
+        block = np.asarray(statistics[name][start:stop, :], dtype=np.float64)
+        return (block if deltas is None else block + deltas[name][start:stop, :].toarray()).T
+
+    n, sum_x, sum_xx, sum_xy = columns("count"), columns("sum"), columns("sumsq"), columns("cross")
+    sum_y, sum_yy = rows("sum"), rows("sumsq")
+    corr = pearson_from_statistics(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy, min_periods=min_periods)
+    return _set_diagonal(corr, start, stop)
+
+
+def create_statistics(directory: Path, n_anime: int):
+    """Allocates the pair statistic arrays as .npy memmaps in `directory`."""
+    directory.mkdir(parents=True, exist_ok=True)
+    return {
+        name: np.lib.format.open_memmap(directory / f"{name}.npy", mode="w+",
+                                        dtype=np.int32 if name == "count" else np.float64,
+                                        shape=(n_anime, n_anime))
+        for name in STATISTICS
+    }
+
+
+def open_statistics(directory: Path, mode: str = "r"):
+    return {name: np.load(Path(directory) / f"{name}.npy", mmap_mode=mode) for name in STATISTICS}
+
+
+def link_statistics(source: Path, target: Path):
+    """Shares the dense statistic arrays of `source` with `target` through hard links.
+
+    The arrays are never written after training; incremental updates keep their
+    changes in sparse deltas instead. Falls back to copying where links are unsupported.
+    """
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    for name in STATISTICS:
+        try:
+            os.link(Path(source) / f"{name}.npy", target / f"{name}.npy")
+        except OSError:
+            shutil.copy2(Path(source) / f"{name}.npy", target / f"{name}.npy")
+
+
+def open_statistic_deltas(directory: Path, n_anime: int):
+    """Sparse changes to the dense statistics accumulated by incremental updates (empty after training)."""
+    directory = Path(directory)
+    if not (directory / "delta_count.npz").exists():
+        return {name: sparse.csr_matrix((n_anime, n_anime)) for name in STATISTICS}
+    return {name: sparse.load_npz(directory / f"delta_{name}.npz").tocsr() for name in STATISTICS}
+
+
+def save_statistic_deltas(directory: Path, deltas: dict):
+    for name in STATISTICS:
+        sparse.save_npz(Path(directory) / f"delta_{name}.npz", deltas[name].tocsr())
+
+
+def _pearson_worker(directory: str, start: int, stop: int, min_periods: int, statistics_dir: str = None):
+    directory = Path(directory)
+    matrix = RatingMatrix.open(directory)
+    statistics = open_statistics(statistics_dir, "r+") if statistics_dir else None
+    out = np.load(directory / "corr.npy", mmap_mode="r+")
+    out[:, start:stop] = pearson_block(matrix, start, stop, min_periods, statistics)
+    out.flush()
+    if statistics is not None:
+        for array in statistics.values():
+            array.flush()
+    return stop - start
+
+
+def pearson_corr(matrix: RatingMatrix, min_periods=10, block_size: int = BLOCK_SIZE,
+                 n_jobs: int = WORKERS, progress=None, statistics_dir: Path = None) -> pd.DataFrame:
+    """Item-item Pearson correlation computed in column blocks of `block_size` anime.
+
+    Matches `pivot.corr(method="pearson", min_periods=min_periods)` while only
+    materializing anime x block_size intermediates. With `n_jobs > 1` the blocks
+    run in a process pool; workers memory-map the rating matrix and write their
+    columns straight into a shared output file. `progress(done, total)` is called
+    as blocks finish. With `statistics_dir` the per-pair sufficient statistics are
+    written there too, for later incremental updates.
+    """
+    n_anime = matrix.shape[1]
+    blocks = [(start, min(start + block_size, n_anime)) for start in range(0, n_anime, block_size)]
+    bar = tqdm(total=len(blocks), desc="correlation", unit="block")
+    statistics = create_statistics(Path(statistics_dir), n_anime) if statistics_dir else None
+
+    def advance(done):
+        bar.update(1)
+        if progress is not None:
+            progress(done, len(blocks))
+
+    if n_jobs == 1 or len(blocks) == 1:
+        corr = np.empty((n_anime, n_anime), dtype=np.float64)
+        for done, (start, stop) in enumerate(blocks, 1):
+            corr[:, start:stop] = pearson_block(matrix, start, stop, min_periods, statistics)
+            advance(done)
+    else:
+        with tempfile.TemporaryDirectory(prefix="anime_corr_") as directory:
+            matrix.save(Path(directory))
+            np.lib.format.open_memmap(Path(directory) / "corr.npy", mode="w+", dtype=np.float64,
+                                      shape=(n_anime, n_anime)).flush()
+            if statistics is not None:
+                for array in statistics.values():
+                    array.flush()
+            results = Parallel(n_jobs=n_jobs, return_as="generator_unordered")(
+                delayed(_pearson_worker)(directory, start, stop, min_periods,
+                                         str(statistics_dir) if statistics_dir else None)
+                for start, stop in blocks
+            )
+            for done, _ in enumerate(results, 1):
+                advance(done)
+            corr = np.load(Path(directory) / "corr.npy")
+    bar.close()
+    if statistics is not None:
+        for array in statistics.values():
+            array.flush()
+
+    index = pd.Index(matrix.anime_ids, name="anime_id")
+    return pd.DataFrame(corr, index=index, columns=index.copy())
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+from Back.Trainer.correlation import RatingMatrix
+
+FACTORS = int(os.getenv("MODEL_FACTORS", "64"))
+SVD_ITERATIONS = int(os.getenv("MODEL_SVD_ITERATIONS", "7"))
+
+
+def train_factors(matrix: RatingMatrix, k: int = FACTORS, n_iter: int = SVD_ITERATIONS, seed: int = 0):
+    """Rank-k truncated SVD of the user-mean-centred sparse rating matrix.
+
+    With X ~ U S Vt, returns user factors U*S (users x k) and item factors V
+    (anime x k) as float32, so a user's predicted offsets from their mean rating
+    are `user_factors[u] @ item_factors.T`. Unrated cells stay implicit zeros.
+    """
+    values = matrix.values.astype(np.float64)
+    n_users, n_anime = values.shape
+    counts = np.diff(values.indptr)
+    rows = np.repeat(np.arange(n_users), counts)
+    sums = np.bincount(rows, weights=values.data, minlength=n_users)
+    means = np.divide(sums, counts, out=np.zeros(n_users), where=counts > 0)
+    centred = values.copy()
+    centred.data -= means[rows]
+
+    k = min(k, n_users - 1, n_anime - 1)
+    if k < 1:
+        return np.zeros((n_users, 0), np.float32), np.zeros((n_anime, 0), np.float32)
+    svd = TruncatedSVD(n_components=k, n_iter=n_iter, random_state=seed)
+    user_factors = svd.fit_transform(centred)
+    return user_factors.astype(np.float32), svd.components_.T.astype(np.float32)
@@ -0,0 +1,119 @@
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from Back.Data import model_store
+from Back.Data.animeDAO import AnimeDAO
+from Back.Data.genres import GenreFeatures
+from Back.Data.versions import ModelVersions
+from Back.Trainer.correlation import (
+    BLOCK_SIZE,
+    build_rating_matrix,
+    link_statistics,
+    open_statistic_deltas,
+    open_statistics,
+    pearson_from_statistic_arrays,
+    save_statistic_deltas,
+    sparse_pair_statistics,
+)
+from Back.Trainer.neighbors import build_neighbor_index
+from Back.Trainer.status import run_with_status, set_status
+from Back.Trainer.trainer import TOP_K
+
+dao = AnimeDAO()
+versions = ModelVersions(dao)
+MIN_USER_RATINGS = 200
+
+
+def update_model(top_k: int = TOP_K):
+    """Folds ratings added since the active version into a new version without a full retrain."""
+    return run_with_status("incremental", _update, top_k)
+
+
+def _user_contribution(history: pd.DataFrame, anime_ids):
+    """Pair statistics contributed by the users in `history`, with the full-training filters.
+
+    Returns (statistics, number of active users); statistics is None when nothing counts.
+    """
+    counts = history.groupby("user_id").size()
+    active = counts[counts >= MIN_USER_RATINGS].index
+    rows = history[history["user_id"].isin(active) & (history["rating"] != -1)]
+    if rows.empty:
+        return None, len(active)
+    return sparse_pair_statistics(build_rating_matrix(rows, anime_ids)), len(active)
+
+
+def _update(top_k):
+    base_version = dao.get_current_model_version()
+    if base_version == "none":
+        raise ValueError("No model to update, run a full training first")
+    artifact = model_store.open_model(base_version, load_similarity=False)
+    if artifact is not None and artifact.engine != "correlation":
+        raise ValueError(f"Version {base_version} uses the {artifact.engine} engine, retrain it instead")
+    base_statistics = model_store.statistics_dir(base_version)
+    watermark = dao.get_model_watermark(base_version)
+    if base_statistics is None or watermark is None:
+        raise ValueError(f"Version {base_version} has no pair statistics or watermark, run a full training first")
+
+    anime_ids = np.asarray(artifact.anime_ids, dtype=np.int64)
+
+    new_watermark = dao.get_ratings_watermark()
+    delta = dao.load_ratings_since(watermark, new_watermark)
+    if delta.empty:
+        set_status(version=base_version)
+        return {**artifact.meta, "version": base_version, "base_version": base_version, "delta_ratings": 0}
+
+    # A user's contribution depends on their whole history (activity filter, re-rated
+    # titles), so swap each affected user's ratings as of the old watermark for the new ones.
+    set_status(stage="statistics")
+    users = delta["user_id"].unique()
+    before, active_before = _user_contribution(dao.load_ratings_for_users(users, watermark), anime_ids)
+    after, active_after = _user_contribution(dao.load_ratings_for_users(users, new_watermark), anime_ids)
+
+    version = datetime.now().strftime("v%Y%m%d_%H%M%S")
+    staging = Path(model_store.MODEL_DIR) / f"{version}.statistics"
+    n_anime = len(anime_ids)
+    try:
+        # The base's dense arrays are shared, not copied; the changes go into sparse deltas.
+        link_statistics(base_statistics, staging)
+        statistics = open_statistics(staging)
+        deltas = open_statistic_deltas(base_statistics, n_anime)
+        for contribution, sign in ((before, -1), (after, 1)):
+            if contribution is None:
+                continue
+            for name, pairs in contribution.items():
+                deltas[name] = deltas[name] + sign * pairs.tocsr()
+        save_statistic_deltas(staging, deltas)
+
+        set_status(stage="correlation")
+        blocks = range(0, n_anime, BLOCK_SIZE)
+        corr = np.empty((n_anime, n_anime), dtype=np.float64)
+        for done, start in enumerate(blocks, 1):
+            stop = min(start + BLOCK_SIZE, n_anime)
+            corr[:, start:stop] = pearson_from_statistic_arrays(statistics, start, stop, deltas=deltas)
+            set_status(blocks_done=done, blocks_total=len(blocks))
+
+        set_status(stage="saving")
+        index = pd.Index(anime_ids, name="anime_id")
+        _, neighbor_ids, similarities = build_neighbor_index(pd.DataFrame(corr, index=index, columns=index), top_k)
+        meta = {
+            **artifact.meta,
+            "num_users": artifact.meta.get("num_users", 0) + active_after - active_before,
+            "top_k": neighbor_ids.shape[1],
+            "ratings_watermark": new_watermark,
+            "base_version": base_version,
+            "delta_ratings": len(delta),
+            "delta_users": len(users),
+        }
+        genres = GenreFeatures.from_anime(dao.load_anime())
+        model_store.write_model(version, anime_ids, corr, neighbor_ids, similarities, meta, statistics_dir=staging,
+                                genres=genres)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    versions.register(version, new_watermark)
+    set_status(version=version)
+    return {**meta, "version": version}
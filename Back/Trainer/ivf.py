@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+
+ANN_LISTS = int(os.getenv("MODEL_ANN_LISTS", "0"))
+ANN_ITERATIONS = int(os.getenv("MODEL_ANN_ITERATIONS", "20"))
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def build_ivf(item_factors, n_lists: int = ANN_LISTS, n_iter: int = ANN_ITERATIONS, seed: int = 0):
+    """Inverted-file index over the item factors for cosine similarity.
+
+    Spherical k-means splits the unit-normalized items into `n_lists` lists
+    (about sqrt(items) when 0). Returns float32 centroids (lists x k) and the CSR
+    lists: item positions of list i are `items[offsets[i]:offsets[i + 1]]`.
+    """
+    vectors = normalize_rows(item_factors)
+    n_items = len(vectors)
+    if n_lists <= 0:
+        n_lists = int(round(np.sqrt(n_items)))
+    n_lists = max(1, min(n_lists, n_items))
+
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(n_items, n_lists, replace=False)] if n_items else vectors[:0]
+    assignment = np.zeros(n_items, dtype=np.int64)
+    for _ in range(n_iter if n_items else 0):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.bincount(assignment, minlength=n_lists) == 0
+        # Reseed empty lists with random items so every list keeps a share of the catalog.
+        sums[empty] = vectors[rng.choice(n_items, int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    if n_items:
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+
+    items = np.argsort(assignment, kind="stable").astype(np.int32)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assignment, minlength=n_lists))
+    return centroids.astype(np.float32), offsets, items
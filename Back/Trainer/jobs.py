@@ -0,0 +1,103 @@
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+
+class TrainingJob:
+    """One background training run."""
+
+    def __init__(self, kind: str = "full"):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = None
+        self.meta = None
+        self.error = None
+
+    def to_dict(self, progress=None):
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(end - self.started_at, 2) if self.started_at else 0.0,
+            "progress": progress,
+            "version": self.version,
+            "meta": self.meta,
+            "error": self.error,
+        }
+
+
+class TrainingJobManager:
+    """Runs training in a background thread, one job at a time.
+
+    Submitting while a job is queued or running returns that job instead of
+    starting a duplicate. Training functions return their meta, including the
+    `version` they saved. `on_publish(version)` runs in the job thread once the
+    new version is saved, so the serving side swaps it in without a request
+    paying for the load.
+    """
+
+    def __init__(self, train, progress=None, on_publish=None, history: int = 20, extra=None):
+        self._trainers = {"full": train, **(extra or {})}
+        self._progress = progress
+        self._on_publish = on_publish
+        self._history = history
+        self._jobs = OrderedDict()
+        self._active = None
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str = "full"):
+        """Returns (job, created); `created` is False when an active job was reused.
+
+        `kind` picks the training function ("full" or any registered in `extra`).
+        """
+        with self._lock:
+            if self._active is not None:
+                return self._active, False
+            job = TrainingJob(kind)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._history:
+                self._jobs.popitem(last=False)
+            self._active = job
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        return job, True
+
+    @property
+    def active(self):
+        """The queued or running job, or None."""
+        return self._active
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def status(self, job: TrainingJob):
+        progress = self._progress() if self._progress is not None and job.state == "running" else None
+        return job.to_dict(progress)
+
+    def _run(self, job: TrainingJob):
+        job.state = "running"
+        job.started_at = time.time()
+        try:
+            job.meta = self._trainers[job.kind]()
+            # The version this job saved, even if another one became active meanwhile.
+            job.version = job.meta["version"]
+            if self._on_publish is not None:
+                self._on_publish(job.version)
+            job.state = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active = None
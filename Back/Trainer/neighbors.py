@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+
+def build_neighbor_index(corr: pd.DataFrame, k: int, block_size: int = 1024):
+    """Top-`k` most correlated anime per column as int32 ids and float32 similarities.
+
+    Rows with fewer than `k` correlated anime are padded with id -1 and NaN.
+    """
+    anime_ids = corr.columns.to_numpy(dtype=np.int64)
+    values = corr.to_numpy()
+    n = len(anime_ids)
+    k = min(k, n)
+
+    neighbor_ids = np.full((n, k), -1, dtype=np.int32)
+    similarities = np.full((n, k), np.nan, dtype=np.float32)
+    for start in range(0, n, block_size):
+        block = values[:, start:start + block_size].T
+        scores = np.where(np.isnan(block), -np.inf, block)
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        idx = np.take_along_axis(part, order, axis=1)
+        sims = np.take_along_axis(part_scores, order, axis=1)
+        found = np.isfinite(sims)
+        neighbor_ids[start:start + block_size] = np.where(found, anime_ids[idx], -1)
+        similarities[start:start + block_size] = np.where(found, sims, np.nan)
+
+    return anime_ids.astype(np.int32), neighbor_ids, similarities
@@ -15,6 +15,29 @@ def clean_data(anime: pd.DataFrame, ratings: pd.DataFrame) -> pd.DataFrame:
     return ratings
 
 
+def load_clean_ratings(dao, max_id: int = None, min_user_ratings: int = 200, min_anime_ratings: int = 50):
+    """Same result as `clean_data` on the full table, built from streamed chunks.
+
+    Active users are counted in SQL, each chunk keeps only their rows and drops
+    unrated (-1) rows after counting them, and the anime filter runs once at the end.
+    """
+    active_users = dao.load_active_users(min_user_ratings, max_id)
+    anime_counts = None
+    kept = []
+    for chunk in dao.iter_ratings(max_id=max_id):
+        chunk = chunk[chunk["user_id"].isin(active_users)]
+        # clean_data counts anime popularity before dropping -1 ratings.
+        counts = chunk["anime_id"].value_counts()
+        anime_counts = counts if anime_counts is None else anime_counts.add(counts, fill_value=0)
+        kept.append(chunk[chunk["rating"] != -1])
+
+    if not kept:
+        return pd.DataFrame(columns=["user_id", "anime_id", "rating"])
+    ratings = pd.concat(kept, ignore_index=True)
+    popular_anime = anime_counts[anime_counts >= min_anime_ratings].index
+    return ratings[ratings["anime_id"].isin(popular_anime)]
+
+
 def create_pivot_table(ratings: pd.DataFrame) -> pd.DataFrame:
     """Pivot user-anime ratings into a user-item matrix."""
     return ratings.pivot_table(index="user_id", columns="anime_id", values="rating")
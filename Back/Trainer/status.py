@@ -0,0 +1,33 @@
+import threading
+import time
+
+_lock = threading.Lock()
+_status = {"state": "idle"}
+
+
+def get_training_status():
+    """Stage and block progress of the current (or last) training run."""
+    with _lock:
+        status = dict(_status)
+    if status.get("started_at"):
+        status["elapsed_seconds"] = round((status.get("finished_at") or time.time()) - status["started_at"], 2)
+    return status
+
+
+def set_status(**fields):
+    with _lock:
+        _status.update(fields)
+
+
+def run_with_status(kind: str, func, *args, **kwargs):
+    """Runs a training function, recording start, failure and completion."""
+    with _lock:
+        _status.clear()
+        _status.update(state="running", kind=kind, stage="loading", started_at=time.time(), finished_at=None)
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        set_status(state="failed", error=str(e), finished_at=time.time())
+        raise
+    set_status(state="done", stage="done", finished_at=time.time())
+    return result
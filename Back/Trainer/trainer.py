@@ -1,48 +1,101 @@
-import pandas as pd
 import os
-import pickle
+import shutil
 from datetime import datetime
 from pathlib import Path
+from Back.Data import model_store
 from Back.Data.animeDAO import AnimeDAO
+from Back.Data.genres import GenreFeatures
+from Back.Data.versions import ModelVersions
+from Back.Trainer.correlation import WORKERS, build_rating_matrix, pearson_corr
+from Back.Trainer.factors import FACTORS, train_factors
+from Back.Trainer.ivf import build_ivf
+from Back.Trainer.neighbors import build_neighbor_index
+from Back.Trainer.preprocess import load_clean_ratings
+from Back.Trainer.status import run_with_status, set_status
+from Back.telemetry import span
 
 dao = AnimeDAO()
+versions = ModelVersions(dao)
+TOP_K = int(os.getenv("MODEL_TOPK", "200"))
+# Dense anime x anime pair statistics (about 28 bytes per pair) that incremental updates need.
+KEEP_STATISTICS = os.getenv("MODEL_KEEP_STATISTICS", "0") == "1"
+ENGINE = os.getenv("MODEL_ENGINE", "correlation")
 
 
-def train_model():
-    anime = dao.load_anime()
-    ratings_raw = dao.load_ratings()
+def train_model(top_k: int = TOP_K, n_jobs: int = None, engine: str = None):
+    """Trains a new version with `engine` ("correlation" or "svd", MODEL_ENGINE by default)."""
+    engine = engine or ENGINE
+    if engine not in model_store.ENGINES:
+        raise ValueError(f"Unknown model engine {engine!r}, expected one of {', '.join(model_store.ENGINES)}")
+    if engine == "svd":
+        return run_with_status("svd", _train_factors, FACTORS)
+    return run_with_status("full", _train, top_k, n_jobs)
 
-    ratings_raw = ratings_raw.rename(columns={
-        "user_id": "user_id",
-        "anime_id": "anime_id",
-        "rating": "rating"
-    })
 
-    user_counts = ratings_raw["user_id"].value_counts()
-    active_users = user_counts[user_counts >= 200].index
-    ratings = ratings_raw[ratings_raw["user_id"].isin(active_users)]
+def _train_factors(k):
+    watermark = dao.get_ratings_watermark()
+    with span("train.load_ratings"):
+        ratings = load_clean_ratings(dao, max_id=watermark)
 
-    anime_counts = ratings["anime_id"].value_counts()
-    popular_anime = anime_counts[anime_counts >= 50].index
-    ratings = ratings[ratings["anime_id"].isin(popular_anime)]
-    ratings = ratings[ratings["rating"] != -1]
+    version = datetime.now().strftime("v%Y%m%d_%H%M%S")
+    set_status(stage="factors")
+    with span("train.build_matrix"):
+        rating_matrix = build_rating_matrix(ratings)
+    with span("train.factors"):
+        user_factors, item_factors = train_factors(rating_matrix, k)
+    with span("train.ann_index"):
+        ivf = build_ivf(item_factors)
 
-    base_dir = Path("Back/Model")
-    base_dir.mkdir(parents=True, exist_ok=True)
+    set_status(stage="saving")
+    with span("train.genres"):
+        genres = GenreFeatures.from_anime(dao.load_anime())
+    meta = {"engine": "svd", "num_users": rating_matrix.shape[0], "num_anime": rating_matrix.shape[1],
+            "factors": item_factors.shape[1], "ivf_lists": len(ivf[0]), "ratings_watermark": watermark}
+    with span("train.write"):
+        model_store.write_factors(version, rating_matrix.anime_ids, item_factors, rating_matrix.user_ids,
+                                  user_factors, meta, genres=genres, ivf=ivf)
+
+    versions.register(version, watermark)
+    set_status(version=version)
+    return {**meta, "version": version}
 
-    version = datetime.now().strftime("v%Y%m%d_%H%M%S")
-    corr_path = base_dir / f"anime_corr_matrix_{version}.pkl"
-    meta_path = base_dir / f"anime_corr_meta_{version}.pkl"
 
-    anime_pivot = ratings.pivot_table(index="user_id", columns="anime_id", values="rating")
-    anime_corr_matrix = anime_pivot.corr(method="pearson", min_periods=10)
+def _train(top_k, n_jobs):
+    # Everything up to the watermark goes into this version; later rows are the next delta.
+    watermark = dao.get_ratings_watermark()
+    with span("train.load_ratings"):
+        ratings = load_clean_ratings(dao, max_id=watermark)
+
+    version = datetime.now().strftime("v%Y%m%d_%H%M%S")
 
-    with open(corr_path, "wb") as f:
-        pickle.dump(anime_corr_matrix, f)
+    set_status(stage="correlation")
+    statistics_dir = Path(model_store.MODEL_DIR) / f"{version}.statistics" if KEEP_STATISTICS else None
+    with span("train.build_matrix"):
+        rating_matrix = build_rating_matrix(ratings)
+    try:
+        with span("train.correlation"):
+            anime_corr_matrix = pearson_corr(
+                rating_matrix,
+                min_periods=10,
+                n_jobs=n_jobs or WORKERS,
+                progress=lambda done, total: set_status(blocks_done=done, blocks_total=total),
+                statistics_dir=statistics_dir,
+            )
 
-    meta = {"num_users": anime_pivot.shape[0], "num_anime": anime_pivot.shape[1]}
-    with open(meta_path, "wb") as f:
-        pickle.dump(meta, f)
+        set_status(stage="saving")
+        with span("train.neighbors"):
+            anime_ids, neighbor_ids, similarities = build_neighbor_index(anime_corr_matrix, top_k)
+        with span("train.genres"):
+            genres = GenreFeatures.from_anime(dao.load_anime())
+        meta = {"num_users": rating_matrix.shape[0], "num_anime": rating_matrix.shape[1], "top_k": neighbor_ids.shape[1],
+                "ratings_watermark": watermark}
+        with span("train.write"):
+            model_store.write_model(version, anime_ids, anime_corr_matrix.to_numpy(), neighbor_ids, similarities,
+                                    meta, statistics_dir=statistics_dir, genres=genres)
+    finally:
+        if statistics_dir is not None:
+            shutil.rmtree(statistics_dir, ignore_errors=True)
 
-    dao.save_model_version(version)
-    return meta
+    versions.register(version, watermark)
+    set_status(version=version)
+    return {**meta, "version": version}
@@ -0,0 +1,146 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "")
+
+
+class LocalBackend:
+    """In-process LRU store of serialized values with per-entry expiry and a byte budget."""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key: str, data: bytes, ttl_seconds: float):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl_seconds, data)
+            self.nbytes += len(data)
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {"backend": "local", "entries": len(self._entries), "bytes": self.nbytes,
+                "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+    def _remove(self, key):
+        _, data = self._entries.pop(key)
+        self.nbytes -= len(data)
+
+
+class RedisBackend:
+    """Shared store across API workers; needs the optional `redis` package.
+
+    Memory is bounded by the server's maxmemory/LRU policy rather than here.
+    `client` replaces the connection made from `url` (e.g. a stand-in in tests).
+    """
+
+    def __init__(self, url: str = None, namespace: str = "anime-rec:", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("RESPONSE_CACHE_URL is set but the redis package is not installed") from e
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._namespace = namespace
+
+    def get(self, key: str):
+        return self._client.get(self._namespace + key)
+
+    def set(self, key: str, data: bytes, ttl_seconds: float):
+        self._client.set(self._namespace + key, data, px=int(ttl_seconds * 1000))
+
+    def delete_prefix(self, prefix: str):
+        keys = list(self._client.scan_iter(match=self._namespace + prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix("")
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+def make_backend(url: str = CACHE_URL):
+    return RedisBackend(url) if url else LocalBackend()
+
+
+class ResponseCache:
+    """Read-through cache of endpoint responses.
+
+    Keys are `endpoint:subject:version:params`, so a newly published version never
+    serves old entries; `invalidate_user` drops one user's entries after new ratings.
+    """
+
+    def __init__(self, backend=None, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.backend = backend if backend is not None else make_backend()
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(endpoint: str, subject, version: str, **params):
+        params = ",".join(f"{name}={params[name]}" for name in sorted(params))
+        return f"{endpoint}:{subject}:{version}:{params}"
+
+    def get_or_compute(self, key: str, compute):
+        data = self.backend.get(key)
+        if data is not None:
+            self.hits += 1
+            return pickle.loads(data)
+        self.misses += 1
+        value = compute()
+        self.backend.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), self.ttl_seconds)
+        return value
+
+    def invalidate_user(self, user_id: int):
+        self.backend.delete_prefix(f"recommend_user:{int(user_id)}:")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+            **self.backend.stats(),
+        }
@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+CPU_WORKERS = int(os.getenv("API_CPU_WORKERS", str(os.cpu_count() or 1)))
+IO_WORKERS = int(os.getenv("API_IO_WORKERS", "8"))
+AUTH_WORKERS = int(os.getenv("API_AUTH_WORKERS", "2"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("API_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# Scoring (NumPy) and bcrypt release the GIL, so threads give real parallelism here while
+# sharing the resident model; separate pools keep one kind of work from starving another.
+cpu_executor = ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix="api-cpu")
+io_executor = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="api-io")
+auth_executor = ThreadPoolExecutor(AUTH_WORKERS, thread_name_prefix="api-auth")
+
+
+class Bulkhead:
+    """Caps concurrent calls of one endpoint group and rejects with 429 when its queue is full.
+
+    At most `max_concurrent` calls run in `executor`; up to `max_waiting` more wait
+    for a slot for `timeout` seconds. Anything beyond is refused instead of queued.
+    """
+
+    def __init__(self, name: str, executor, max_concurrent: int, max_waiting: int,
+                 timeout: float = QUEUE_TIMEOUT_SECONDS):
+        prefix = f"API_{name.upper()}"
+        self.name = name
+        self.max_concurrent = int(os.getenv(f"{prefix}_CONCURRENCY", str(max_concurrent)))
+        self.max_waiting = int(os.getenv(f"{prefix}_QUEUE", str(max_waiting)))
+        self.timeout = timeout
+        self._executor = executor
+        # Created on first use inside the serving loop: on Python 3.9 asyncio primitives
+        # bind to the loop current at construction, and these objects are built at import.
+        self._slots = None
+        self._loop = None
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, func, *args, **kwargs):
+        # Counted before the first await, so a burst cannot all slip past the check.
+        if self.running + self.waiting >= self.max_concurrent + self.max_waiting:
+            self._reject()
+        slots = self._semaphore()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._reject()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the request context so timing spans reach the request.
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(functools.partial(context.run, func, *args, **kwargs))
+        except BaseException:
+            self._finished(slots)
+            raise
+        # The slot is freed when the call finishes, not when the request does: a cancelled
+        # request (client gone) leaves its call running in the executor.
+        future.add_done_callback(lambda _: self._finished_threadsafe(loop, slots))
+        return await asyncio.wrap_future(future)
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._slots, self._loop = asyncio.Semaphore(self.max_concurrent), loop
+        return self._slots
+
+    def _finished(self, slots):
+        self.running -= 1
+        self.completed += 1
+        slots.release()
+
+    def _finished_threadsafe(self, loop, slots):
+        try:
+            loop.call_soon_threadsafe(self._finished, slots)
+        except RuntimeError:
+            # The loop closed (shutdown); nothing is waiting for the slot any more.
+            pass
+
+    def _reject(self):
+        self.rejected += 1
+        raise HTTPException(status_code=429, detail=f"Too many concurrent {self.name} requests",
+                            headers={"Retry-After": "1"})
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+recommend_limit = Bulkhead("recommend", cpu_executor, CPU_WORKERS, 4 * CPU_WORKERS)
+auth_limit = Bulkhead("auth", auth_executor, AUTH_WORKERS, 8 * AUTH_WORKERS)
+db_limit = Bulkhead("db", io_executor, IO_WORKERS, 4 * IO_WORKERS)
+
+BULKHEADS = (recommend_limit, auth_limit, db_limit)
+
+
+def status():
+    return {bulkhead.name: bulkhead.stats() for bulkhead in BULKHEADS}
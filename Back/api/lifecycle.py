@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+import traceback
+
+WARMUP_RETRY_SECONDS = float(os.getenv("API_WARMUP_RETRY_SECONDS", "5"))
+
+
+class Warmup:
+    """Runs startup steps in a background thread and tracks readiness.
+
+    Each step is a (name, callable) pair run in order. A failing step (e.g. the
+    database is not up yet) is retried every `retry_seconds` until it succeeds
+    or `stop()` is called; the API stays live but not ready meanwhile.
+    """
+
+    def __init__(self, steps, retry_seconds: float = WARMUP_RETRY_SECONDS):
+        self._steps = steps
+        self._retry_seconds = retry_seconds
+        self._stop = threading.Event()
+        self.stage = "pending"
+        self.error = None
+        self.attempts = 0
+        self.started_at = None
+        self.ready_at = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def start(self):
+        self.started_at = time.time()
+        threading.Thread(target=self._run, name="api-warmup", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        for name, step in self._steps:
+            self.stage = name
+            while not self._stop.is_set():
+                self.attempts += 1
+                try:
+                    step()
+                    self.error = None
+                    break
+                except Exception as e:
+                    traceback.print_exc()
+                    self.error = f"{name}: {e}"
+                    self._stop.wait(self._retry_seconds)
+            if self._stop.is_set():
+                return
+        self.stage = "ready"
+        self.ready_at = time.time()
+
+    def status(self):
+        return {
+            "status": "ready" if self.ready else "starting",
+            "stage": self.stage,
+            "error": self.error,
+            "attempts": self.attempts,
+            "warmup_seconds": round((self.ready_at or time.time()) - self.started_at, 3) if self.started_at else None,
+        }
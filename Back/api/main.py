@@ -1,21 +1,209 @@
 # main.py (API backend) — MySQL ready
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import functools
+import json
+import os
+import random
+import time
 import traceback
 
+from Back import telemetry
+
+from Back.Data import database
 from Back.Data.animeDAO import AnimeDAO
+from Back.Data.model_store import ENGINES
+from Back.Data.rating_writer import RatingWriter, invalid_ratings
 from Back.Data.userDAO import UserDAO
-from Back.Trainer.trainer import train_model
+from Back.Data.versions import ModelVersions
+from Back.api import concurrency
+from Back.api.cache import ResponseCache
+from Back.api.concurrency import auth_limit, db_limit, recommend_limit
+from Back.api.lifecycle import Warmup
+from Back.Trainer.jobs import TrainingJobManager
+from Back.Trainer.status import get_training_status
+from Back.telemetry import span
 from Back.Recommendator.recommender import (
+    BATCH_CHUNK_SIZE,
+    RecommendationBatch,
     get_user_watched,
     get_similar_anime,
     get_user_recommendations,
+    invalidate_users,
+    materialize_in_background,
+    stop_materializing,
+    registry as model_registry,
+    catalog,
 )
 
-app = FastAPI(title="Anime Recommendation API")
 anime_dao = AnimeDAO()
 user_dao = UserDAO()
+model_versions = ModelVersions(anime_dao)
+response_cache = ResponseCache()
+SERVER_TIMING = os.getenv("API_SERVER_TIMING", "0") == "1"
+BATCH_MAX_IDS = int(os.getenv("API_BATCH_MAX_IDS", "100000"))
+# Start an incremental update once this many ratings were written after the active version (0: never).
+RATINGS_UPDATE_THRESHOLD = int(os.getenv("RATINGS_UPDATE_THRESHOLD", "0"))
+
+
+def warm_catalog():
+    catalog.get().warm_search()
+
+
+# The active model and catalog load in the background; /health/ready reports when done.
+warmup = Warmup([
+    ("schema", anime_dao.ensure_schema),
+    ("versions", model_versions.sync_pointer),
+    ("model", model_registry.refresh),
+    ("catalog", warm_catalog),
+])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup.start()
+    rating_writer.start()
+    yield
+    warmup.stop()
+    stop_materializing()
+    rating_writer.stop()
+    for executor in (concurrency.cpu_executor, concurrency.io_executor, concurrency.auth_executor):
+        executor.shutdown(wait=False, cancel_futures=True)
+    database.dispose_engine()
+
+
+app = FastAPI(title="Anime Recommendation API", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Records route latency, adds Server-Timing (API_SERVER_TIMING=1) and profiles
+    a sample of requests (API_PROFILE=1), keeping the profiles of slow ones."""
+    profiler = None
+    if telemetry.PROFILE_ENABLED and random.random() < telemetry.PROFILE_SAMPLE_RATE:
+        profiler = telemetry.SamplingProfiler().start()
+    start = time.perf_counter()
+    try:
+        with telemetry.request_spans() as spans:
+            response = await call_next(request)
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.stop()
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    telemetry.request_seconds.observe(f"{request.method} {path}", seconds)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = telemetry.server_timing(spans, seconds)
+    if profiler is not None and seconds * 1000 >= telemetry.PROFILE_SLOW_MS:
+        profiler.dump(telemetry.profile_path(path, seconds * 1000))
+    return response
+
+
+def _service_metrics():
+    cache = response_cache.stats()
+    pool = database.pool_status()
+    samples = [
+        ("anime_response_cache_hits_total", "counter", "Response cache hits.", {}, cache["hits"]),
+        ("anime_response_cache_misses_total", "counter", "Response cache misses.", {}, cache["misses"]),
+        ("anime_db_pool_checkouts_total", "counter", "Pooled connection checkouts.", {}, pool["checkouts"]),
+        ("anime_db_pool_timeouts_total", "counter", "Checkouts that timed out.", {}, pool["timeouts"]),
+        ("anime_db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection.", {},
+         pool["wait_seconds_total"]),
+    ]
+    ratings = rating_writer.status()
+    samples += [
+        ("anime_ratings_written_total", "counter", "Ratings inserted through the API.", {}, ratings["written"]),
+        ("anime_ratings_pending", "gauge", "Ratings waiting for the next flush.", {}, ratings["pending"]),
+        ("anime_ratings_flush_failures_total", "counter", "Rating flushes that failed.", {}, ratings["failures"]),
+    ]
+    if "checked_out" in pool:
+        samples.append(("anime_db_pool_checked_out", "gauge", "Connections in use.", {}, pool["checked_out"]))
+    for group, stats in concurrency.status().items():
+        labels = {"group": group}
+        samples += [
+            ("anime_api_running", "gauge", "Requests running per endpoint group.", labels, stats["running"]),
+            ("anime_api_waiting", "gauge", "Requests waiting per endpoint group.", labels, stats["waiting"]),
+            ("anime_api_rejected_total", "counter", "Requests rejected with 429.", labels, stats["rejected"]),
+        ]
+    return samples
+
+
+telemetry.register_collector(_service_metrics)
+
+
+def publish_model(version: str):
+    model = model_registry.refresh(version)
+    catalog.invalidate()
+    # Rebuild the catalog and its search index now rather than on the next search.
+    catalog.get().warm_search()
+    # Keys carry the version, so this only frees entries that can no longer be hit.
+    response_cache.clear()
+    # Precompute user recommendations; until they are attached users are scored online.
+    # A promoted older version may still have its own.
+    if model is None or model.recommendations is None:
+        materialize_in_background(version)
+
+
+def records(frame):
+    """DataFrame rows as dicts with NaN as None, JSON has no NaN."""
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+
+
+def cached_response(endpoint: str, subject, compute, **params):
+    """Serves `compute(model)` through the response cache, keyed by that model's version.
+
+    The model is resolved once, so a version published meanwhile is never cached under another's key.
+    """
+    model = model_registry.get()
+    if model is None:
+        return compute(None)
+    return response_cache.get_or_compute(ResponseCache.key(endpoint, subject, model.version, **params),
+                                         lambda: compute(model))
+
+
+def train_model(engine: str = None):
+    # Imported on first use: the trainer pulls in scipy/joblib, which serving never needs.
+    from Back.Trainer.trainer import train_model
+    return train_model(engine=engine)
+
+
+def update_model():
+    from Back.Trainer.incremental import update_model
+    return update_model()
+
+
+training_jobs = TrainingJobManager(
+    train_model,
+    progress=get_training_status,
+    on_publish=publish_model,
+    extra={"incremental": update_model, **{engine: functools.partial(train_model, engine) for engine in ENGINES}},
+)
+
+
+def apply_ratings(ratings, replaced, written_at: float):
+    """Runs after each rating flush: drops per-user caches, updates catalog stats and
+    starts an incremental update once enough ratings piled up (RATINGS_UPDATE_THRESHOLD)."""
+    user_ids = ratings["user_id"].unique()
+    invalidate_users(user_ids)
+    for user_id in user_ids:
+        response_cache.invalidate_user(user_id)
+    catalog.apply_ratings(ratings, replaced, written_at)
+
+    model = model_registry.get()
+    # Incremental updates fold new ratings into correlation versions only.
+    if RATINGS_UPDATE_THRESHOLD <= 0 or model is None or model.engine != "correlation":
+        return
+    watermark = model.meta.get("ratings_watermark")
+    if watermark is not None and anime_dao.get_ratings_watermark() - watermark >= RATINGS_UPDATE_THRESHOLD:
+        training_jobs.submit("incremental")
+
+
+rating_writer = RatingWriter(anime_dao, on_flush=apply_ratings)
 
 
 class RecommendationRequest(BaseModel):
@@ -27,10 +215,41 @@ class RecommendationRequest(BaseModel):
     rating_weight: float = 0.1
 
 
+class BatchRecommendationRequest(RecommendationRequest):
+    anime_ids: List[int] = []
+    user_ids: List[int] = []
+
+
+class RatingRequest(BaseModel):
+    user_id: int
+    anime_id: int
+    rating: int
+
+
+class RatingBatchRequest(BaseModel):
+    ratings: List[RatingRequest]
+
+
 @app.get("/")
 def root():
     return {"message": "Anime Recommendation API running"}
 
+
+@app.get("/health/live")
+def health_live():
+    """The process is up and serving HTTP."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def health_ready():
+    """200 once the schema, active model and catalog are loaded, 503 while warming up."""
+    status = warmup.status()
+    if not warmup.ready:
+        return JSONResponse(status, status_code=503)
+    model = model_registry.get()
+    return {**status, "model_version": model.version if model is not None else None}
+
 # Models
 class AuthRequest(BaseModel):
     username: str
@@ -38,60 +257,93 @@ class AuthRequest(BaseModel):
 
 
 @app.post("/auth/register")
-def register_user(req: AuthRequest):
+async def register_user(req: AuthRequest):
     try:
-        result = user_dao.create_user(req.username, req.password)
+        result = await auth_limit.run(user_dao.create_user, req.username, req.password)
         if result["status"] == "error":
             raise HTTPException(status_code=400, detail=result["message"])
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/auth/login")
-def login_user(req: AuthRequest):
+async def login_user(req: AuthRequest):
     try:
-        result = user_dao.authenticate_user(req.username, req.password)
+        result = await auth_limit.run(user_dao.authenticate_user, req.username, req.password)
         if result["status"] == "error":
             raise HTTPException(status_code=401, detail=result["message"])
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/anime/search")
-def search_anime(query: str = Query(..., description="Anime name or ID to search")):
-    """Search anime by name or ID from the database."""
+def search_anime(
+    response: Response,
+    query: str = Query(..., description="Anime name or ID to search"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Ranked anime search by name (prefix, substring, typo-tolerant) or ID.
+
+    The total number of matches is returned in the X-Total-Count header.
+    """
     try:
-        anime_df = anime_dao.load_anime()
+        total, results = catalog.get().search.search(query, limit=limit, offset=offset)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if query.isdigit():
-            result = anime_df[anime_df["anime_id"] == int(query)]
-        else:
-            result = anime_df[anime_df["name"].str.lower().str.contains(query.lower(), na=False)]
+    if total == 0:
+        raise HTTPException(status_code=404, detail="No anime found for this query")
+    response.headers["X-Total-Count"] = str(total)
+    return results
 
-        if result.empty:
-            raise HTTPException(status_code=404, detail="No anime found for this query")
 
-        return result.to_dict(orient="records")
+@app.post("/train", status_code=202)
+def train(engine: Optional[str] = Query(None, description="correlation or svd (default: MODEL_ENGINE)")):
+    """Starts a background training job, or returns the one already running."""
+    if engine is not None and engine not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    try:
+        job, created = training_jobs.submit(engine or "full")
+        return {"status": "accepted" if created else "already_running", "job_id": job.id}
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/train")
-def train():
+@app.post("/train/incremental", status_code=202)
+def train_incremental():
+    """Starts a background job folding ratings added since the active version into a new one."""
     try:
-        meta = train_model()
-        version = anime_dao.get_current_model_version()
-        return {"status": "success", "version": version, "meta": meta}
+        job, created = training_jobs.submit("incremental")
+        return {"status": "accepted" if created else "already_running", "job_id": job.id}
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/train/status")
+def train_status():
+    return get_training_status()
+
+
+@app.get("/train/{job_id}")
+def train_job_status(job_id: str):
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return training_jobs.status(job)
+
+
 @app.get("/model-version")
 def get_model_version():
     try:
@@ -101,37 +353,263 @@ def get_model_version():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/model/status")
+def get_model_status():
+    try:
+        return model_registry.status()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _version_operation(operation, *args):
+    """Runs a ModelVersions operation, mapping unknown versions to 404 and refused ones to 409."""
+    try:
+        return operation(*args)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Model version {e.args[0]} not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/model/versions")
+def list_model_versions():
+    """All versions, active first, with recorded size and checksum, pin state and bytes on disk."""
+    versions = _version_operation(model_versions.list)
+    return {"active": versions[0]["version"] if versions else None, "keep": model_versions.keep,
+            "disk_bytes": sum(v["disk_bytes"] for v in versions), "versions": versions}
+
+
+@app.post("/model/versions/{version}/promote")
+def promote_model_version(version: str, verify: bool = Query(True, description="check the artifact checksum first")):
+    """Makes an existing version the active one, without retraining, and swaps it in."""
+    _version_operation(model_versions.promote, version, verify)
+    publish_model(version)
+    return {"status": "success", "active": version}
+
+
+@app.post("/model/rollback")
+def rollback_model(verify: bool = Query(True, description="check the artifact checksum first")):
+    """Promotes the version that was active before the current one."""
+    version = _version_operation(model_versions.rollback, verify)
+    publish_model(version)
+    return {"status": "success", "active": version}
+
+
+@app.post("/model/versions/{version}/verify")
+def verify_model_version(version: str):
+    """Recomputes the artifact checksum of a version and compares it with the recorded one."""
+    return _version_operation(model_versions.verify, version)
+
+
+@app.put("/model/versions/{version}/pin")
+def pin_model_version(version: str):
+    """Protects a version from garbage collection."""
+    _version_operation(model_versions.pin, version, True)
+    return {"version": version, "pinned": True}
+
+
+@app.delete("/model/versions/{version}/pin")
+def unpin_model_version(version: str):
+    _version_operation(model_versions.pin, version, False)
+    return {"version": version, "pinned": False}
+
+
+@app.post("/model/gc")
+def collect_model_versions(keep: Optional[int] = Query(None, ge=1, description="default: MODEL_KEEP_VERSIONS"),
+                           dry_run: bool = False):
+    """Deletes all but the newest `keep` versions, pinned ones and the active one."""
+    # A running job may be reading the version it builds on, or be about to register its own.
+    if training_jobs.active is not None:
+        raise HTTPException(status_code=409, detail="A training job is running, try again when it finishes")
+    keep = keep or model_versions.keep
+    if keep < 1:
+        raise HTTPException(status_code=400, detail="MODEL_KEEP_VERSIONS is 0 (keep everything), pass keep")
+    return _version_operation(model_versions.collect, keep, dry_run)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition of stage/request timings and service counters."""
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/status")
+def get_cache_status():
+    return response_cache.stats()
+
+
+@app.get("/server/status")
+def get_server_status():
+    """Concurrency limits, in-flight and rejected (429) counts per endpoint group, and DB pool usage."""
+    return {**concurrency.status(), "db_pool": database.pool_status(), "ratings": rating_writer.status()}
+
+
+def _accept_ratings(ratings):
+    """Validates (user_id, anime_id, rating) rows against the catalog and queues them."""
+    user_ids, anime_ids, values = zip(*ratings)
+    invalid = invalid_ratings(user_ids, anime_ids, values, catalog.get().anime_ids)
+    if len(invalid):
+        raise HTTPException(status_code=400, detail={
+            "message": "Ratings need a positive user_id, a known anime_id and a rating of -1 or 1..10",
+            "invalid": invalid[:20].tolist(),
+        })
+    try:
+        pending = rating_writer.submit(ratings)
+    except BufferError as e:
+        raise HTTPException(status_code=429, detail=str(e),
+                            headers={"Retry-After": str(max(1, round(rating_writer.flush_seconds)))})
+    return {"status": "accepted", "accepted": len(ratings), "pending": pending}
+
+
+async def _submit_ratings(ratings):
+    if not ratings:
+        raise HTTPException(status_code=400, detail="No ratings given")
+    if len(ratings) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_IDS} ratings per request")
+    try:
+        return await db_limit.run(_accept_ratings, [(r.user_id, r.anime_id, r.rating) for r in ratings])
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/ratings", status_code=202)
+async def add_rating(req: RatingRequest):
+    """Queues one rating; it is written with the next flush (RATINGS_FLUSH_SECONDS)."""
+    return await _submit_ratings([req])
+
+
+@app.post("/ratings/batch", status_code=202)
+async def add_ratings(req: RatingBatchRequest):
+    """Queues many ratings at once. A batch with an invalid row is rejected whole (400),
+    with the positions of the offending rows in `detail.invalid`."""
+    return await _submit_ratings(req.ratings)
+
+
 @app.get("/user/{user_id}/watched")
-def get_watched(user_id: int):
+async def get_watched(user_id: int):
     try:
-        watched = get_user_watched(user_id)
+        watched = await db_limit.run(get_user_watched, user_id)
         if watched.empty:
             raise HTTPException(status_code=404, detail="User not found or no watched anime")
-        return watched.to_dict(orient="records")
+        return records(watched)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/recommend/user/{user_id}")
-def recommend_for_user(user_id: int):
-    try:
-        recs = get_user_recommendations(user_id)
+async def recommend_for_user(user_id: int):
+    def compute(model):
+        recs = get_user_recommendations(user_id, model=model)
         if recs is None or recs.empty:
             return {"status": "error", "message": "No recommendations found"}
-        return {"status": "success", "user_id": user_id, "recommendations": recs.to_dict(orient="records")}
+        with span("recommend.serialize"):
+            return {"status": "success", "user_id": user_id, "recommendations": records(recs)}
+
+    try:
+        return await recommend_limit.run(cached_response, "recommend_user", user_id, compute,
+                                           top_n=10, min_ratings=100, genre_weight=0.2, rating_weight=0.1)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/recommend/anime/{anime_id}")
-def recommend_for_anime(anime_id: int, top_n: int = 10):
-    try:
-        recs = get_similar_anime(anime_id, top_n=top_n)
+async def recommend_for_anime(anime_id: int, top_n: int = 10):
+    def compute(model):
+        recs = get_similar_anime(anime_id, top_n=top_n, model=model)
         if recs is None or recs.empty:
             return {"status": "error", "message": "No similar anime found"}
-        return {"status": "success", "anime_id": anime_id, "recommendations": recs.to_dict(orient="records")}
+        with span("recommend.serialize"):
+            return {"status": "success", "anime_id": anime_id, "recommendations": records(recs)}
+
+    try:
+        return await recommend_limit.run(cached_response, "recommend_anime", anime_id, compute,
+                                           top_n=top_n, min_ratings=100, genre_weight=0.2, rating_weight=0.1)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _ndjson_chunk(score_chunk, ids, key: str, empty_message: str) -> str:
+    lines = []
+    for subject, recs in score_chunk(ids):
+        with span("recommend.serialize"):
+            if recs is None or recs.empty:
+                result = {"status": "error", key: subject, "message": empty_message}
+            else:
+                result = {"status": "success", key: subject, "recommendations": records(recs)}
+            lines.append(json.dumps(result) + "\n")
+    return "".join(lines)
+
+
+async def _ndjson_stream(score_chunk, ids, key: str, empty_message: str):
+    """One NDJSON line per id, scored chunk by chunk through the recommendation bulkhead.
+
+    The status line is already sent, so a full bulkhead makes the stream wait and
+    retry rather than fail, and a failing chunk becomes error lines for its ids.
+    """
+    for start in range(0, len(ids), BATCH_CHUNK_SIZE):
+        chunk = ids[start:start + BATCH_CHUNK_SIZE]
+        while True:
+            try:
+                yield await recommend_limit.run(_ndjson_chunk, score_chunk, chunk, key, empty_message)
+                break
+            except HTTPException as e:
+                if e.status_code != 429:
+                    raise
+                await asyncio.sleep(float(e.headers.get("Retry-After", 1)))
+            except Exception as e:
+                traceback.print_exc()
+                yield "".join(json.dumps({"status": "error", key: subject, "message": str(e)}) + "\n"
+                              for subject in chunk)
+                break
+
+
+async def _batch_response(req: BatchRecommendationRequest, ids, key: str, score: str, empty_message: str):
+    if not ids:
+        raise HTTPException(status_code=400, detail=f"No {key}s given")
+    if len(ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_IDS} ids per request")
+    try:
+        batch = await recommend_limit.run(RecommendationBatch, req.min_ratings, req.top_n, req.genre_weight,
+                                          req.rating_weight)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    headers = {"X-Model-Version": batch.version} if batch.version is not None else None
+    return StreamingResponse(_ndjson_stream(getattr(batch, score), ids, key, empty_message),
+                             media_type="application/x-ndjson", headers=headers)
+
+
+@app.post("/recommend/anime/batch")
+async def recommend_for_anime_batch(req: BatchRecommendationRequest):
+    """Similar anime for each of `anime_ids`, streamed as one NDJSON line per id in request order.
+
+    All ids are scored against the same model version (X-Model-Version header).
+    """
+    return await _batch_response(req, req.anime_ids, "anime_id", "similar_anime", "No similar anime found")
+
+
+@app.post("/recommend/user/batch")
+async def recommend_for_user_batch(req: BatchRecommendationRequest):
+    """Recommendations for each of `user_ids`, streamed as one NDJSON line per id in request order.
+
+    All users are scored against the same model version (X-Model-Version header).
+    """
+    return await _batch_response(req, req.user_ids, "user_id", "user_recommendations",
+                                 "No recommendations found")
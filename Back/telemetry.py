@@ -0,0 +1,191 @@
+"""Timing spans, Prometheus metrics and an opt-in sampling profiler.
+
+Stages are timed with `span("name")` (context manager or decorator). Every span feeds
+the `anime_stage_seconds{stage=...}` histogram; inside a request started with
+`request_spans()` it is also collected for the Server-Timing header.
+"""
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by one label, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items())
+        for value, (counts, total, count) in series:
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram("anime_stage_seconds", "Time spent per instrumented stage.", "stage")
+request_seconds = Histogram("anime_http_request_seconds", "HTTP request latency by route.", "route")
+_collectors = []
+
+
+def register_collector(collect):
+    """Adds a callable returning [(name, type, help, {labels}, value), ...] to `/metrics`."""
+    _collectors.append(collect)
+
+
+def render_metrics() -> str:
+    lines = stage_seconds.render() + request_seconds.render()
+    described = set()
+    for collect in _collectors:
+        try:
+            samples = collect()
+        except Exception:
+            traceback.print_exc()
+            continue
+        for name, kind, help_text, labels, value in samples:
+            if name not in described:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                described.add(name)
+            label = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label}}} {value}" if label else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class span:
+    """Times a stage: `with span("recommend.score"):` or `@span("dao.load_anime")`."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._start
+        stage_seconds.observe(self.name, seconds)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.name, seconds))
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+@contextmanager
+def request_spans():
+    """Collects the spans recorded while handling one request (including executor threads
+    that run in a copy of this context)."""
+    spans = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def server_timing(spans, total_seconds: float) -> str:
+    """Server-Timing header value; repeated stages are summed."""
+    totals = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    parts = [f"{name.replace('.', '-')};dur={seconds * 1000:.2f}" for name, seconds in totals.items()]
+    parts.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at `interval` seconds while a request runs.
+
+    Stacks are counted in collapsed format ("frame;frame;frame count"), readable by
+    flamegraph.pl and speedscope. Other requests running at the same time show up too.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+
+
+PROFILE_ENABLED = os.getenv("API_PROFILE", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("API_PROFILE_SAMPLE_RATE", "0.1"))
+PROFILE_SLOW_MS = float(os.getenv("API_PROFILE_SLOW_MS", "500"))
+PROFILE_DIR = Path(os.getenv("API_PROFILE_DIR", "profiles"))
+
+
+def profile_path(route: str, milliseconds: float) -> Path:
+    slug = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+    return PROFILE_DIR / f"{datetime.now():%Y%m%d_%H%M%S_%f}_{slug}_{milliseconds:.0f}ms.folded"
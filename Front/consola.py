@@ -1,5 +1,6 @@
 # consola.py — now API-only, no CSV access
 import json
+import time
 import requests
 from pathlib import Path
 from datetime import datetime
@@ -97,14 +98,36 @@ def get_anime_recommendations(anime_id):
         return None
 
 
-def train_model():
+def train_model(poll_seconds=2):
+    """Lanza el entrenamiento en segundo plano y espera a que termine."""
     try:
         response = requests.post(f"{API_BASE_URL}/train")
-        if response.status_code == 200:
-            data = response.json()
-            return data["meta"], data["version"]
-        print(f"Error al entrenar el modelo: {response.status_code}")
-        return None, None
+        if response.status_code not in (200, 202):
+            print(f"Error al entrenar el modelo: {response.status_code}")
+            return None, None
+        data = response.json()
+        if data["status"] == "already_running":
+            print("Ya hay un entrenamiento en curso, esperando a que termine...")
+        job_id = data["job_id"]
+
+        while True:
+            time.sleep(poll_seconds)
+            response = requests.get(f"{API_BASE_URL}/train/{job_id}")
+            if response.status_code != 200:
+                print(f"Error al consultar el entrenamiento: {response.status_code}")
+                return None, None
+            job = response.json()
+            if job["state"] == "done":
+                return job["meta"], job["version"]
+            if job["state"] == "failed":
+                print(f"Error al entrenar el modelo: {job.get('error')}")
+                return None, None
+            progress = job.get("progress") or {}
+            if progress.get("blocks_total"):
+                print(f"  {progress['stage']}: {progress['blocks_done']}/{progress['blocks_total']} bloques "
+                      f"({job['elapsed_seconds']}s)")
+            else:
+                print(f"  {progress.get('stage', job['state'])}... ({job['elapsed_seconds']}s)")
     except requests.RequestException as e:
         print(f"Error de conexión: {e}")
         return None, None
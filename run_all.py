@@ -28,18 +28,18 @@ def load_environment():
     load_dotenv(".env")
 
 def start_api():
-    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "Back.api.main:app", "--reload"],
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "Back.api.main:app", "--reload"],
                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    time.sleep(5)
-    return proc
 
-def wait_for_api_ready(max_attempts=10):
-    url = os.getenv("API_URL", "http://127.0.0.1:8000")
-    for _ in range(max_attempts):
+def wait_for_api_ready(timeout=120, interval=0.5):
+    """Polls /health/ready until the model and catalog are warm."""
+    url = os.getenv("API_URL", "http://127.0.0.1:8000") + "/health/ready"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
         try:
             if requests.get(url, timeout=2).status_code == 200: return True
         except requests.RequestException: pass
-        time.sleep(2)
+        time.sleep(interval)
     return False
 
 def start_frontend():
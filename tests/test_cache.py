@@ -0,0 +1,66 @@
+import fnmatch
+
+from Back.api.cache import LocalBackend, RedisBackend, ResponseCache
+
+
+class FakeRedis:
+    """The subset of redis.Redis the backend uses, over a dict; records each TTL."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def get(self, key):
+        return self.data.get(key.encode())
+
+    def set(self, key, value, px=None):
+        self.data[key.encode()] = value
+        self.ttls[key.encode()] = px
+
+    def scan_iter(self, match):
+        return [key for key in self.data if fnmatch.fnmatchcase(key.decode(), match)]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+def test_redis_backend_caches_per_version_and_invalidates_users():
+    client = FakeRedis()
+    client.set("other-app:key", b"kept")
+    cache = ResponseCache(RedisBackend(client=client), ttl_seconds=5)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"recommendations": [1, 2, 3]}
+
+    key = ResponseCache.key("recommend_user", 7, "v1", top_n=10)
+    assert cache.get_or_compute(key, compute) == {"recommendations": [1, 2, 3]}
+    assert cache.get_or_compute(key, compute) == {"recommendations": [1, 2, 3]}
+    assert len(calls) == 1 and cache.stats()["hits"] == 1
+    assert client.ttls[b"anime-rec:" + key.encode()] == 5000
+
+    # Another worker sharing the server sees the entry.
+    assert ResponseCache(RedisBackend(client=client)).get_or_compute(key, compute) == {"recommendations": [1, 2, 3]}
+    assert len(calls) == 1
+
+    cache.get_or_compute(ResponseCache.key("recommend_user", 70, "v1", top_n=10), compute)
+    cache.get_or_compute(ResponseCache.key("recommend_anime", 7, "v1", top_n=10), compute)
+    cache.invalidate_user(7)
+    remaining = sorted(k.decode() for k in client.data)
+    assert remaining == ["anime-rec:recommend_anime:7:v1:top_n=10", "anime-rec:recommend_user:70:v1:top_n=10",
+                         "other-app:key"]
+
+    cache.clear()
+    assert list(client.data) == [b"other-app:key"]
+
+
+def test_local_backend_evicts_least_recently_used():
+    backend = LocalBackend(max_bytes=10)
+    backend.set("a", b"12345", 60)
+    backend.set("b", b"12345", 60)
+    backend.get("a")
+    backend.set("c", b"12345", 60)
+    assert backend.get("b") is None and backend.get("a") == b"12345"
+    assert backend.stats()["evictions"] == 1
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from Back.api.concurrency import Bulkhead
+
+
+def test_bulkhead_works_across_event_loops():
+    # Built outside any loop, like the module-level bulkheads.
+    bulkhead = Bulkhead("test", ThreadPoolExecutor(2), max_concurrent=2, max_waiting=2)
+    assert asyncio.run(bulkhead.run(sum, [1, 2])) == 3
+    assert asyncio.run(bulkhead.run(sum, [3, 4])) == 7
+    assert bulkhead.stats()["completed"] == 2
+
+
+def test_cancelled_request_keeps_its_slot_until_the_call_finishes():
+    release = threading.Event()
+    bulkhead = Bulkhead("test", ThreadPoolExecutor(2), max_concurrent=1, max_waiting=0, timeout=0.05)
+
+    async def scenario():
+        slow = asyncio.ensure_future(bulkhead.run(release.wait))
+        await asyncio.sleep(0.05)
+        slow.cancel()
+        await asyncio.sleep(0.05)
+        # The cancelled call is still running in the executor, so the limit still holds.
+        assert bulkhead.running == 1
+        with pytest.raises(HTTPException):
+            await bulkhead.run(sum, [1])
+
+        release.set()
+        for _ in range(100):
+            if bulkhead.running == 0:
+                break
+            await asyncio.sleep(0.01)
+        return await bulkhead.run(sum, [1, 2])
+
+    assert asyncio.run(scenario()) == 3
+    assert bulkhead.stats()["rejected"] == 1
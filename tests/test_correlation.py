@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from Back.Trainer.correlation import build_rating_matrix, pearson_corr
+
+
+def sample_ratings(seed=0, n_users=60, n_anime=25):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for user_id in range(1, n_users + 1):
+        for anime_id in rng.choice(np.arange(1, n_anime + 1), size=int(rng.integers(8, n_anime)), replace=False):
+            rows.append((user_id, int(anime_id), int(rng.integers(1, 11))))
+    ratings = pd.DataFrame(rows, columns=["user_id", "anime_id", "rating"])
+    # Duplicate (user, anime) rows, which pivot_table averages.
+    duplicates = ratings.sample(40, random_state=seed).assign(rating=lambda df: 11 - df["rating"])
+    # A title everyone rated the same (zero variance) and one with too few raters for min_periods.
+    constant = pd.DataFrame({"user_id": range(1, n_users + 1), "anime_id": 100, "rating": 7})
+    sparse = pd.DataFrame({"user_id": range(1, 6), "anime_id": 101, "rating": [1, 4, 2, 9, 5]})
+    return pd.concat([ratings, duplicates, constant, sparse], ignore_index=True)
+
+
+def expected_corr(ratings, min_periods=10):
+    pivot = ratings.pivot_table(index="user_id", columns="anime_id", values="rating")
+    return pivot.corr(min_periods=min_periods)
+
+
+def assert_same(actual, expected):
+    assert list(actual.index) == list(expected.index)
+    assert list(actual.columns) == list(expected.columns)
+    a, e = actual.to_numpy(), expected.to_numpy()
+    np.testing.assert_array_equal(np.isnan(a), np.isnan(e))
+    assert np.allclose(a[~np.isnan(a)], e[~np.isnan(e)])
+
+
+def test_pearson_corr_matches_pandas():
+    ratings = sample_ratings()
+    actual = pearson_corr(build_rating_matrix(ratings), min_periods=10, n_jobs=1)
+    expected = expected_corr(ratings)
+    assert_same(actual, expected)
+    assert expected[101].drop(101).isna().all()
+    assert expected[100].isna().all()
+
+
+def test_pearson_corr_parallel_matches_serial():
+    ratings = sample_ratings(seed=1)
+    matrix = build_rating_matrix(ratings)
+    serial = pearson_corr(matrix, min_periods=10, block_size=8, n_jobs=1)
+    parallel = pearson_corr(matrix, min_periods=10, block_size=8, n_jobs=2)
+    assert_same(parallel, serial)
+    assert_same(parallel, expected_corr(ratings))
@@ -0,0 +1,36 @@
+import threading
+
+from Back.Trainer.jobs import TrainingJobManager
+
+
+def wait_for(manager):
+    for _ in range(500):
+        if manager.active is None:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_job_reports_the_version_its_trainer_saved():
+    published = []
+    manager = TrainingJobManager(lambda: {"version": "v2", "num_anime": 3}, on_publish=published.append,
+                                 extra={"incremental": lambda: {"version": "v3", "delta_ratings": 5}})
+    job, created = manager.submit()
+    wait_for(manager)
+    assert created and job.state == "done" and job.version == "v2"
+
+    job, _ = manager.submit("incremental")
+    wait_for(manager)
+    assert job.version == "v3" and published == ["v2", "v3"]
+    assert manager.status(job)["meta"]["delta_ratings"] == 5
+
+
+def test_failed_job_keeps_no_version():
+    def fail():
+        raise ValueError("No model to update, run a full training first")
+
+    manager = TrainingJobManager(fail)
+    job, _ = manager.submit()
+    wait_for(manager)
+    assert job.state == "failed" and job.version is None and "full training" in job.error
+    assert manager.active is None
@@ -0,0 +1,35 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from Back.Recommendator.materialize import materialize
+
+
+class StubBatch:
+    """Recommends anime 1..3 to every user, optionally setting `stop` after the first chunk."""
+
+    def __init__(self, stop=None):
+        self.stop = stop
+        self.chunks = 0
+
+    def user_recommendations(self, user_ids):
+        self.chunks += 1
+        if self.stop is not None:
+            self.stop.set()
+        recs = pd.DataFrame({"anime_id": [1, 2, 3], "final_score": [0.9, 0.5, 0.1]})
+        return [(user_id, recs) for user_id in user_ids]
+
+
+def test_materialize_builds_csr_by_user():
+    user_ids, offsets, anime_ids, scores = materialize(StubBatch(), [5, 3, 3, 9], chunk_size=2, workers=2)
+    np.testing.assert_array_equal(user_ids, [3, 5, 9])
+    np.testing.assert_array_equal(offsets, [0, 3, 6, 9])
+    np.testing.assert_array_equal(anime_ids[offsets[1]:offsets[2]], [1, 2, 3])
+
+
+def test_materialize_stops_between_chunks():
+    stop = threading.Event()
+    batch = StubBatch(stop)
+    assert materialize(batch, range(1, 101), chunk_size=10, workers=1, stop=stop) is None
+    assert batch.chunks == 1
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from Back.Data import migrate, schema
+from Back.Data.animeDAO import AnimeDAO
+from Back.Data.catalog import CatalogSnapshot
+from Back.Data.rating_writer import RatingWriter
+
+
+@pytest.fixture
+def dao(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ratings.db'}")
+    schema.ensure_schema(engine)
+    pd.DataFrame({"anime_id": [1, 2, 3], "name": ["A", "B", "C"], "genre": ["Action", "Drama", None],
+                  "type": "TV", "episodes": "12", "rating": [7.0, 8.0, 6.5], "members": 100}).to_sql(
+        "animes", engine, if_exists="append", index=False)
+    return AnimeDAO(engine)
+
+
+def table(dao, name):
+    return pd.read_sql(f"SELECT * FROM {name} ORDER BY id", dao.engine)
+
+
+def test_upsert_replaces_rerated_titles_with_a_newer_id(dao):
+    written, replaced = dao.upsert_ratings([(1, 1, 5), (1, 2, 7), (2, 1, 3)])
+    assert len(written) == 3 and replaced.empty
+    watermark = dao.get_ratings_watermark()
+
+    # Re-rate the newest row too: its replacement must not reuse its id.
+    written, replaced = dao.upsert_ratings([(2, 1, 9), (1, 3, 4), (1, 3, 6)])
+    assert sorted(map(tuple, written.to_numpy().tolist())) == [(1, 3, 6), (2, 1, 9)]
+    assert replaced.to_numpy().tolist() == [[2, 1, 3]]
+
+    ratings = table(dao, "ratings")
+    assert len(ratings) == 4
+    assert not ratings.duplicated(["user_id", "anime_id"]).any()
+    rerated = ratings[(ratings["user_id"] == 2) & (ratings["anime_id"] == 1)].iloc[0]
+    assert rerated["rating"] == 9 and rerated["id"] > watermark
+
+    archived = table(dao, "replaced_ratings")
+    assert archived[["id", "user_id", "anime_id", "rating"]].to_numpy().tolist() == [[3, 2, 1, 3]]
+    assert archived["replaced_by"].iloc[0] == rerated["id"]
+
+
+def test_reads_as_of_a_watermark_see_replaced_ratings(dao):
+    dao.upsert_ratings([(1, 1, 5), (1, 2, 7)])
+    watermark = dao.get_ratings_watermark()
+    dao.upsert_ratings([(1, 1, 10), (1, 3, 2)])
+
+    before = dao.load_ratings(max_id=watermark).sort_values("anime_id")
+    assert before[["anime_id", "rating"]].to_numpy().tolist() == [[1, 5], [2, 7]]
+    after = dao.load_ratings_for_users([1], dao.get_ratings_watermark()).sort_values("anime_id")
+    assert after[["anime_id", "rating"]].to_numpy().tolist() == [[1, 10], [2, 7], [3, 2]]
+
+    assert dao.prune_replaced_ratings(dao.get_ratings_watermark()) == 1
+    assert table(dao, "replaced_ratings").empty
+
+
+def test_catalog_stats_follow_replaced_ratings(dao):
+    dao.upsert_ratings([(1, 1, 5), (2, 1, 7), (1, 2, 4)])
+    snapshot = CatalogSnapshot(dao.load_anime(), dao.load_rating_stats())
+    written, replaced = dao.upsert_ratings([(1, 1, 9), (1, 2, 8), (3, 3, 6)])
+
+    updated = snapshot.with_ratings(written, replaced)
+    stats = dao.load_rating_stats()
+    pos = updated.positions(stats["anime_id"])
+    np.testing.assert_array_equal(updated.num_ratings[pos], stats["num_ratings"])
+    np.testing.assert_allclose(updated.avg_rating[pos], stats["avg_rating"])
+
+
+def test_writer_flushes_deduplicated_rows(dao):
+    flushed = []
+    writer = RatingWriter(dao, on_flush=lambda ratings, replaced, _: flushed.append((ratings, replaced)),
+                          flush_seconds=0)
+    writer.submit([(1, 1, 5)])
+    writer.submit([(1, 1, 6), (1, 2, 3), (1, 2, 4)])
+
+    assert writer.status()["written"] == 3
+    ratings, replaced = flushed[-1]
+    assert sorted(map(tuple, ratings.to_numpy().tolist())) == [(1, 1, 6), (1, 2, 4)]
+    assert replaced.to_numpy().tolist() == [[1, 1, 5]]
+    assert table(dao, "ratings")[["anime_id", "rating"]].to_numpy().tolist() == [[1, 6], [2, 4]]
+
+
+def test_writer_keeps_rows_of_a_failed_flush(dao):
+    class FlakyDAO:
+        fail = True
+
+        def upsert_ratings(self, rows):
+            if self.fail:
+                raise ConnectionError("database down")
+            return dao.upsert_ratings(rows)
+
+    flaky = FlakyDAO()
+    writer = RatingWriter(flaky, flush_seconds=60, max_pending=3)
+    writer.submit([(1, 1, 5), (1, 2, 6)])
+    assert writer.flush() == 0
+    assert writer.status()["pending"] == 2 and writer.failures == 1
+    with pytest.raises(BufferError):
+        writer.submit([(2, 1, 1), (2, 2, 2)])
+
+    flaky.fail = False
+    assert writer.flush() == 2
+    assert writer.status()["pending"] == 0 and writer.last_error is None
+    assert len(table(dao, "ratings")) == 2
+
+
+def test_migrations_fix_legacy_rating_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    pd.DataFrame({"user_id": [1, 1, 2, 1], "anime_id": [1, 2, 1, 1], "rating": [5, 6, 7, 9]}).to_sql(
+        "ratings", engine, index=False)
+    with pytest.warns(RuntimeWarning):
+        schema.ensure_schema(engine)
+    with pytest.raises(RuntimeError):
+        AnimeDAO(engine).upsert_ratings([(3, 1, 4)])
+
+    assert migrate.add_ratings_id(engine) == {"ratings_id": "rebuilt", "rows": 4}
+    assert schema.ratings_ids_monotonic(engine)
+    assert migrate.dedupe_ratings(engine) == {"archived_duplicates": 1, "unique_index": True}
+    assert schema.UNIQUE_RATINGS_INDEX in {i["name"] for i in inspect(engine).get_indexes("ratings")}
+
+    dao = AnimeDAO(engine)
+    # The old rowids became the ids, so earlier watermarks still see the table as it was.
+    assert table(dao, "ratings")[["id", "rating"]].to_numpy().tolist() == [[2, 6], [3, 7], [4, 9]]
+    assert table(dao, "replaced_ratings")[["id", "replaced_by"]].to_numpy().tolist() == [[1, 4]]
+    assert len(dao.load_ratings(max_id=3)) == 3
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM ratings")).scalar() == 3
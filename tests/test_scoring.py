@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Back.Data.catalog import CatalogSnapshot
+from Back.Data.genres import split_genres
+from Back.Recommendator.scoring import rank_for_user, rank_similar
+from Back.Recommendator.similarity import DenseSimilarity
+
+GENRES = ["Action", "Comedy", "Drama", "Romance", "Sci-Fi", "Fantasy"]
+
+
+def sample_model(seed=0, n_anime=60):
+    rng = np.random.default_rng(seed)
+    anime_ids = rng.choice(np.arange(1, 500), n_anime, replace=False)
+    genre = [", ".join(sorted(rng.choice(GENRES, int(rng.integers(1, 4)), replace=False))) if i % 9 else None
+             for i in range(n_anime)]
+    anime = pd.DataFrame({
+        "anime_id": anime_ids,
+        "name": [f"Anime {a}" for a in anime_ids],
+        "genre": genre,
+        "type": "TV",
+        "episodes": "12",
+        "rating": np.where(np.arange(n_anime) % 11 == 0, np.nan, np.round(rng.uniform(5, 9.5, n_anime), 2)),
+        "members": 1000,
+    })
+    stats = pd.DataFrame({"anime_id": anime_ids, "num_ratings": rng.integers(20, 200, n_anime),
+                          "avg_rating": rng.uniform(4, 9, n_anime)})
+
+    corr = rng.uniform(-1, 1, (n_anime, n_anime))
+    corr = (corr + corr.T) / 2
+    corr[rng.random((n_anime, n_anime)) < 0.1] = np.nan
+    corr = np.fmin(corr, corr.T)
+    np.fill_diagonal(corr, 1.0)
+    return CatalogSnapshot(anime, stats), pd.DataFrame(corr, index=anime_ids, columns=anime_ids)
+
+
+def reference_similar(snapshot, corr, anime_id, min_ratings=100, top_n=20, genre_weight=0.2, rating_weight=0.1):
+    """The per-row pandas scorer rank_similar replaced."""
+    similar = corr[anime_id].dropna().sort_values(ascending=False)
+    pos = snapshot.positions(similar.index.values)
+    result = pd.DataFrame({"anime_id": similar.index, "similarity": similar.values,
+                           "num_ratings": snapshot.take(snapshot.num_ratings, pos)})
+    keep = result["num_ratings"] >= min_ratings
+    if not keep.any():
+        keep = result["num_ratings"] >= 10
+    filtered = result[keep].copy()
+    pos = pos[keep.to_numpy()]
+    filtered["rating"] = snapshot.take(snapshot.base_rating, pos)
+
+    def genre_similarity(s1, s2):
+        if not s1 or not s2:
+            return 0
+        return len(s1 & s2) / len(s1 | s2)
+
+    base_pos = snapshot.position(anime_id)
+    base_genres = split_genres(snapshot.genre[base_pos])
+    filtered["genre_sim"] = [genre_similarity(base_genres, split_genres(g))
+                             for g in snapshot.take(snapshot.genre, pos, None)]
+    base_rating = snapshot.base_rating[base_pos]
+    if np.isnan(base_rating):
+        filtered["rating_diff"] = 0.0
+    else:
+        filtered["rating_diff"] = (1 - (filtered["rating"] - base_rating).abs() / 10).fillna(0)
+    filtered["final_score"] = (
+        (1 - genre_weight - rating_weight) * filtered["similarity"]
+        + genre_weight * filtered["genre_sim"]
+        + rating_weight * filtered["rating_diff"]
+    )
+    return filtered.sort_values("final_score", ascending=False).head(top_n)
+
+
+def reference_user(snapshot, corr, watched_ids, top_n=10, min_ratings=100):
+    """The per-title loop rank_for_user replaced: average each watched title's top_n scores."""
+    combined = pd.concat([reference_similar(snapshot, corr, a, min_ratings, top_n) for a in watched_ids])
+    combined = combined.groupby("anime_id").agg({"final_score": "mean"}).reset_index()
+    combined = combined[~combined["anime_id"].isin(watched_ids)]
+    return combined.sort_values("final_score", ascending=False).head(top_n)
+
+
+@pytest.mark.parametrize("min_ratings", [100, 500])
+def test_rank_similar_matches_reference(min_ratings):
+    snapshot, corr = sample_model()
+    source = DenseSimilarity(corr.index.to_numpy(), corr.to_numpy())
+    for anime_id in corr.index[:20]:
+        actual = rank_similar(snapshot, source, anime_id, min_ratings=min_ratings)
+        expected = reference_similar(snapshot, corr, anime_id, min_ratings=min_ratings)
+        np.testing.assert_array_equal(actual["anime_id"], expected["anime_id"])
+        np.testing.assert_allclose(actual["final_score"], expected["final_score"])
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_rank_for_user_matches_reference(seed):
+    snapshot, corr = sample_model(seed)
+    source = DenseSimilarity(corr.index.to_numpy(), corr.to_numpy())
+    rng = np.random.default_rng(seed)
+    for _ in range(5):
+        watched = rng.choice(corr.index.to_numpy(), int(rng.integers(1, 15)), replace=False)
+        actual = rank_for_user(snapshot, source, watched, top_n=10)
+        expected = reference_user(snapshot, corr, watched, top_n=10)
+        np.testing.assert_array_equal(actual["anime_id"], expected["anime_id"])
+        np.testing.assert_allclose(actual["final_score"], expected["final_score"])